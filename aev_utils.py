@@ -1,6 +1,12 @@
 import math
+from functools import lru_cache
+
 import numpy as np
 import pandas as pd
+from numpy.polynomial import Polynomial
+
+import instrumentation
+from power_kernel import ACCELERATION_RESISTANCE, PowerKernel
 
 
 def convert_mph_ms(mph):
@@ -28,9 +34,26 @@ def get_parameters():
     return VEHICLE_PARAMETERS.copy()
 
 
-def process_segment(segment_length, segment_elev_change, parameters):
+# simulation time step in seconds
+TIMESTEP = 0.1
+
+
+# columns of the step by step trace from process_segment
+TRACE_COLUMNS = [
+    "time_s",
+    "speed_ms",
+    "incremental_distance",
+    "cumulative_distance",
+    "acceleration_mss",
+    "power_W",
+    "incremental_energy_J",
+    "cumulative_energy_J",
+]
+
+
+def process_segment(segment_length, segment_elev_change, parameters, record_trace=True):
     # set up initial variables for segment processing
-    dt = 0.1
+    dt = TIMESTEP
     position = 0
     segment_time = 0
     velocity = 0
@@ -42,14 +65,21 @@ def process_segment(segment_length, segment_elev_change, parameters):
 
     # calculate the incline of the segment
     incline = calculate_incline(segment_length, segment_elev_change)
+    kernel = PowerKernel(parameters)
+    braking_table = stopping_table(parameters)
+    formula_calls = braking_table.formula_calls
 
-    # store step by step results
-    rows = []
+    # store step by step results in preallocated column arrays,
+    # skipped entirely if the caller only wants the totals
+    if record_trace:
+        trace = allocate_trace(estimate_max_steps(segment_length, parameters, dt))
+    step = 0
+    fractional_steps = 0
 
     while position < segment_length:
         # decide whether the vehicle is accelerating or decelerating
         acceleration = decide_acceleration(
-            dt, position, velocity, acceleration, segment_length, parameters
+            dt, position, velocity, acceleration, segment_length, parameters, braking_table
         )
 
         # update velocity and position
@@ -68,63 +98,362 @@ def process_segment(segment_length, segment_elev_change, parameters):
                 fractional_dt = dt
 
             # update power using the fractional_dt left to reach end of segment
-            power = power_required(acceleration, velocity, incline, parameters)
-            if power > 0:
-                incremental_energy = power * fractional_dt
-                segment_energy += incremental_energy
+            power = kernel.power(acceleration, velocity, incline)
+            incremental_energy = kernel.positive_energy(power, fractional_dt)
+            segment_energy += incremental_energy
 
             # update time using fractional dt
             segment_time += fractional_dt
             position = segment_length
-
-            # update the rows list with the incremental information
-            rows.append(
-                {
-                    "time_s": segment_time,
-                    "speed_ms": velocity,
-                    "incremental_distance": remaining_distance,
-                    "cumulative_distance": position,
-                    "acceleration_mss": acceleration,
-                    "power_W": power,
-                    "incremental_energy_J": incremental_energy,
-                    "cumulative_energy_J": segment_energy,
-                }
-            )
-
-            break
+            incremental_distance = remaining_distance
+            fractional_steps += 1
         else:
             # if theres no overshoot then can update as usual
             position = next_position
             segment_time += dt
-            power = power_required(acceleration, velocity, incline, parameters)
-            if power > 0:
-                incremental_energy = power * dt
-            else:
-                incremental_energy = 0
+            power = kernel.power(acceleration, velocity, incline)
+            incremental_energy = kernel.positive_energy(power, dt)
             segment_energy += incremental_energy
+            incremental_distance = velocity * dt
+
+        if record_trace:
+            # the estimate should always be enough but grow just in case
+            if step == len(trace["time_s"]):
+                trace = grow_trace(trace)
 
-        rows.append(
-            {
-                "time_s": segment_time,
-                "speed_ms": velocity,
-                "incremental_distance": velocity * dt,
-                "cumulative_distance": position,
-                "acceleration_mss": acceleration,
-                "power_W": power,
-                "incremental_energy_J": incremental_energy,
-                "cumulative_energy_J": segment_energy,
-            }
+            trace["time_s"][step] = segment_time
+            trace["speed_ms"][step] = velocity
+            trace["incremental_distance"][step] = incremental_distance
+            trace["cumulative_distance"][step] = position
+            trace["acceleration_mss"][step] = acceleration
+            trace["power_W"][step] = power
+            trace["incremental_energy_J"][step] = incremental_energy
+            trace["cumulative_energy_J"][step] = segment_energy
+        step += 1
+
+    if instrumentation.enabled:
+        instrumentation.record_segment(
+            steps=step, rows_allocated=len(trace["time_s"]) if record_trace else 0,
+            stopping_distance_calls=braking_table.formula_calls - formula_calls,
+            fractional_steps=fractional_steps,
+            integrator="fixed", segment_length=segment_length,
         )
 
-    segment_df = pd.DataFrame(rows)
+    if not record_trace:
+        return None, segment_energy, segment_time
+
+    # trim the columns down to the steps actually taken
+    segment_df = pd.DataFrame({column: values[:step] for column, values in trace.items()})
 
     return segment_df, segment_energy, segment_time
 
 
+def process_segment_adaptive(
+    segment_length, segment_elev_change, parameters,
+    max_step=10.0, max_speed_change=1.0, record_trace=True
+):
+    # process_segment with large steps wherever nothing is changing. whenever
+    # the acceleration is already at its target (cruising, or holding max
+    # acceleration or braking) the following fixed steps are worked out
+    # together with array operations, and taken as one macro step for as long
+    # as every one of them would have kept the same acceleration and stayed
+    # short of the end. the jerk ramps, the steps around where braking starts
+    # and the final fractional step are taken one fixed step at a time exactly
+    # as in process_segment, and so is anything a macro step could only cover
+    # fewer than MIN_MACRO_STEPS of. the sums inside a macro step run in the
+    # same order as the fixed steps, so the totals are the same as
+    # process_segment's.
+    # max_step (s) and max_speed_change (m/s) only limit how much of the
+    # segment one trace row covers, so they set how closely resample_trace can
+    # rebuild the fixed step trace. with the defaults a resampled trace stays
+    # within about 0.01% of process_segment's energy. max_speed_change=None
+    # lets a row run through a whole acceleration or braking phase
+    dt = TIMESTEP
+    position = 0
+    segment_time = 0
+    velocity = 0
+    segment_energy = 0
+    acceleration = 0
+
+    max_velocity = parameters["max_velocity"]
+    incline = calculate_incline(segment_length, segment_elev_change)
+    kernel = PowerKernel(parameters)
+    braking_table = stopping_table(parameters)
+    formula_calls = braking_table.formula_calls
+
+    # fixed steps that one macro step may cover, while accelerating or
+    # braking it also stops once the speed has moved by max_speed_change
+    max_substeps = max(int(round(max_step / dt)), 1)
+    accel_substeps = max_substeps
+    if max_speed_change is not None:
+        accel_substeps = min(
+            max_substeps, int(max_speed_change / (parameters["max_accel"] * dt)) + 2
+        )
+
+    rows = {column: [] for column in TRACE_COLUMNS}
+    # fixed steps covered and stopping distances worked out, for instrumentation
+    steps = 0
+    stopping_distance_calls = 0
+    fractional_steps = 0
+
+    while position < segment_length:
+        new_acceleration = decide_acceleration(
+            dt, position, velocity, acceleration, segment_length, parameters, braking_table
+        )
+
+        # how many fixed steps a macro step could cover from here, so the
+        # arrays are only built that long and only when it is worth it. a
+        # steady acceleration is always cruising or the maximum either way
+        substeps = 0
+        if new_acceleration == acceleration:
+            if acceleration == 0:
+                substeps = max_substeps
+            else:
+                # the acceleration or braking phase ends at max velocity or
+                # standing still, whichever way the speed is heading
+                speed_left = max_velocity - velocity if acceleration > 0 else velocity
+                substeps = min(accel_substeps, int(speed_left / (abs(acceleration) * dt)) + 2)
+            if substeps >= MIN_MACRO_STEPS and acceleration >= 0 and velocity > 0:
+                # the speed never drops while not braking, so each step
+                # covers at least this one's distance. one spare step
+                # allows for rounding
+                substeps = min(
+                    substeps, int((segment_length - position) / (velocity * dt)) + 2
+                )
+
+        if substeps >= MIN_MACRO_STEPS:
+            # velocities and positions after each of the next fixed steps,
+            # summed one after the other like the fixed steps do
+            velocities = np.minimum(np.maximum(np.cumsum(np.concatenate([
+                [velocity], np.full(substeps, acceleration * dt)
+            ]))[1:], 0), max_velocity)
+            positions = np.cumsum(np.concatenate([[position], velocities * dt]))[1:]
+
+            # a fixed step is covered while it stays short of the end and
+            # decide_acceleration before it would keep the same acceleration
+            distances_remaining = segment_length - positions[:-1]
+            if acceleration < 0:
+                # braking at max decel carries on while still inside the
+                # stopping distance, which has no jerk phase at max decel
+                stopping_distances = np.where(
+                    velocities[:-1] > 0, velocities[:-1]**2 / (2 * parameters["max_accel"]), 0
+                )
+                kept = distances_remaining <= stopping_distances
+                stopping_distance_calls += len(kept)
+            else:
+                # accelerating or cruising carries on while clear of braking
+                # and on the same side of max velocity. steps the envelope
+                # cannot clear end the macro step and are decided one by one
+                kept = (
+                    braking_table.clear_of_braking(distances_remaining, velocities[:-1])
+                    & ((velocities[:-1] < max_velocity) == (acceleration > 0))
+                )
+            steady = (positions < segment_length) & np.concatenate([[True], kept])
+            if max_speed_change is not None:
+                steady &= np.abs(velocities - velocity) <= max_speed_change
+            covered = int(np.argmin(steady)) if not steady.all() else substeps
+
+            if covered > 1:
+                velocities = velocities[:covered]
+                powers = kernel.power(acceleration, velocities, incline)
+                energies = kernel.positive_energy(powers, dt)
+
+                end_energy = np.cumsum(np.concatenate([[segment_energy], energies]))[-1]
+                end_time = np.cumsum(np.concatenate([[segment_time], np.full(covered, dt)]))[-1]
+                end_position = positions[covered - 1]
+
+                if record_trace:
+                    rows["time_s"].append(end_time)
+                    rows["speed_ms"].append(velocities[-1])
+                    rows["incremental_distance"].append(end_position - position)
+                    rows["cumulative_distance"].append(end_position)
+                    rows["acceleration_mss"].append(acceleration)
+                    rows["power_W"].append(powers[-1])
+                    rows["incremental_energy_J"].append(end_energy - segment_energy)
+                    rows["cumulative_energy_J"].append(end_energy)
+
+                velocity = velocities[-1]
+                position = end_position
+                segment_time = end_time
+                segment_energy = end_energy
+                steps += covered
+                continue
+
+        # a single fixed step, the same as process_segment
+        acceleration = new_acceleration
+        velocity = max(0, min(velocity + acceleration * dt, max_velocity))
+        next_position = position + velocity * dt
+
+        if next_position >= segment_length:
+            remaining_distance = segment_length - position
+            if velocity > 0:
+                step_dt = remaining_distance / velocity
+            else:
+                step_dt = dt
+            position = segment_length
+            incremental_distance = remaining_distance
+            fractional_steps += 1
+        else:
+            step_dt = dt
+            position = next_position
+            incremental_distance = velocity * dt
+
+        power = kernel.power(acceleration, velocity, incline)
+        incremental_energy = kernel.positive_energy(power, step_dt)
+        segment_energy += incremental_energy
+        segment_time += step_dt
+        steps += 1
+
+        if record_trace:
+            rows["time_s"].append(segment_time)
+            rows["speed_ms"].append(velocity)
+            rows["incremental_distance"].append(incremental_distance)
+            rows["cumulative_distance"].append(position)
+            rows["acceleration_mss"].append(acceleration)
+            rows["power_W"].append(power)
+            rows["incremental_energy_J"].append(incremental_energy)
+            rows["cumulative_energy_J"].append(segment_energy)
+
+    segment_energy = float(segment_energy)
+    segment_time = float(segment_time)
+
+    if instrumentation.enabled:
+        instrumentation.record_segment(
+            steps=steps, rows_allocated=len(rows["time_s"]),
+            stopping_distance_calls=(
+                stopping_distance_calls + braking_table.formula_calls - formula_calls
+            ),
+            fractional_steps=fractional_steps, integrator="adaptive", segment_length=segment_length,
+        )
+
+    if not record_trace:
+        return None, segment_energy, segment_time
+
+    segment_df = pd.DataFrame({column: np.array(values, dtype=float) for column, values in rows.items()})
+
+    return segment_df, segment_energy, segment_time
+
+
+# fewest fixed steps worth working out together, below this building the
+# arrays costs more than stepping them one at a time
+MIN_MACRO_STEPS = 8
+
+
+def resample_trace(segment_df, dt=TIMESTEP):
+    # put a segment trace with uneven steps, such as one from
+    # process_segment_adaptive, back onto a uniform grid of dt seconds ending
+    # with the segment's final time. speed and the cumulative columns are
+    # interpolated from the start of the segment, acceleration holds the value
+    # of the step each time falls in and the incremental columns are the
+    # differences between grid points. inside a row that held one acceleration
+    # over several steps the distance follows the fixed steps exactly, the
+    # energy only as closely as interpolation allows
+    times = segment_df["time_s"].to_numpy()
+    if len(times) == 0:
+        return segment_df.copy()
+
+    end_time = times[-1]
+    grid = np.arange(1, int(np.floor(end_time / dt + 1e-9)) + 1) * dt
+    if len(grid) == 0 or grid[-1] < end_time - 1e-9:
+        grid = np.append(grid, end_time)
+
+    # the segment always starts stationary at the origin
+    known_times = np.concatenate([[0], times])
+
+    def interpolate(column):
+        return np.interp(grid, known_times, np.concatenate([[0], segment_df[column].to_numpy()]))
+
+    cumulative_distance = interpolate("cumulative_distance")
+    cumulative_energy = interpolate("cumulative_energy_J")
+    step_rows = np.minimum(np.searchsorted(times, grid - 1e-9), len(times) - 1)
+    accelerations = segment_df["acceleration_mss"].to_numpy()[step_rows]
+
+    # whole fixed steps into the row before each grid time. the speed only
+    # clips at a row's last step, so before it each step adds a * dt to the
+    # speed and the distance is the sum of the speeds
+    row_start_times = known_times[step_rows]
+    row_start_speeds = np.concatenate([[0], segment_df["speed_ms"].to_numpy()])[step_rows]
+    row_start_distances = np.concatenate(
+        [[0], segment_df["cumulative_distance"].to_numpy()]
+    )[step_rows]
+    steps_in = np.round((grid - row_start_times) / dt)
+    inside = (grid < times[step_rows] - 1e-9) & (accelerations != 0)
+    cumulative_distance = np.where(
+        inside,
+        row_start_distances + dt * (
+            steps_in * row_start_speeds + accelerations * dt * steps_in * (steps_in + 1) / 2
+        ),
+        cumulative_distance,
+    )
+
+    # the power of each step in such a row is taken to change by the same
+    # amount every step, ending at the row's power and adding up to the row's
+    # energy. rows that used none do not spread any
+    row_steps = np.round(np.diff(known_times) / dt)[step_rows]
+    row_powers = segment_df["power_W"].to_numpy()[step_rows]
+    row_energies = segment_df["incremental_energy_J"].to_numpy()[step_rows]
+    row_start_energies = np.concatenate(
+        [[0], segment_df["cumulative_energy_J"].to_numpy()]
+    )[step_rows]
+    spread = inside & (row_powers > 0) & (row_energies > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        power_step = (row_steps * row_powers - row_energies / dt) * 2 / (row_steps * (row_steps - 1))
+        first_power = row_powers - (row_steps - 1) * power_step
+        cumulative_energy = np.where(
+            spread,
+            row_start_energies + dt * (
+                steps_in * first_power + power_step * steps_in * (steps_in - 1) / 2
+            ),
+            cumulative_energy,
+        )
+
+    return pd.DataFrame({
+        "time_s": grid,
+        "speed_ms": interpolate("speed_ms"),
+        "incremental_distance": np.diff(cumulative_distance, prepend=0),
+        "cumulative_distance": cumulative_distance,
+        "acceleration_mss": accelerations,
+        "power_W": interpolate("power_W"),
+        "incremental_energy_J": np.diff(cumulative_energy, prepend=0),
+        "cumulative_energy_J": cumulative_energy,
+    })
+
+
+def estimate_max_steps(segment_length, parameters, dt):
+    # upper bound on the steps process_segment can take for a segment.
+    # covers getting up to speed and back down again plus the cruise, with the
+    # slower speed of short segments that never reach max velocity
+    max_velocity = parameters["max_velocity"]
+    max_accel = parameters["max_accel"]
+    max_jerk = parameters["max_jerk"]
+
+    ramp_time = 2 * (max_velocity / max_accel + 2 * max_accel / max_jerk)
+    cruise_time = segment_length / max_velocity
+    short_segment_time = 4 * math.sqrt(segment_length / max_accel)
+
+    return int((ramp_time + cruise_time + short_segment_time) / dt) + 10
+
+
+def allocate_trace(steps):
+    # one empty array per trace column
+    return {column: np.empty(steps) for column in TRACE_COLUMNS}
+
+
+def grow_trace(trace):
+    # double the size of every trace column, keeping the values so far
+    grown = allocate_trace(2 * len(trace["time_s"]))
+    for column, values in trace.items():
+        grown[column][: len(values)] = values
+    return grown
+
+
 def decide_acceleration(
-    dt, position, velocity, current_acceleration, segment_length, parameters
+    dt, position, velocity, current_acceleration, segment_length, parameters,
+    braking_table=None
 ):
-    # determing target acceleration considering jerk limits and stopping distance
+    # determing target acceleration considering jerk limits and stopping distance.
+    # braking_table is an optional StoppingDistanceTable for these parameters,
+    # it gives the same answer while mostly skipping the stopping distance
 
     # get the required variables out of the parameters dict
     max_velocity = parameters["max_velocity"]
@@ -134,12 +463,16 @@ def decide_acceleration(
     # calculate remaining distance given current position
     distance_remaining = segment_length - position
 
-    # calculate the current stopping distance allowing for the impact of jerk
-    current_stopping_distance = calculate_stopping_distance(
-        velocity, current_acceleration, max_accel, max_jerk
-    )
+    if braking_table is not None:
+        must_brake = braking_table.brakes(distance_remaining, velocity, current_acceleration)
+    else:
+        # calculate the current stopping distance allowing for the impact of jerk
+        current_stopping_distance = calculate_stopping_distance(
+            velocity, current_acceleration, max_accel, max_jerk
+        )
+        must_brake = distance_remaining <= current_stopping_distance
 
-    if distance_remaining <= current_stopping_distance:
+    if must_brake:
         # need to start decelerating to stop in time
         target_acceleration = -max_accel
     elif velocity < max_velocity:
@@ -202,19 +535,828 @@ def calculate_stopping_distance(velocity, current_accel, max_accel, max_jerk):
 
 
 def power_required(acceleration, velocity, incline, parameters):
-    drag = parameters["drag"]
-    rolling_resistance = parameters["rolling_resistance"]
-    mass = parameters["mass"]
-    frontal_area = parameters["frontal_area"]
-    # power equation from Julian's document
+    # power equation from Julian's document, see power_kernel.py. loops should
+    # build a PowerKernel once instead of calling this every step
     # unsure about negative incline here
-    power = 0.6125 * frontal_area * drag * np.power(
-        velocity, 3
-    ) + 9.81 * mass * velocity * (rolling_resistance + incline + 0.107 * acceleration)
-    return power
+    return PowerKernel(parameters).power(acceleration, velocity, incline)
 
 
 def calculate_incline(run, rise):
     if run == 0:
         return 0  # avoid zero division error
     return math.atan(rise / run)
+
+
+def process_segments_batch(segment_lengths, segment_elev_changes, parameters):
+    # step every segment forward together instead of one python loop per
+    # segment. each step follows exactly the same rules as process_segment,
+    # segments drop out of the working arrays as soon as they reach the end
+    dt = TIMESTEP
+
+    lengths = np.asarray(segment_lengths, dtype=float)
+    elev_changes = np.asarray(segment_elev_changes, dtype=float)
+
+    # results for every segment, zero length segments just stay at zero
+    segment_energies = np.zeros(len(lengths))
+    segment_times = np.zeros(len(lengths))
+
+    # get the variables out of the parameters dict
+    max_velocity = parameters["max_velocity"]
+
+    # calculate the incline of every segment
+    inclines = calculate_incline_array(lengths, elev_changes)
+    kernel = PowerKernel(parameters)
+
+    # working state for the segments that are still moving
+    active = np.flatnonzero(lengths > 0)
+    length = lengths[active]
+    incline = inclines[active]
+    position = np.zeros(len(active))
+    velocity = np.zeros(len(active))
+    acceleration = np.zeros(len(active))
+    energy = np.zeros(len(active))
+    time = np.zeros(len(active))
+    # vehicle steps and fractional last steps taken, for instrumentation
+    steps = 0
+    fractional_steps = 0
+
+    while len(active) > 0:
+        steps += len(active)
+        # decide whether each vehicle is accelerating or decelerating
+        acceleration = decide_acceleration_array(
+            dt, position, velocity, acceleration, length, parameters
+        )
+
+        # update velocity and cap it between zero and max velocity
+        velocity = np.maximum(0, np.minimum(velocity + acceleration * dt, max_velocity))
+
+        # predict next position to find the segments that would overshoot
+        next_position = position + velocity * dt
+        finishing = next_position >= length
+
+        # finishing segments only use the fractional dt to reach the end
+        step_dt = np.full(len(active), dt)
+        moving_finish = finishing & (velocity > 0)
+        step_dt[moving_finish] = (
+            length[moving_finish] - position[moving_finish]
+        ) / velocity[moving_finish]
+
+        # only positive power counts towards the energy used
+        power = kernel.power(acceleration, velocity, incline)
+        energy += kernel.positive_energy(power, step_dt)
+        time += step_dt
+        position = next_position
+
+        if finishing.any():
+            fractional_steps += np.count_nonzero(moving_finish)
+            # store the totals for the finished segments and drop them
+            segment_energies[active[finishing]] = energy[finishing]
+            segment_times[active[finishing]] = time[finishing]
+
+            still_moving = ~finishing
+            active = active[still_moving]
+            length = length[still_moving]
+            incline = incline[still_moving]
+            position = position[still_moving]
+            velocity = velocity[still_moving]
+            acceleration = acceleration[still_moving]
+            energy = energy[still_moving]
+            time = time[still_moving]
+
+    if instrumentation.enabled:
+        # decide_acceleration_array works out every vehicle's stopping distance each step
+        instrumentation.record_batch(
+            segments=len(segment_energies), steps=steps,
+            stopping_distance_calls=steps, fractional_steps=int(fractional_steps),
+        )
+
+    return segment_energies, segment_times
+
+
+def decide_acceleration_array(
+    dt, position, velocity, current_acceleration, segment_length, parameters
+):
+    # array version of decide_acceleration for the batched simulator
+
+    # get the required variables out of the parameters dict
+    max_velocity = parameters["max_velocity"]
+    max_accel = parameters["max_accel"]
+    max_jerk = parameters["max_jerk"]
+
+    distance_remaining = segment_length - position
+
+    current_stopping_distance = calculate_stopping_distance_array(
+        velocity, current_acceleration, max_accel, max_jerk
+    )
+
+    # brake if inside the stopping distance, otherwise accelerate or cruise
+    target_acceleration = np.where(
+        distance_remaining <= current_stopping_distance,
+        -max_accel,
+        np.where(velocity < max_velocity, max_accel, 0),
+    )
+
+    # limit the change in acceleration by the jerk
+    max_accel_change = max_jerk * dt
+    accel_difference = target_acceleration - current_acceleration
+
+    return np.where(
+        np.abs(accel_difference) <= max_accel_change,
+        target_acceleration,
+        np.where(
+            accel_difference > 0,
+            current_acceleration + max_accel_change,
+            current_acceleration - max_accel_change,
+        ),
+    )
+
+
+def calculate_stopping_distance_array(velocity, current_accel, max_accel, max_jerk):
+    # array version of calculate_stopping_distance, same maths for each element
+    velocity = np.asarray(velocity, dtype=float)
+    total_stopping_distance = moving_stopping_distance_array(
+        velocity, current_accel, max_accel, max_jerk
+    )
+    return np.where(velocity <= 0, 0, total_stopping_distance)
+
+
+def moving_stopping_distance_array(velocity, current_accel, max_accel, max_jerk):
+    # the stopping distance formula without the stationary case, so it carries
+    # on smoothly down to zero velocity
+    velocity = np.asarray(velocity, dtype=float)
+    current_accel = np.asarray(current_accel, dtype=float)
+
+    target_decel = -max_accel
+
+    # no jerk phase if already at or beyond max decel
+    jerk_phase_time = np.where(
+        current_accel > target_decel, (current_accel - target_decel) / max_jerk, 0
+    )
+    jerk_phase_distance = (
+        (velocity * jerk_phase_time)
+        + (0.5 * current_accel * jerk_phase_time**2)
+        - ((1 / 6) * max_jerk * jerk_phase_time**3)
+    )
+    velocity_after_jerk_phase = (
+        velocity
+        + (current_accel * jerk_phase_time)
+        - (0.5 * max_jerk * jerk_phase_time**2)
+    )
+
+    constant_decel_distance = np.where(
+        velocity_after_jerk_phase > 0,
+        -(velocity_after_jerk_phase**2) / (2 * target_decel),
+        0,
+    )
+
+    return jerk_phase_distance + constant_decel_distance
+
+
+def calculate_incline_array(run, rise):
+    # array version of calculate_incline, zero run gives zero incline
+    run = np.asarray(run, dtype=float)
+    rise = np.asarray(rise, dtype=float)
+    safe_run = np.where(run == 0, 1, run)
+    return np.where(run == 0, 0, np.arctan(rise / safe_run))
+
+
+# points along each side of a stopping distance table
+STOPPING_TABLE_POINTS = 257
+# allowance on top of the interpolation error for floating point rounding (m)
+STOPPING_TABLE_ROUNDING = 1e-9
+
+# stopping distance tables only depend on the braking limits, so each is only
+# built once for those limits. a sweep over them keeps this many at most
+STOPPING_TABLE_CACHE_SIZE = 64
+
+
+def stopping_table(parameters):
+    # look up the stopping distance table for these limits, building it if needed
+    return limits_stopping_table(
+        parameters["max_velocity"], parameters["max_accel"], parameters["max_jerk"]
+    )
+
+
+@lru_cache(maxsize=STOPPING_TABLE_CACHE_SIZE)
+def limits_stopping_table(max_velocity, max_accel, max_jerk):
+    return StoppingDistanceTable(
+        {"max_velocity": max_velocity, "max_accel": max_accel, "max_jerk": max_jerk}
+    )
+
+
+class StoppingDistanceTable:
+    # calculate_stopping_distance worked out once on a grid covering every
+    # velocity (0 to max velocity) and acceleration (max braking to max
+    # acceleration) the simulators can reach.
+    #
+    # lookup() interpolates the grid bilinearly and is always within
+    # error_bound of the full formula. for a fixed acceleration the distance
+    # is at most quadratic in velocity with a second derivative no more than
+    # 1/max_accel, and as a function of the acceleration its second
+    # derivative is no more than 4*max_accel/max_jerk**2 +
+    # max_velocity/(max_accel*max_jerk), so linear interpolation across a
+    # cell is out by at most step**2/8 times these in each direction.
+    #
+    # the same bounds give an envelope, the most the stopping distance can be
+    # for any acceleration up to each velocity. brakes() only works out the
+    # full formula when the distance left is inside the envelope, which is
+    # just the last stretch before braking, and otherwise already knows the
+    # answer. its answer is always exactly the same as the full formula's.
+    # with numpy arrays working out the formula is as quick as checking the
+    # envelope, so the batched simulators keep using the formula directly
+
+    def __init__(self, parameters, points=STOPPING_TABLE_POINTS):
+        self.max_velocity = parameters["max_velocity"]
+        self.max_accel = parameters["max_accel"]
+        self.max_jerk = parameters["max_jerk"]
+
+        self.velocities = np.linspace(0, self.max_velocity, points)
+        self.accelerations = np.linspace(-self.max_accel, self.max_accel, points)
+        velocity_step = self.velocities[1] - self.velocities[0]
+        accel_step = self.accelerations[1] - self.accelerations[0]
+        self.velocity_scale = 1 / velocity_step
+        self.accel_scale = 1 / accel_step
+
+        # rows are velocities, columns accelerations. the zero velocity row
+        # carries the formula on smoothly so the first cells interpolate
+        # properly, lookup() handles a stationary vehicle separately
+        self.distances = moving_stopping_distance_array(
+            self.velocities[:, None], self.accelerations[None, :],
+            self.max_accel, self.max_jerk
+        )
+
+        velocity_curvature = 1 / self.max_accel
+        accel_curvature = (
+            4 * self.max_accel / self.max_jerk**2
+            + self.max_velocity / (self.max_accel * self.max_jerk)
+        )
+        velocity_error = velocity_step**2 / 8 * velocity_curvature
+        accel_error = accel_step**2 / 8 * accel_curvature
+        self.error_bound = velocity_error + accel_error + STOPPING_TABLE_ROUNDING
+
+        # the distance only grows with velocity, so the largest value in the
+        # row at the next grid velocity up covers everything below it, plus
+        # what the curve can rise between two grid accelerations
+        row_maximum = np.maximum(
+            self.distances.max(axis=1) + accel_error + STOPPING_TABLE_ROUNDING, 0
+        )
+        self.envelope = np.append(row_maximum, row_maximum[-1])
+        # plain list for the scalar simulators, indexing it is quicker
+        self.envelope_list = self.envelope.tolist()
+        self.max_distance = self.envelope_list[-1]
+        # how many times brakes() needed the full formula, for instrumentation
+        self.formula_calls = 0
+
+    def in_range(self, velocity, current_accel):
+        return (
+            (velocity >= 0) & (velocity <= self.max_velocity)
+            & (current_accel >= -self.max_accel) & (current_accel <= self.max_accel)
+        )
+
+    def lookup(self, velocity, current_accel):
+        # interpolated stopping distance for scalars or arrays, within
+        # error_bound of calculate_stopping_distance. anything off the grid
+        # gets the full formula
+        velocity, current_accel = np.broadcast_arrays(
+            np.asarray(velocity, dtype=float), np.asarray(current_accel, dtype=float)
+        )
+        last = len(self.velocities) - 2
+        x = np.clip(velocity * self.velocity_scale, 0, last + 1)
+        y = np.clip((current_accel + self.max_accel) * self.accel_scale, 0, last + 1)
+        i = np.minimum(x.astype(np.intp), last)
+        j = np.minimum(y.astype(np.intp), last)
+        fx = x - i
+        fy = y - j
+
+        table = self.distances
+        distances = (
+            (table[i, j] * (1 - fx) + table[i + 1, j] * fx) * (1 - fy)
+            + (table[i, j + 1] * (1 - fx) + table[i + 1, j + 1] * fx) * fy
+        )
+
+        outside = ~self.in_range(velocity, current_accel)
+        if outside.any():
+            distances[outside] = moving_stopping_distance_array(
+                velocity[outside], current_accel[outside], self.max_accel, self.max_jerk
+            )
+        distances = np.where(velocity <= 0, 0, distances)
+        return distances[()] if distances.ndim == 0 else distances
+
+    def clear_of_braking(self, distance_remaining, velocity):
+        # true where the envelope already rules braking out, for arrays of
+        # velocities from 0 to max velocity at any acceleration in range.
+        # false only means the formula would be needed
+        indices = (np.asarray(velocity) * self.velocity_scale).astype(np.intp) + 1
+        return distance_remaining > self.envelope[indices]
+
+    def brakes(self, distance_remaining, velocity, current_accel):
+        # distance_remaining <= calculate_stopping_distance(...) for one vehicle
+        if 0 <= velocity <= self.max_velocity and -self.max_accel <= current_accel <= self.max_accel:
+            if distance_remaining > self.envelope_list[int(velocity * self.velocity_scale) + 1]:
+                return False
+        self.formula_calls += 1
+        return distance_remaining <= calculate_stopping_distance(
+            velocity, current_accel, self.max_accel, self.max_jerk
+        )
+
+
+# the drive phases before braking are the same for every segment with the
+# same kinematic limits, so they are only built once for those limits. a
+# sweep over them keeps this many at most
+DRIVE_PHASES_CACHE_SIZE = 1024
+# most segments solve_segments_profile works on at once
+PROFILE_CHUNK_SEGMENTS = 8192
+
+
+def solve_segments_profile(segment_lengths, segment_elev_changes, parameters):
+    # closed form totals for many segments at once, solve_segment_profile
+    # worked out for every segment together with array operations. the
+    # segments go through the drive phases together, each phase only taking
+    # the segments that have not started braking yet. the results agree with
+    # solve_segment_profile to rounding, and are within a percent or two of
+    # the 0.1 s stepping simulators. long routes are solved
+    # PROFILE_CHUNK_SEGMENTS at a time to keep the working arrays small
+    segment_lengths = np.asarray(segment_lengths, dtype=float)
+    segment_elev_changes = np.asarray(segment_elev_changes, dtype=float)
+    if len(segment_lengths) > PROFILE_CHUNK_SEGMENTS:
+        chunks = [
+            solve_segments_profile(
+                segment_lengths[start:start + PROFILE_CHUNK_SEGMENTS],
+                segment_elev_changes[start:start + PROFILE_CHUNK_SEGMENTS],
+                parameters,
+            )
+            for start in range(0, len(segment_lengths), PROFILE_CHUNK_SEGMENTS)
+        ]
+        return (
+            np.concatenate([energies for energies, _ in chunks]),
+            np.concatenate([times for _, times in chunks]),
+        )
+
+    inclines = calculate_incline_array(segment_lengths, segment_elev_changes)
+    max_accel = parameters["max_accel"]
+    max_jerk = parameters["max_jerk"]
+
+    segment_energies = np.zeros(len(segment_lengths))
+    segment_times = np.zeros(len(segment_lengths))
+    brake_accels = np.zeros(len(segment_lengths))
+    brake_velocities = np.zeros(len(segment_lengths))
+
+    # drive forward through the phases until each segment's braking point
+    driving = np.flatnonzero(segment_lengths > 0)
+    for phase in drive_profile(parameters):
+        if len(driving) == 0:
+            break
+        braking_times = find_braking_times(phase, segment_lengths[driving], max_accel)
+        braking = ~np.isnan(braking_times)
+        durations = np.where(braking, braking_times, phase["duration"])
+
+        segment_times[driving] += durations
+        segment_energies[driving] += phase_energy_array(
+            durations,
+            phase["power"][None, :] + inclines[driving, None] * phase["incline_power"][None, :],
+        )
+
+        brakes = driving[braking]
+        brake_accels[brakes] = polyval(braking_times[braking], phase["accel"])
+        brake_velocities[brakes] = polyval(braking_times[braking], phase["velocity"])
+        driving = driving[~braking]
+
+    # every segment has reached its braking point, the last phase never ends
+    braking = np.flatnonzero(segment_lengths > 0)
+    brake_accel = brake_accels[braking]
+    brake_velocity = brake_velocities[braking]
+    incline = inclines[braking, None]
+
+    # jerk phase from the current acceleration down to max decel
+    jerk_phase_time = (brake_accel + max_accel) / max_jerk
+    ones = np.ones(len(braking))
+    accel = np.column_stack([brake_accel, -max_jerk * ones])
+    velocity = np.column_stack([brake_velocity, brake_accel, -0.5 * max_jerk * ones])
+
+    # the vehicle may already stop during the jerk phase on very short
+    # segments, the velocity falls through zero at the quadratic's later root
+    stop_time = np.where(
+        brake_velocity > 0,
+        (brake_accel + np.sqrt(np.maximum(brake_accel**2 + 2 * max_jerk * brake_velocity, 0)))
+        / max_jerk,
+        0,
+    )
+    stops = stop_time <= jerk_phase_time
+    jerk_phase_time = np.where(stops, stop_time, jerk_phase_time)
+
+    power, incline_power = power_polynomial_array(accel, velocity, parameters)
+    segment_times[braking] += jerk_phase_time
+    segment_energies[braking] += phase_energy_array(
+        jerk_phase_time, power + incline * incline_power
+    )
+
+    # constant decel down to a stop
+    velocity_after_jerk_phase = polyval(jerk_phase_time, velocity.T)
+    decelerating = ~stops & (velocity_after_jerk_phase > 0)
+    velocity_after_jerk_phase = velocity_after_jerk_phase[decelerating]
+    constant_decel_time = velocity_after_jerk_phase / max_accel
+    ones = np.ones(len(velocity_after_jerk_phase))
+    accel = np.column_stack([-max_accel * ones, 0 * ones])
+    velocity = np.column_stack([velocity_after_jerk_phase, -max_accel * ones])
+
+    power, incline_power = power_polynomial_array(accel, velocity, parameters)
+    decelerated = braking[decelerating]
+    segment_times[decelerated] += constant_decel_time
+    segment_energies[decelerated] += phase_energy_array(
+        constant_decel_time, power + incline[decelerating] * incline_power
+    )
+
+    return segment_energies, segment_times
+
+
+def solve_segment_profile(segment_length, segment_elev_change, parameters):
+    # closed form version of process_segment for when only the segment totals
+    # are needed. the motion is built from phases where the acceleration is a
+    # polynomial in time (jerk ramp, constant accel, cruise, braking), so the
+    # switch to braking, the phase durations and the energy can all be worked
+    # out directly instead of stepping through the segment.
+    # polynomials are plain coefficient arrays, lowest order first
+    if segment_length <= 0:
+        return 0, 0
+
+    # get the variables out of the parameters dict
+    max_accel = parameters["max_accel"]
+    max_jerk = parameters["max_jerk"]
+
+    incline = calculate_incline(segment_length, segment_elev_change)
+
+    segment_time = 0
+    segment_energy = 0
+
+    # drive forward through the phases until the braking point is reached
+    for phase in drive_profile(parameters):
+        braking_time = find_braking_time(phase, segment_length)
+        if braking_time is None:
+            duration = phase["duration"]
+        else:
+            duration = braking_time
+
+        segment_time += duration
+        segment_energy += phase_energy(
+            duration, phase["power"] + incline * phase["incline_power"]
+        )
+
+        if braking_time is not None:
+            break
+
+    # start braking from the state at the braking point
+    brake_accel = polyval(duration, phase["accel"])
+    brake_velocity = polyval(duration, phase["velocity"])
+
+    # jerk phase from the current acceleration down to max decel
+    jerk_phase_time = (brake_accel + max_accel) / max_jerk
+    accel = np.array([brake_accel, -max_jerk])
+    velocity = np.array([brake_velocity, brake_accel, -0.5 * max_jerk])
+
+    # the vehicle may already stop during the jerk phase on very short segments
+    stop_time = first_root(-velocity, 0, jerk_phase_time)
+    if stop_time is not None:
+        jerk_phase_time = stop_time
+
+    power, incline_power = power_polynomial(accel, velocity, parameters)
+    segment_time += jerk_phase_time
+    segment_energy += phase_energy(jerk_phase_time, power + incline * incline_power)
+
+    velocity_after_jerk_phase = polyval(jerk_phase_time, velocity)
+    if stop_time is None and velocity_after_jerk_phase > 0:
+        # constant decel down to a stop
+        constant_decel_time = velocity_after_jerk_phase / max_accel
+        accel = np.array([-max_accel, 0])
+        velocity = np.array([velocity_after_jerk_phase, -max_accel])
+
+        power, incline_power = power_polynomial(accel, velocity, parameters)
+        segment_time += constant_decel_time
+        segment_energy += phase_energy(
+            constant_decel_time, power + incline * incline_power
+        )
+
+    return segment_energy, segment_time
+
+
+def drive_profile(parameters):
+    # the drive phases for these limits with the power polynomials for this
+    # parameter set, only the power changes with the rest of the parameters
+    profile = []
+    for phase in drive_phases(
+        parameters["max_velocity"], parameters["max_accel"], parameters["max_jerk"]
+    ):
+        power, incline_power = power_polynomial(phase["accel"], phase["velocity"], parameters)
+        profile.append(dict(phase, power=power, incline_power=incline_power))
+    return profile
+
+
+@lru_cache(maxsize=DRIVE_PHASES_CACHE_SIZE)
+def drive_phases(max_velocity, max_accel, max_jerk):
+    # the phases before braking, these only depend on the vehicle limits.
+    # each phase stores its duration and the acceleration, velocity and
+    # position as polynomials of the time since the start of the phase.
+    # the arrays are shared so they are made read only
+    phases = []
+
+    # jerk phase from rest up to max accel, cut short if max velocity comes first
+    jerk_phase_time = min(max_accel / max_jerk, math.sqrt(2 * max_velocity / max_jerk))
+    accel = Polynomial([0, max_jerk])
+    velocity = accel.integ()
+    position = velocity.integ()
+    phases.append((jerk_phase_time, accel, velocity, position))
+
+    current_accel = accel(jerk_phase_time)
+    current_velocity = velocity(jerk_phase_time)
+    current_position = position(jerk_phase_time)
+
+    # constant accel up to max velocity
+    constant_accel_time = (max_velocity - current_velocity) / max_accel
+    if constant_accel_time > 0:
+        accel = Polynomial([max_accel])
+        velocity = Polynomial([current_velocity, max_accel])
+        position = velocity.integ(k=current_position)
+        phases.append((constant_accel_time, accel, velocity, position))
+
+        current_accel = max_accel
+        current_position = position(constant_accel_time)
+
+    # the velocity is capped at max velocity while the acceleration ramps
+    # back down to zero, same as the stepping simulator
+    ramp_down_time = current_accel / max_jerk
+    accel = Polynomial([current_accel, -max_jerk])
+    velocity = Polynomial([max_velocity])
+    position = velocity.integ(k=current_position)
+    phases.append((ramp_down_time, accel, velocity, position))
+
+    current_position = position(ramp_down_time)
+
+    # cruise at max velocity until it is time to brake
+    accel = Polynomial([0])
+    velocity = Polynomial([max_velocity])
+    position = velocity.integ(k=current_position)
+    phases.append((math.inf, accel, velocity, position))
+
+    profile = []
+    for duration, accel, velocity, position in phases:
+        # stopping distance from calculate_stopping_distance written as a
+        # polynomial in time, with and without the constant decel part
+        jerk_phase_time = (accel + max_accel) / max_jerk
+        jerk_phase_distance = (
+            (velocity * jerk_phase_time)
+            + (0.5 * accel * jerk_phase_time**2)
+            - ((1 / 6) * max_jerk * jerk_phase_time**3)
+        )
+        velocity_after_jerk_phase = (
+            velocity + (accel * jerk_phase_time) - (0.5 * max_jerk * jerk_phase_time**2)
+        )
+        constant_decel_distance = velocity_after_jerk_phase**2 / (2 * max_accel)
+
+        phase = {
+            "duration": duration,
+            "accel": accel.coef,
+            "velocity": velocity.coef,
+            "velocity_after_jerk_phase": velocity_after_jerk_phase.coef,
+            "stopping_position": (
+                position + jerk_phase_distance + constant_decel_distance
+            ).coef,
+            "jerk_stopping_position": (position + jerk_phase_distance).coef,
+        }
+        for name, coef in phase.items():
+            if name != "duration":
+                coef.setflags(write=False)
+        profile.append(phase)
+
+    return tuple(profile)
+
+
+def find_braking_time(phase, segment_length):
+    # time within the phase where the remaining distance meets the stopping
+    # distance, or None if the phase finishes first. the constant decel part
+    # of the stopping distance only applies while the velocity after the jerk
+    # phase is positive, so both forms are checked for a consistent root
+    if math.isfinite(phase["duration"]):
+        end_time = phase["duration"]
+        # the stopping position only moves forward while driving, so there is
+        # no braking point in this phase if it is still short at the end
+        if (
+            polyval(end_time, phase["stopping_position"]) < segment_length
+            and polyval(end_time, phase["jerk_stopping_position"]) < segment_length
+        ):
+            return None
+    else:
+        end_time = None
+
+    candidates = []
+    for key, with_constant_decel in (
+        ("stopping_position", True),
+        ("jerk_stopping_position", False),
+    ):
+        distance_short = phase[key].copy()
+        distance_short[0] -= segment_length
+        root = first_root(distance_short, 0, end_time)
+        if root is None:
+            continue
+        if (polyval(root, phase["velocity_after_jerk_phase"]) > 0) == with_constant_decel:
+            candidates.append(root)
+
+    if not candidates:
+        return None
+    return min(candidates)
+
+
+def find_braking_times(phase, segment_lengths, max_accel, iterations=64):
+    # find_braking_time for many segments, NaN where the phase finishes
+    # first. the stopping position only moves forward while driving, so the
+    # first time it reaches the end of the segment is found by bisection.
+    # the constant decel part of the stopping distance only counts while the
+    # velocity after the jerk phase is positive, as in find_braking_time
+    def stopping_position(time):
+        return np.where(
+            polyval(time, phase["velocity_after_jerk_phase"]) > 0,
+            polyval(time, phase["stopping_position"]),
+            polyval(time, phase["jerk_stopping_position"]),
+        )
+
+    if not math.isfinite(phase["duration"]):
+        # cruising, the stopping distance stays the same so the stopping
+        # position is a straight line in time
+        key = "stopping_position"
+        if polyval(0, phase["velocity_after_jerk_phase"]) <= 0:
+            key = "jerk_stopping_position"
+        start, speed = pad_polynomial(phase[key], 2)[:2]
+        return np.maximum((segment_lengths - start) / speed, 0)
+
+    end_time = phase["duration"]
+    braking_times = np.full(len(segment_lengths), np.nan)
+    brakes = stopping_position(end_time) >= segment_lengths
+    already = stopping_position(0) >= segment_lengths
+    braking_times[already] = 0
+
+    searching = brakes & ~already
+    lengths = segment_lengths[searching]
+    low = np.zeros(len(lengths))
+    high = np.full(len(lengths), end_time)
+    for _ in range(iterations):
+        middle = 0.5 * (low + high)
+        reached = stopping_position(middle) >= lengths
+        high = np.where(reached, middle, high)
+        low = np.where(reached, low, middle)
+    braking_times[searching] = high
+    return braking_times
+
+
+def phase_energy_array(durations, powers):
+    # phase_energy for many phases at once. powers holds one polynomial per
+    # row. each row is split at the real roots of its power inside the
+    # phase, found together as the eigenvalues of the rows' companion
+    # matrices, and only the intervals with positive power are counted
+    durations = np.asarray(durations, dtype=float)
+    energies = np.zeros(len(durations))
+    if len(durations) == 0:
+        return energies
+
+    # leading zero coefficients change the degree, rows are grouped by it
+    nonzero = powers != 0
+    degrees = np.where(
+        nonzero.any(axis=1), powers.shape[1] - 1 - np.argmax(nonzero[:, ::-1], axis=1), 0
+    )
+
+    for degree in np.unique(degrees):
+        rows = np.flatnonzero((degrees == degree) & (durations > 0))
+        if len(rows) == 0:
+            continue
+        power = powers[rows, :degree + 1]
+        duration = durations[rows, None]
+
+        if degree > 0:
+            companion = np.zeros((len(rows), degree, degree))
+            companion[:, 0, :] = -power[:, degree - 1::-1] / power[:, degree, None]
+            companion[:, np.arange(1, degree), np.arange(degree - 1)] = 1
+            roots = np.linalg.eigvals(companion)
+            inner = (
+                (np.abs(roots.imag) <= 1e-9) & (roots.real > 0) & (roots.real < duration)
+            )
+            # roots outside the phase become zero length intervals at its end
+            cuts = np.sort(np.where(inner, roots.real, duration), axis=1)
+        else:
+            cuts = np.empty((len(rows), 0))
+        boundaries = np.concatenate([np.zeros((len(rows), 1)), cuts, duration], axis=1)
+
+        # integral of each row's power polynomial
+        energy_poly = np.concatenate(
+            [np.zeros((len(rows), 1)), power / np.arange(1, degree + 2)], axis=1
+        )
+        starts = boundaries[:, :-1]
+        ends = boundaries[:, 1:]
+        # coefficients first so polyval steps through them, one column per row
+        power = power.T[:, :, None]
+        energy_poly = energy_poly.T[:, :, None]
+        positive = polyval((starts + ends) / 2, power) > 0
+        interval_energy = polyval(ends, energy_poly) - polyval(starts, energy_poly)
+        energies[rows] = np.sum(np.where(positive, interval_energy, 0), axis=1)
+
+    return energies
+
+
+def first_root(poly, start, end=None):
+    # smallest real root of a polynomial between start and end, or None.
+    # the start counts as a root if the polynomial is already at or above zero
+    if polyval(start, poly) >= 0:
+        return start
+
+    roots = poly_roots(poly)
+    scale = max(1, np.max(np.abs(roots))) if len(roots) else 1
+    real_roots = roots.real[np.abs(roots.imag) <= 1e-9 * scale]
+    real_roots = real_roots[real_roots >= start]
+    if end is not None:
+        real_roots = real_roots[real_roots <= end]
+    if len(real_roots) == 0:
+        return None
+    return float(np.min(real_roots))
+
+
+def phase_energy(duration, power):
+    # integrate the positive part of the power over a phase exactly. power is
+    # a polynomial in time inside the phase so it is split at its roots and
+    # only the intervals with positive power are counted
+    if duration <= 0:
+        return 0
+
+    roots = poly_roots(power)
+    real_roots = roots.real[np.abs(roots.imag) <= 1e-9]
+    inner_roots = real_roots[(real_roots > 0) & (real_roots < duration)]
+    boundaries = np.concatenate([[0], np.sort(inner_roots), [duration]])
+
+    # integral of the power polynomial
+    energy_poly = np.concatenate([[0], power / np.arange(1, len(power) + 1)])
+
+    energy = 0
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        if polyval((start + end) / 2, power) > 0:
+            energy += polyval(end, energy_poly) - polyval(start, energy_poly)
+    return energy
+
+
+def power_polynomial(accel, velocity, parameters):
+    # same equation as the PowerKernel but for acceleration and velocity given
+    # as polynomial coefficients. returned as the flat road power and the
+    # extra power per unit of incline, both padded to the same length
+    kernel = PowerKernel(parameters)
+
+    velocity_cubed = np.convolve(np.convolve(velocity, velocity), velocity)
+    resistance = ACCELERATION_RESISTANCE * np.asarray(accel, dtype=float)
+    resistance[0] += kernel.rolling_resistance
+
+    power = pad_polynomial(kernel.aero_factor * velocity_cubed, 8)
+    power += pad_polynomial(kernel.weight * np.convolve(velocity, resistance), 8)
+    incline_power = pad_polynomial(kernel.weight * np.asarray(velocity, dtype=float), 8)
+    return power, incline_power
+
+
+def power_polynomial_array(accel, velocity, parameters):
+    # power_polynomial for one acceleration and velocity polynomial per row
+    kernel = PowerKernel(parameters)
+
+    velocity_cubed = convolve_rows(convolve_rows(velocity, velocity), velocity)
+    resistance = ACCELERATION_RESISTANCE * np.asarray(accel, dtype=float)
+    resistance[:, 0] += kernel.rolling_resistance
+
+    power = pad_polynomial_rows(kernel.aero_factor * velocity_cubed, 8)
+    power += pad_polynomial_rows(kernel.weight * convolve_rows(velocity, resistance), 8)
+    incline_power = pad_polynomial_rows(kernel.weight * np.asarray(velocity, dtype=float), 8)
+    return power, incline_power
+
+
+def convolve_rows(a, b):
+    # product of two polynomials on every row, like np.convolve row by row
+    product = np.zeros((len(a), a.shape[1] + b.shape[1] - 1))
+    for i in range(a.shape[1]):
+        for j in range(b.shape[1]):
+            product[:, i + j] += a[:, i] * b[:, j]
+    return product
+
+
+def pad_polynomial_rows(coef, length):
+    padded = np.zeros((len(coef), length))
+    padded[:, :coef.shape[1]] = coef
+    return padded
+
+
+def pad_polynomial(coef, length):
+    # pad polynomial coefficients with zeros up to the given length
+    padded = np.zeros(length)
+    padded[: len(coef)] = coef
+    return padded
+
+
+def poly_roots(coef):
+    # roots of a polynomial given lowest order first, np.roots wants highest first
+    return np.roots(coef[::-1])
+
+
+def polyval(x, coef):
+    # evaluate a polynomial given lowest order first with horner's method
+    result = 0
+    for c in coef[::-1]:
+        result = result * x + c
+    return result
@@ -0,0 +1,439 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from aev_utils import (
+    TRACE_COLUMNS, calculate_stopping_distance, calculate_stopping_distance_array,
+    get_parameters, process_segment, process_segment_adaptive,
+    process_segments_batch, solve_segments_profile, stopping_table
+)
+from drive_cycles import process_cycle
+from extract_segments import stitch_drive_cycle
+from monte_carlo import route_energy_samples, route_kinematics, sample_parameters
+from results_store import git_commit
+from segment_cache import SegmentCache
+from segments import segment_arrays
+from trace_io import TRACE_EXTENSIONS, TraceWriter, read_trace, write_trace
+
+HISTORY_FILE = "data/benchmarks/history.json"
+
+# route sizes in segments for the route benchmarks
+ROUTE_SIZES = [10, 1000, 100000]
+QUICK_ROUTE_SIZES = [10, 1000]
+
+# a drop in throughput or a rise in peak memory bigger than this is a
+# regression. the quick benchmarks are short enough to vary by 10-20% between
+# runs on the same commit, so anything smaller is mostly noise
+REGRESSION_THRESHOLD = 0.2
+
+# counts that measure the work a benchmark does. their rates are compared
+# between runs, higher is better. other counts like simulated_seconds depend
+# on what the code outputs so their rates are only printed
+WORK_COUNTS = ["segments", "calls", "samples", "cycle_seconds", "points", "rows"]
+WORK_RATES = [f"{count}_per_second" for count in WORK_COUNTS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulators and file handling")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and add them to the history")
+    run_parser.add_argument("--history", default=HISTORY_FILE)
+    run_parser.add_argument(
+        "--quick", action="store_true", help="smaller inputs, skips the 100k segment route"
+    )
+    run_parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    run_parser.add_argument("--repeats", type=int, default=3, help="timed runs, the best is kept")
+
+    compare_parser = commands.add_parser("compare", help="compare two runs from the history")
+    compare_parser.add_argument("base", nargs="?", help="commit of the older run, default second to last")
+    compare_parser.add_argument("head", nargs="?", help="commit of the newer run, default last")
+    compare_parser.add_argument("--history", default=HISTORY_FILE)
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        entry = run_benchmarks(args.quick, args.only, args.repeats)
+        append_history(args.history, entry)
+        print(f"Results added to {args.history}")
+    else:
+        history = load_history(args.history)
+        base, head = pick_runs(history, args.base, args.head)
+        regressions = compare_runs(base, head, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+def run_benchmarks(quick=False, only=None, repeats=3):
+    # run every benchmark and return a history entry for this commit
+    results = {}
+    for name, benchmark in benchmarks(quick).items():
+        if only and name not in only:
+            continue
+        # files a benchmark writes go in a scratch directory removed after it
+        with tempfile.TemporaryDirectory() as directory:
+            run = benchmark(directory)
+            results[name] = measure(run, repeats)
+        print(format_result(name, results[name]))
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "quick": quick,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def measure(run, repeats=3):
+    # best wall time of a few runs, then one more run under tracemalloc for
+    # the peak memory so the tracing does not slow down the timed runs.
+    # tracemalloc sees python and numpy allocations but not arrow's own
+    # buffers, so the parquet and feather peaks are only the python side.
+    # every count run() returns is turned into a rate per wall second, apart
+    # from sizes ending in _bytes which are kept as they are
+    best = None
+    counts = {}
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        counts = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {"wall_seconds": best, "peak_memory_bytes": peak_memory}
+    for key, value in counts.items():
+        result[key] = value
+        if not key.endswith("_bytes"):
+            result[f"{key}_per_second"] = value / best if best else 0
+    return result
+
+
+def format_result(name, result):
+    rates = ", ".join(
+        f"{key[:-len('_per_second')]} {value:,.0f}/s"
+        for key, value in result.items() if key.endswith("_per_second")
+    )
+    sizes = "".join(
+        f", {key[:-len('_bytes')].replace('_', ' ')} {value / 1e6:.1f} MB"
+        for key, value in result.items() if key.endswith("_bytes")
+    )
+    return f"{name}: {result['wall_seconds']:.4f} s, {rates}{sizes}"
+
+
+def benchmarks(quick=False):
+    # name -> function that does the setup and returns the timed callable,
+    # given a scratch directory for any files. everything runs on synthetic
+    # inputs with fixed seeds so runs compare
+    scale = 10 if quick else 1
+    parameters = get_parameters()
+
+    suite = {
+        "process_segment": lambda directory: bench_process_segment(parameters, 200 // scale),
+        "process_segment_adaptive": lambda directory: bench_process_segment(
+            parameters, 200 // scale, adaptive=True
+        ),
+        "calculate_stopping_distance": lambda directory: bench_stopping_distance(
+            parameters, 100000 // scale
+        ),
+        "calculate_stopping_distance_array": lambda directory: bench_stopping_distance(
+            parameters, 1000000 // scale, vectorised=True
+        ),
+        "stopping_table_brakes": lambda directory: bench_stopping_distance(
+            parameters, 100000 // scale, table=True
+        ),
+        "stopping_table_lookup": lambda directory: bench_stopping_distance(
+            parameters, 1000000 // scale, vectorised=True, table=True
+        ),
+    }
+    for size in (QUICK_ROUTE_SIZES if quick else ROUTE_SIZES):
+        suite[f"route_batched_{size}"] = lambda directory, size=size: bench_route(
+            parameters, size, "batched"
+        )
+        suite[f"route_closed_form_{size}"] = lambda directory, size=size: bench_route(
+            parameters, size, "closed_form"
+        )
+        if size <= (10 if quick else 1000):
+            suite[f"route_detailed_{size}"] = lambda directory, size=size: bench_route_detailed(
+                parameters, size, directory
+            )
+    suite["stitch_drive_cycle"] = lambda directory: bench_stitching(parameters, 86400 // scale)
+    suite["monte_carlo_route"] = lambda directory: bench_monte_carlo(parameters, 100, 10000 // scale)
+    for method in ("equirectangular", "haversine", "vincenty"):
+        suite[f"segments_{method}"] = lambda directory, method=method: bench_distances(
+            1000000 // scale, method
+        )
+    for detail_format in TRACE_EXTENSIONS:
+        suite[f"write_{detail_format}"] = lambda directory, detail_format=detail_format: bench_writer(
+            1000000 // scale, detail_format, directory
+        )
+        suite[f"read_{detail_format}"] = lambda directory, detail_format=detail_format: bench_reader(
+            1000000 // scale, detail_format, directory
+        )
+    return suite
+
+
+def synthetic_segments(count, seed=0):
+    # segment lengths from tens of metres to a couple of km, grades up to about 8%
+    rng = np.random.default_rng(seed)
+    lengths = np.exp(rng.uniform(np.log(10), np.log(2000), count))
+    elev_changes = lengths * np.clip(rng.normal(0, 0.03, count), -0.08, 0.08)
+    return lengths, elev_changes
+
+
+def synthetic_route_points(count, seed=0):
+    # a random walk with roughly 10 m between points
+    rng = np.random.default_rng(seed)
+    latitudes = 52.0 + np.cumsum(rng.normal(0, 0.00009, count))
+    longitudes = -1.0 + np.cumsum(rng.normal(0, 0.00015, count))
+    elevations = 100 + np.cumsum(rng.normal(0, 0.3, count))
+    return latitudes, longitudes, elevations
+
+
+def synthetic_cycle(seconds, seed=0):
+    # stop and go driving at 1 Hz: stops of 5 to 60 s between drives of 20
+    # to 200 s, each drive a smooth rise and fall up to a random top speed
+    rng = np.random.default_rng(seed)
+    speeds = []
+    while len(speeds) < seconds:
+        speeds.extend([0.0] * int(rng.integers(5, 60)))
+        drive_time = int(rng.integers(20, 200))
+        top_speed = rng.uniform(5, 15)
+        speeds.extend(top_speed * np.sin(np.linspace(0, np.pi, drive_time + 2)[1:-1]))
+    time_s = np.arange(seconds, dtype=float)
+    return process_cycle(time_s, np.array(speeds[:seconds]), get_parameters())
+
+
+def bench_process_segment(parameters, count, adaptive=False):
+    lengths, elev_changes = synthetic_segments(count)
+    simulate = process_segment_adaptive if adaptive else process_segment
+
+    def run():
+        simulated = 0
+        for length, elev_change in zip(lengths, elev_changes):
+            _, _, segment_time = simulate(length, elev_change, parameters, record_trace=False)
+            simulated += segment_time
+        return {"segments": count, "simulated_seconds": simulated}
+    return run
+
+
+def bench_stopping_distance(parameters, count, vectorised=False, table=False):
+    # table=True goes through the precomputed StoppingDistanceTable instead,
+    # the scalar version asks it whether to brake with the distance left to
+    # the end spread like the steps of a few hundred metre segment
+    rng = np.random.default_rng(0)
+    velocities = rng.uniform(0, parameters["max_velocity"], count)
+    accelerations = rng.uniform(-parameters["max_accel"], parameters["max_accel"], count)
+    max_accel = parameters["max_accel"]
+    max_jerk = parameters["max_jerk"]
+
+    if table:
+        braking_table = stopping_table(parameters)
+        if vectorised:
+            def run():
+                braking_table.lookup(velocities, accelerations)
+                return {"calls": count}
+        else:
+            distance_list = rng.uniform(0, 500, count).tolist()
+            velocity_list = velocities.tolist()
+            acceleration_list = accelerations.tolist()
+
+            def run():
+                for distance, velocity, acceleration in zip(
+                    distance_list, velocity_list, acceleration_list
+                ):
+                    braking_table.brakes(distance, velocity, acceleration)
+                return {"calls": count}
+    elif vectorised:
+        def run():
+            calculate_stopping_distance_array(velocities, accelerations, max_accel, max_jerk)
+            return {"calls": count}
+    else:
+        velocity_list = velocities.tolist()
+        acceleration_list = accelerations.tolist()
+
+        def run():
+            for velocity, acceleration in zip(velocity_list, acceleration_list):
+                calculate_stopping_distance(velocity, acceleration, max_accel, max_jerk)
+            return {"calls": count}
+    return run
+
+
+def bench_route(parameters, count, summary_method):
+    lengths, elev_changes = synthetic_segments(count)
+    solve = process_segments_batch if summary_method == "batched" else solve_segments_profile
+
+    def run():
+        _, segment_times = solve(lengths, elev_changes, parameters)
+        return {"segments": count, "simulated_seconds": float(np.sum(segment_times))}
+    return run
+
+
+def bench_route_detailed(parameters, count, directory):
+    # every segment stepped with its trace streamed to a csv, like energy.py
+    lengths, elev_changes = synthetic_segments(count)
+    output_file = os.path.join(directory, "route_detailed.csv")
+
+    def run():
+        simulated = 0
+        rows = 0
+        with TraceWriter(
+            output_file, cumulative_columns={'cumulative_distance': 'incremental_distance'}
+        ) as writer:
+            for segment_id, (length, elev_change) in enumerate(zip(lengths, elev_changes), start=1):
+                segment_df, _, segment_time = process_segment(length, elev_change, parameters)
+                segment_df['segment_id'] = segment_id
+                writer.write(segment_df)
+                simulated += segment_time
+                rows += len(segment_df)
+        return {"segments": count, "simulated_seconds": simulated, "rows": rows}
+    return run
+
+
+def bench_monte_carlo(parameters, segments, samples):
+    # energy of one route for many sampled parameter sets, the speed trace is
+    # simulated in the setup
+    lengths, elev_changes = synthetic_segments(segments)
+    kinematics = route_kinematics(lengths, elev_changes, parameters)
+    distributions = {"mass": ("normal", parameters["mass"], 100), "drag": ("uniform", 0.4, 0.6)}
+    sampled = sample_parameters(distributions, samples, parameters)
+
+    def run():
+        route_energy_samples(kinematics, sampled)
+        return {"samples": samples}
+    return run
+
+
+def bench_stitching(parameters, seconds):
+    cycle = pd.DataFrame({"time_s": np.arange(seconds, dtype=float), **synthetic_cycle(seconds)})
+
+    def run():
+        # a fresh in memory cache each time so every run does the same work
+        stitched = stitch_drive_cycle(cycle, parameters, SegmentCache(cache_dir=None))
+        return {"cycle_seconds": seconds, "rows": len(stitched['time_s'])}
+    return run
+
+
+def bench_distances(count, method):
+    latitudes, longitudes, elevations = synthetic_route_points(count)
+
+    def run():
+        segment_arrays(latitudes, longitudes, elevations, method)
+        return {"points": count}
+    return run
+
+
+def synthetic_trace(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    trace = pd.DataFrame({column: rng.random(rows) for column in TRACE_COLUMNS})
+    trace['segment_id'] = np.repeat(np.arange(rows // 400 + 1), 400)[:rows]
+    return trace
+
+
+def bench_writer(rows, detail_format, directory):
+    trace = synthetic_trace(rows)
+    output_file = os.path.join(directory, f"trace{TRACE_EXTENSIONS[detail_format]}")
+
+    def run():
+        write_trace(trace, output_file, {"route": "benchmark"})
+        return {"rows": rows, "file_bytes": os.path.getsize(output_file)}
+    return run
+
+
+def bench_reader(rows, detail_format, directory):
+    # loading the two columns a plot needs
+    input_file = os.path.join(directory, f"trace{TRACE_EXTENSIONS[detail_format]}")
+    write_trace(synthetic_trace(rows), input_file, {"route": "benchmark"})
+
+    def run():
+        read_trace(input_file, columns=['time_s', 'cumulative_energy_J'])
+        return {"rows": rows}
+    return run
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, 'r') as infile:
+        return json.load(infile)
+
+
+def append_history(history_file, entry):
+    history = load_history(history_file)
+    history.append(entry)
+    os.makedirs(os.path.dirname(history_file) or ".", exist_ok=True)
+
+    # write to a temporary file first so a crash never leaves half a file
+    temp_file = f"{history_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as outfile:
+        json.dump(history, outfile, indent=2)
+    os.replace(temp_file, history_file)
+
+
+def pick_runs(history, base=None, head=None):
+    # the latest runs for the base and head commits, by default the last two runs
+    def latest(commit, before=None):
+        candidates = history[:before] if before is not None else history
+        for index in range(len(candidates) - 1, -1, -1):
+            if commit is None or candidates[index]["commit"].startswith(commit):
+                return index
+        raise ValueError(f"No benchmark run found for {commit or 'any commit'}")
+
+    head_index = latest(head)
+    base_index = latest(base, before=head_index if base is None else None)
+    return history[base_index], history[head_index]
+
+
+def compare_runs(base, head, threshold=REGRESSION_THRESHOLD):
+    # print every shared benchmark side by side and return the regressions:
+    # work rates that dropped, or peak memory or file sizes that grew, by
+    # more than threshold
+    print(f"base {base['commit']} ({base['timestamp']}) -> head {head['commit']} ({head['timestamp']})")
+    if base.get("quick") != head.get("quick"):
+        print("warning: comparing a quick run with a full run")
+
+    regressions = []
+    for name in base["results"]:
+        if name not in head["results"]:
+            continue
+        base_result = base["results"][name]
+        head_result = head["results"][name]
+
+        for key, base_value in base_result.items():
+            higher_is_better = key in WORK_RATES
+            if not (higher_is_better or key.endswith("_bytes")) or not base_value:
+                continue
+            head_value = head_result.get(key)
+            if head_value is None:
+                continue
+
+            change = (head_value - base_value) / base_value
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > threshold else ""
+            print(f"{name:<36} {key:<36} {base_value:>16,.1f} {head_value:>16,.1f} {change:+8.1%} {flag}")
+            if flag:
+                regressions.append((name, key, change))
+
+    print(f"{len(regressions)} regressions over {threshold:.0%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import math
+import os
+
+import numpy as np
+
+# SRTM marks missing samples with this value
+VOID_VALUE = -32768
+
+
+class DEMTiles:
+    # elevation lookup from local SRTM .hgt tiles. each tile covers one degree
+    # of latitude and longitude and is named after its south west corner, e.g.
+    # N52W001.hgt. tiles are memory mapped so only the parts of a tile that are
+    # actually sampled get read from disk
+
+    def __init__(self, tile_dir="data/dem"):
+        self.tile_dir = tile_dir
+        self.tiles = {}
+
+    def tile(self, lat_index, lon_index):
+        # memory mapped grid for the tile with this south west corner
+        key = (lat_index, lon_index)
+        if key not in self.tiles:
+            path = os.path.join(self.tile_dir, tile_name(lat_index, lon_index))
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No DEM tile for {key}, expected {path}")
+
+            # 1201 samples a side for 3 arc second tiles, 3601 for 1 arc second
+            samples = int(math.isqrt(os.path.getsize(path) // 2))
+            if samples * samples * 2 != os.path.getsize(path):
+                raise ValueError(f"{path} is not a square grid of 16 bit samples")
+
+            # big endian signed 16 bit, first row is the north edge
+            self.tiles[key] = np.memmap(
+                path, dtype=">i2", mode="r", shape=(samples, samples)
+            )
+        return self.tiles[key]
+
+    def sample(self, latitudes, longitudes):
+        # bilinear interpolation of the elevation at every point. points are
+        # grouped by tile so each tile is handled with one set of array operations
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        elevations = np.full(latitudes.shape, np.nan)
+
+        lat_indices = np.floor(latitudes).astype(int).ravel()
+        lon_indices = np.floor(longitudes).astype(int).ravel()
+
+        # one number per tile so the points can be grouped with a single sort
+        tile_numbers = (lat_indices + 90) * 360 + (lon_indices + 180)
+        order = np.argsort(tile_numbers, kind="stable")
+        tile_starts = np.flatnonzero(np.diff(tile_numbers[order], prepend=-1))
+        tile_ends = np.append(tile_starts[1:], len(order))
+
+        for start, end in zip(tile_starts, tile_ends):
+            points = order[start:end]
+            lat_index = int(lat_indices[points[0]])
+            lon_index = int(lon_indices[points[0]])
+            grid = self.tile(lat_index, lon_index)
+            elevations.flat[points] = bilinear(
+                grid,
+                latitudes.flat[points] - lat_index,
+                longitudes.flat[points] - lon_index,
+            )
+
+        return elevations
+
+
+def bilinear(grid, lat_fractions, lon_fractions):
+    # interpolate inside one tile given the position within it from 0 to 1.
+    # rows run north to south so the row position is measured from the top
+    cells = grid.shape[0] - 1
+    rows = (1 - lat_fractions) * cells
+    cols = lon_fractions * cells
+
+    # keep the top left corner inside the grid so the edges interpolate too
+    row0 = np.clip(np.floor(rows).astype(int), 0, cells - 1)
+    col0 = np.clip(np.floor(cols).astype(int), 0, cells - 1)
+    row_weights = rows - row0
+    col_weights = cols - col0
+
+    top_left = grid[row0, col0].astype(float)
+    top_right = grid[row0, col0 + 1].astype(float)
+    bottom_left = grid[row0 + 1, col0].astype(float)
+    bottom_right = grid[row0 + 1, col0 + 1].astype(float)
+
+    elevations = (
+        top_left * (1 - row_weights) * (1 - col_weights)
+        + top_right * (1 - row_weights) * col_weights
+        + bottom_left * row_weights * (1 - col_weights)
+        + bottom_right * row_weights * col_weights
+    )
+
+    # no elevation where any of the surrounding samples is missing
+    void = (
+        (top_left == VOID_VALUE) | (top_right == VOID_VALUE)
+        | (bottom_left == VOID_VALUE) | (bottom_right == VOID_VALUE)
+    )
+    elevations[void] = np.nan
+    return elevations
+
+
+def tile_name(lat_index, lon_index):
+    # SRTM file name for the tile with this south west corner
+    lat_prefix = "N" if lat_index >= 0 else "S"
+    lon_prefix = "E" if lon_index >= 0 else "W"
+    return f"{lat_prefix}{abs(lat_index):02d}{lon_prefix}{abs(lon_index):03d}.hgt"
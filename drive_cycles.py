@@ -0,0 +1,286 @@
+import argparse
+import csv
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aev_utils import convert_mph_ms, get_parameters
+from power_kernel import PowerKernel
+from segmentation import find_runs
+
+# standard cycles shipped with the repo, anything else is picked up from CYCLE_DIR
+CYCLE_LIBRARY = {
+    "udds": "data/raw/uddscol.csv",
+}
+CYCLE_DIR = "data/cycles"
+
+
+def convert_kmh_ms(kmh):
+    metres_in_kilometre = 1000
+    seconds_in_hour = 3600  # s/h
+    return kmh * metres_in_kilometre / seconds_in_hour
+
+
+def convert_ms_ms(ms):
+    return ms
+
+
+# speed units a cycle can be given in and how to get each one to m/s
+SPEED_UNITS = {
+    "mph": convert_mph_ms,
+    "kmh": convert_kmh_ms,
+    "ms": convert_ms_ms,
+}
+
+# how each unit shows up in a column name, e.g. speed_mph, "Speed (km/h)", v_mps
+UNIT_PATTERNS = [
+    ("mph", re.compile(r"mph|miles")),
+    ("kmh", re.compile(r"km/?h|kph|kmph")),
+    ("ms", re.compile(r"m/s|mps|(^|[^a-z])ms($|[^a-z])")),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Work out speed, power and energy over drive cycles")
+    parser.add_argument(
+        "cycles", nargs="*",
+        help="cycle files to process, defaults to the cycle library"
+    )
+    parser.add_argument("--output-dir", default="data/processed")
+    parser.add_argument("--summary", default="data/results/cycles_summary.csv")
+    parser.add_argument(
+        "--speed-cap-mph", type=float, default=25.0,
+        help="top speed the vehicle can follow the cycle at, 0 for no cap"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="number of cycles processed at the same time"
+    )
+    args = parser.parse_args()
+
+    # vehicle design parameters from Julians spreadsheets etc.
+    parameters = get_parameters()
+
+    if args.cycles:
+        cycles = {cycle_name(path): path for path in args.cycles}
+    else:
+        cycles = find_cycles()
+
+    speed_cap = convert_mph_ms(args.speed_cap_mph) if args.speed_cap_mph else None
+
+    start_time = time.time()
+    run_cycles(cycles, args.output_dir, args.summary, parameters, speed_cap, args.workers)
+    print(f"cycles took {time.time() - start_time} seconds")
+
+
+def find_cycles(cycle_dir=CYCLE_DIR):
+    # the standard cycles plus every csv in cycle_dir, keyed on cycle name
+    cycles = {
+        name: path for name, path in CYCLE_LIBRARY.items() if os.path.exists(path)
+    }
+    for path in sorted(glob.glob(os.path.join(cycle_dir, "*.csv"))):
+        cycles[cycle_name(path)] = path
+    return cycles
+
+
+def cycle_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def run_cycles(cycles, output_dir, summary_file, parameters, speed_cap=None, workers=None):
+    # process every cycle in parallel worker processes, write each one's
+    # processed file to output_dir and a summary with one row per cycle
+    os.makedirs(output_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                process_cycle_file, path,
+                os.path.join(output_dir, f"{name}_processed.csv"),
+                parameters, speed_cap, name
+            )
+            for name, path in cycles.items()
+        ]
+        # collect in input order so the summary is the same every run
+        cycle_summaries = [future.result() for future in futures]
+
+    if summary_file is not None:
+        os.makedirs(os.path.dirname(summary_file) or ".", exist_ok=True)
+        with open(summary_file, 'w', newline='') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=list(cycle_summaries[0]) if cycle_summaries else [])
+            writer.writeheader()
+            writer.writerows(cycle_summaries)
+        print(f"Cycle summary saved to {summary_file}")
+
+    return cycle_summaries
+
+
+def process_cycle_file(input_file, output_file, parameters, speed_cap=None, name=None, speed_unit=None):
+    # load one cycle, work out its columns and write them out. returns the
+    # cycle's summary row
+    name = name or cycle_name(input_file)
+    dataframe, speed_column, speed_unit = load_cycle(input_file, speed_unit)
+
+    columns = process_cycle(
+        dataframe['time_s'].to_numpy(), dataframe[speed_column].to_numpy(),
+        parameters, speed_unit, speed_cap
+    )
+
+    # energy that could be given back only goes in the summary
+    regen_energy = columns.pop('regen_energy_J')
+
+    # keep the cycle's own speed column next to the capped copy of it
+    processed = pd.DataFrame({
+        'time_s': dataframe['time_s'],
+        speed_column: dataframe[speed_column],
+        f"{speed_column}_capped": columns.pop('speed_capped'),
+        **columns,
+    })
+    if output_file is not None:
+        processed.to_csv(output_file)
+        print(f"{name}: processed cycle saved to {output_file}")
+
+    return summarise_cycle(name, processed, speed_column, speed_unit, speed_cap, regen_energy)
+
+
+def load_cycle(input_file, speed_unit=None):
+    # read a cycle csv with a time column in seconds and a speed column in any
+    # of SPEED_UNITS. the unit is worked out from the column name unless
+    # speed_unit is given. returns the dataframe with the time as time_s, the
+    # name of the speed column and its unit
+    dataframe = pd.read_csv(input_file)
+    dataframe.columns = [str(column).strip() for column in dataframe.columns]
+
+    # no lone "t" for time, it would pick up columns like "t_ambient (C)"
+    time_column = find_column(dataframe.columns, ("time", "sec", "secs", "seconds"))
+    if time_column is None:
+        raise ValueError(f"No time column found in {input_file}")
+    time_values = dataframe[time_column]
+    if re.search(r"(^|[^a-z])ms($|[^a-z])|millisec", time_column.lower()):
+        time_values = time_values / 1000
+    dataframe = dataframe.drop(columns=[time_column])
+    dataframe.insert(0, 'time_s', time_values)
+
+    speed_column = find_column(dataframe.columns, ("speed", "velocity", "v"))
+    if speed_column is None:
+        raise ValueError(f"No speed column found in {input_file}")
+
+    if speed_unit is None:
+        speed_unit = speed_column_unit(speed_column)
+        if speed_unit is None:
+            raise ValueError(
+                f"Cannot tell the units of '{speed_column}' in {input_file}, "
+                f"pass speed_unit as one of {list(SPEED_UNITS)}"
+            )
+    elif speed_unit not in SPEED_UNITS:
+        raise ValueError(f"Unknown speed unit: {speed_unit}")
+
+    return dataframe, speed_column, speed_unit
+
+
+def find_column(columns, names):
+    # first column with one of the names as a whole word, e.g. "Vehicle Speed (km/h)"
+    for column in columns:
+        if set(re.split(r"[^a-z]+", column.lower())) & set(names):
+            return column
+    return None
+
+
+def speed_column_unit(column):
+    lowered = column.lower()
+    for unit, pattern in UNIT_PATTERNS:
+        if pattern.search(lowered):
+            return unit
+    return None
+
+
+def process_cycle(time_s, speed, parameters, speed_unit="ms", speed_cap=None):
+    # every derived column of a cycle in one pass of array operations. speed
+    # is capped at speed_cap (m/s) first, the vehicle is assumed to follow
+    # the capped speed exactly on the flat. the first sample has no
+    # acceleration, power or energy as there is no step before it
+    time_s = np.asarray(time_s, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    to_ms = SPEED_UNITS[speed_unit]
+
+    if speed_cap is not None:
+        # the cap in the cycle's own units for the capped copy of its speeds
+        speed_capped = np.minimum(speed, speed_cap / to_ms(1.0))
+    else:
+        speed_capped = speed
+    speed_ms = to_ms(speed_capped)
+
+    time_differences = np.diff(time_s, prepend=time_s[:1])
+    velocity_differences = np.diff(speed_ms, prepend=speed_ms[:1])
+
+    incremental_distance = speed_ms * time_differences
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acceleration = velocity_differences / time_differences
+    kernel = PowerKernel(parameters)
+    power = kernel.power(acceleration, speed_ms)
+    # only positive power is drawn, NaN stays NaN
+    incremental_energy = kernel.positive_energy(power, time_differences)
+    regen_energy = kernel.regen_energy(power, time_differences)
+
+    return {
+        'speed_capped': speed_capped,
+        'speed_ms': speed_ms,
+        'incremental_distance': incremental_distance,
+        'cumulative_distance': nan_cumsum(incremental_distance),
+        'acceleration_mss': acceleration,
+        'power_W': power,
+        'incremental_energy_J': incremental_energy,
+        'cumulative_energy_J': nan_cumsum(incremental_energy),
+        'regen_energy_J': regen_energy,
+    }
+
+
+def nan_cumsum(values):
+    # running total that skips NaNs and leaves them in place, like a pandas cumsum
+    running = np.nancumsum(values)
+    running[np.isnan(values)] = np.nan
+    return running
+
+
+def summarise_cycle(name, processed, speed_column, speed_unit, speed_cap=None, regen_energy=None):
+    # one row of figures that can be compared across cycles
+    time_s = processed['time_s'].to_numpy(dtype=float)
+    speed_ms = processed['speed_ms'].to_numpy()
+    raw_speed_ms = SPEED_UNITS[speed_unit](processed[speed_column].to_numpy(dtype=float))
+
+    duration = time_s[-1] - time_s[0] if len(time_s) else 0
+    distance = np.nansum(processed['incremental_distance'].to_numpy())
+    energy = np.nansum(processed['incremental_energy_J'].to_numpy())
+    time_differences = np.diff(time_s, prepend=time_s[:1])
+
+    _, _, stopped = find_runs(speed_ms == 0)
+    moving_time = np.sum(time_differences[speed_ms > 0])
+    capped_time = (
+        np.sum(time_differences[raw_speed_ms > speed_cap]) if speed_cap is not None else 0
+    )
+
+    return {
+        'cycle': name,
+        'speed_unit': speed_unit,
+        'samples': len(time_s),
+        'duration_s': float(duration),
+        'distance_m': float(distance),
+        'average_speed_ms': float(distance / duration) if duration else 0,
+        'moving_average_speed_ms': float(distance / moving_time) if moving_time else 0,
+        'max_speed_ms': float(np.max(speed_ms)) if len(speed_ms) else 0,
+        'stops': int(np.sum(stopped[1:])) if len(stopped) else 0,
+        'idle_fraction': float(1 - moving_time / duration) if duration else 0,
+        'capped_fraction': float(capped_time / duration) if duration else 0,
+        'total_energy_J': float(energy),
+        'energy_per_km': float(energy / (distance / 1000)) if distance else 0,
+        'regen_energy_J': float(np.nansum(regen_energy)) if regen_energy is not None else 0,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import random
+import sqlite3
+
+import aiohttp
+
+API_URL = "https://api.open-elevation.com/api/v1/lookup"
+CACHE_FILE = "data/cache/elevations.sqlite"
+
+# HTTP statuses that are worth retrying, everything else fails straight away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# seconds allowed to connect and between reads for each request. there is no
+# limit on a whole lookup, batches waiting for their turn never time out
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+
+class ElevationCache:
+    # elevations already looked up, stored in sqlite keyed on the latitude and
+    # longitude rounded to a fixed number of decimal places (5 is about 1 m)
+
+    def __init__(self, path=CACHE_FILE, decimals=5):
+        self.decimals = decimals
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS elevations ("
+            "lat_key INTEGER, lon_key INTEGER, elevation REAL, "
+            "PRIMARY KEY (lat_key, lon_key))"
+        )
+
+    def key(self, latitude, longitude):
+        scale = 10 ** self.decimals
+        return round(latitude * scale), round(longitude * scale)
+
+    def coordinate(self, key):
+        # the rounded coordinate a key stands for, this is what gets looked up
+        scale = 10 ** self.decimals
+        return key[0] / scale, key[1] / scale
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        # stay under sqlite's limit on query parameters
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            conditions = " OR ".join(["(lat_key = ? AND lon_key = ?)"] * len(chunk))
+            values = [value for key in chunk for value in key]
+            rows = self.connection.execute(
+                f"SELECT lat_key, lon_key, elevation FROM elevations WHERE {conditions}",
+                values,
+            )
+            for lat_key, lon_key, elevation in rows:
+                found[(lat_key, lon_key)] = elevation
+        return found
+
+    def put_many(self, elevations):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO elevations VALUES (?, ?, ?)",
+            [(key[0], key[1], elevation) for key, elevation in elevations.items()],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def lookup(
+    latitudes, longitudes, api_url=API_URL, cache=None,
+    batch_size=100, max_concurrency=4, max_retries=5, backoff=0.5,
+    connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT
+):
+    # elevation for every point, only fetching points that are not cached.
+    # repeated points and points already in the cache cost no requests. each
+    # batch is cached as soon as it arrives, so if a lookup fails part way the
+    # next one only fetches the batches that are still missing
+    close_cache = cache is None
+    if cache is None:
+        cache = ElevationCache()
+
+    try:
+        keys = [cache.key(lat, lon) for lat, lon in zip(latitudes, longitudes)]
+        unique_keys = list(dict.fromkeys(keys))
+
+        known = cache.get_many(unique_keys)
+        missing = [key for key in unique_keys if key not in known]
+
+        if missing:
+            def save_batch(start, elevations):
+                fetched = dict(zip(missing[start:start + len(elevations)], elevations))
+                cache.put_many(fetched)
+                known.update(fetched)
+
+            asyncio.run(fetch_all(
+                [cache.coordinate(key) for key in missing], api_url,
+                batch_size, max_concurrency, max_retries, backoff,
+                connect_timeout, read_timeout, save_batch
+            ))
+
+        print(
+            f"Elevations: {len(unique_keys) - len(missing)} cached, "
+            f"{len(missing)} fetched in {-(-len(missing) // batch_size)} requests"
+        )
+        return [known[key] for key in keys]
+    finally:
+        if close_cache:
+            cache.close()
+
+
+async def fetch_all(
+    coordinates, api_url, batch_size=100, max_concurrency=4, max_retries=5, backoff=0.5,
+    connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, on_batch=None
+):
+    # split the coordinates into batches and post them over one pooled session.
+    # a semaphore keeps at most max_concurrency batches in flight, the rest
+    # wait for it before their request (and its timeouts) starts.
+    # on_batch(start, elevations) is called as each batch arrives, start being
+    # the index of the batch's first coordinate
+    batches = [
+        (start, coordinates[start:start + batch_size])
+        for start in range(0, len(coordinates), batch_size)
+    ]
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_batch(start, batch):
+        elevations = await fetch_batch(session, semaphore, api_url, batch, max_retries, backoff)
+        if on_batch is not None:
+            on_batch(start, elevations)
+        return elevations
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    timeout = aiohttp.ClientTimeout(
+        total=None, sock_connect=connect_timeout, sock_read=read_timeout
+    )
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [asyncio.ensure_future(run_batch(start, batch)) for start, batch in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # one batch gave up, stop the queued ones rather than sending them
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    return [elevation for batch_result in results for elevation in batch_result]
+
+
+async def fetch_batch(session, semaphore, api_url, batch, max_retries, backoff):
+    # the semaphore is only held while a request is running, not while
+    # backing off, so a batch waiting to retry lets another one go
+    payload = {
+        "locations": [
+            {"latitude": latitude, "longitude": longitude}
+            for latitude, longitude in batch
+        ]
+    }
+
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore, session.post(api_url, json=payload) as response:
+                if response.status in RETRY_STATUSES and attempt < max_retries:
+                    raise RetryableStatus(response.status)
+                response.raise_for_status()
+                results = (await response.json())['results']
+                return [result['elevation'] for result in results]
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError, RetryableStatus):
+            if attempt == max_retries:
+                raise
+            # exponential backoff with jitter so the batches do not retry together
+            await asyncio.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+class RetryableStatus(Exception):
+    pass
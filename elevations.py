@@ -1,12 +1,27 @@
 import csv
-import requests
+import pandas as pd
+
+import elevation_client
+from dem import DEMTiles
+
+API_URL = elevation_client.API_URL
+DEM_DIR = "data/dem"
 
 def main():
     input_csv = "data/raw/route_c.csv"
     output_csv = "data/elevations/route_c_elev.csv"
 
-    api_url = "https://api.open-elevation.com/api/v1/lookup"
+    # "api" uses the open-elevation service, "dem" samples local SRTM tiles
+    # in DEM_DIR and works without a network connection
+    elevation_source = "api"
+
+    if elevation_source == "dem":
+        sample_dem_elevations(input_csv, output_csv)
+    else:
+        lookup_elevations(input_csv, output_csv)
 
+
+def lookup_elevations(input_csv, output_csv, api_url=API_URL):
     coordinates = []
     with open(input_csv, newline='') as csvfile:
         reader = csv.DictReader(csvfile)
@@ -15,25 +30,44 @@ def main():
             lon = float(row['longitude'])
             coordinates.append({'latitude': lat, 'longitude': lon})
 
-    payload = {"locations": coordinates}
-
-    response = requests.post(api_url, json=payload)
-    response.raise_for_status()
-    results = response.json()['results']
+    # batched concurrent requests, points already looked up come from the cache
+    results = elevation_client.lookup(
+        [coord['latitude'] for coord in coordinates],
+        [coord['longitude'] for coord in coordinates],
+        api_url=api_url
+    )
 
     with open(output_csv, mode='w', newline='') as csvfile:
         fieldnames = ['latitude', 'longitude', 'elevation']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        for coord, result in zip(coordinates, results):
+        for coord, elevation in zip(coordinates, results):
             writer.writerow({
                 'latitude': coord['latitude'],
                 'longitude': coord['longitude'],
-                'elevation': result['elevation']
+                'elevation': elevation
             })
 
     print(f"New file written: {output_csv}")
 
-    
+def sample_dem_elevations(input_csv, output_csv, tile_dir=DEM_DIR):
+    # same output as lookup_elevations but from local DEM tiles
+    points = pd.read_csv(
+        input_csv, usecols=['latitude', 'longitude'], float_precision='round_trip'
+    )
+
+    tiles = DEMTiles(tile_dir)
+    points['elevation'] = tiles.sample(
+        points['latitude'].to_numpy(), points['longitude'].to_numpy()
+    )
+
+    missing = points['elevation'].isna().sum()
+    if missing:
+        print(f"Warning: no DEM elevation for {missing} points")
+
+    points.to_csv(output_csv, index=False)
+    print(f"New file written: {output_csv}")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,177 @@
-import math
+import argparse
 import csv
+import glob
+import os
 import time
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from aev_utils import process_segment, get_parameters
+import instrumentation
+from aev_utils import (
+    TRACE_COLUMNS, process_segment, process_segment_adaptive, process_segments_batch,
+    solve_segments_profile, get_parameters
+)
+from results_store import ResultsStore
+from segment_cache import SegmentCache
+from trace_io import TraceWriter, trace_metadata, trace_path
+
+# columns of the detailed output, a route with no segments still gets them
+DETAIL_COLUMNS = TRACE_COLUMNS + ['segment_id']
+
+# route totals in the detailed output and the per step column each one sums
+DETAIL_CUMULATIVE_COLUMNS = {
+    'cumulative_distance': 'incremental_distance',
+    'cumulative_energy_J': 'incremental_energy_J',
+}
 
 def main():
+    parser = argparse.ArgumentParser(description="Simulate the energy used on each route")
+    parser.add_argument(
+        "segments", nargs="?", default="data/segments/*_segments.csv",
+        help="segments file, directory of segments files or glob pattern"
+    )
+    parser.add_argument("--output-dir", default="data/results")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="number of routes simulated at the same time"
+    )
+    parser.add_argument(
+        "--store", default=None,
+        help="also keep every route run in this results store, e.g. data/store"
+    )
+    parser.add_argument(
+        "--metrics", default=None,
+        help="write stage timings and segment counters to this json lines file"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="also run each stage under cProfile, needs --metrics"
+    )
+    parser.add_argument(
+        "--metrics-per-segment", action="store_true",
+        help="add a metrics line for every simulated segment, needs --metrics"
+    )
+    args = parser.parse_args()
+
+    if args.metrics:
+        # set before the worker processes start so they inherit it
+        instrumentation.enable(args.metrics, args.profile, args.metrics_per_segment)
+
     # vehicle design parameters from Julians spreadsheets etc.
     parameters = get_parameters()
     
     start_time = time.time()
 
-    input_file = "data/segments/route_c_segments.csv"
-    output_file = "data/results/route_c_energy.csv"
-    output_detail_file = "data/results/route_c_detailed.csv"
+    # set to False to only produce the route totals, no detailed file is written
+    detailed_output = True
+    # how the totals are worked out when there is no detailed output,
+    # "batched" steps all segments together and matches a detailed run
+    # without the cache, "closed_form" solves each segment's motion profile
+    # directly, quicker still and within a percent or two of it
+    summary_method = "batched"
+    # reuse segments simulated in earlier runs. a segment within the cache's
+    # tolerances of one seen before gets that one's result, so totals can
+    # move by a little
+    use_cache = False
+    # file format of the detailed output, "csv", "parquet", "feather" or "npz"
+    detail_format = "csv"
+    # largest step in seconds for the detailed output, None keeps the fixed
+    # 0.1 s steps, otherwise steady driving is covered in larger steps
+    max_step = None
+
+    run_routes(
+        args.segments, args.output_dir, parameters, args.workers,
+        detailed_output, summary_method, use_cache, detail_format, max_step, args.store
+    )
+
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+    
+    print(f"simulation took {elapsed_time} seconds")
+
+
+def run_routes(
+    segments, output_dir, parameters, workers=None,
+    detailed_output=True, summary_method="batched", use_cache=False, detail_format="csv",
+    max_step=None, store_dir=None
+):
+    # simulate every route segments file in parallel worker processes and
+    # write a combined summary with one row per route. with store_dir every
+    # route run is also recorded in that ResultsStore
+    input_files = find_segment_files(segments)
+    if not input_files:
+        raise FileNotFoundError(f"No segments files found for {segments}")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for input_file in input_files:
+        route = os.path.basename(input_file).replace("_segments.csv", "")
+        jobs.append((
+            input_file,
+            os.path.join(output_dir, f"{route}_energy.csv"),
+            trace_path(os.path.join(output_dir, f"{route}_detailed"), detail_format),
+        ))
+
+    route_summaries = []
+    if workers == 1:
+        # one route at a time in this process, also how a pipeline stage
+        # that is already running in a worker process calls it
+        with instrumentation.stage("routes", routes=len(jobs)):
+            for input_file, output_file, output_detail_file in jobs:
+                route_summaries.append(simulate_route_file(
+                    input_file, output_file, output_detail_file,
+                    parameters, detailed_output, summary_method, use_cache, max_step, store_dir
+                ))
+    else:
+        with instrumentation.stage("routes", routes=len(jobs)), \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    simulate_route_file, input_file, output_file, output_detail_file,
+                    parameters, detailed_output, summary_method, use_cache, max_step, store_dir
+                )
+                for input_file, output_file, output_detail_file in jobs
+            ]
+            # collect in input order so the summary is the same every run
+            for future in futures:
+                route_summaries.append(future.result())
+
+    summary_file = os.path.join(output_dir, "routes_summary.csv")
+    with open(summary_file, 'w', newline='') as outfile:
+        fieldnames = [
+            'route', 'segments', 'total_length', 'total_time',
+            'total_energy', 'energy_per_km'
+        ]
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(route_summaries)
+
+    print(f"Processed {len(input_files)} routes.")
+    print(f"Route summary saved to {summary_file}")
+
+    return route_summaries
+
+
+def find_segment_files(segments):
+    # accept a single file, a directory of *_segments.csv files, a glob or a
+    # list of files, which are used as they are
+    if isinstance(segments, (list, tuple)):
+        return list(segments)
+    if os.path.isdir(segments):
+        segments = os.path.join(segments, "*_segments.csv")
+    return sorted(glob.glob(segments))
+
+
+def simulate_route_file(
+    input_file, output_file, output_detail_file, parameters,
+    detailed_output=True, summary_method="batched", use_cache=False, max_step=None,
+    store_dir=None
+):
+    route = os.path.basename(input_file).replace("_segments.csv", "")
 
     segments = []
-    with open(input_file, 'r') as infile:
+    with instrumentation.stage("load", route=route), open(input_file, 'r') as infile:
         reader = csv.DictReader(infile)
         for row in reader:
             segments.append({
@@ -25,23 +180,99 @@ def main():
                 'segment_elev_change': float(row['segment_elev_change'])
             })
 
+    # each worker has its own cache but they all share the on-disk tier
+    if use_cache:
+        segment_cache = SegmentCache()
+    else:
+        segment_cache = None
+
+    if not detailed_output:
+        with instrumentation.stage("simulate", route=route, method=summary_method):
+            results = simulate_route_totals(segments, parameters, summary_method)
+    else:
+        # each segment's trace is appended to the detailed file as soon as it
+        # is simulated, the format follows the file extension. the detailed
+        # file is written as the route goes, so its time is part of simulate
+        with instrumentation.stage("simulate", route=route, method="detailed"), TraceWriter(
+            output_detail_file, trace_metadata(parameters, route),
+            cumulative_columns=DETAIL_CUMULATIVE_COLUMNS, columns=DETAIL_COLUMNS
+        ) as trace_writer:
+            results = simulate_route_detailed(
+                segments, parameters, segment_cache, trace_writer, max_step
+            )
+
+    with instrumentation.stage("write", route=route), open(output_file, 'w', newline='') as outfile:
+        fieldnames = [
+            'segment_id',
+            'segment_length', 'cumulative_length', 'segment_elev_change',
+            'segment_time', 'cumulative_time',
+            'segment_energy', 'cumulative_energy'
+        ]
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
+
+    print(f"{route}: processed {len(segments)} segments.")
+    print(f"{route}: route data saved to {output_file}")
+
+    if detailed_output:
+        print(f"{route}: detailed simulation saved to {output_detail_file}")
+
+    if segment_cache is not None:
+        print(f"{route}: segment cache {segment_cache.stats()}")
+
+    if store_dir is not None:
+        with instrumentation.stage("store", route=route), ResultsStore(store_dir) as store:
+            run_id = store.record_run(
+                route, parameters, results,
+                method="detailed" if detailed_output else summary_method,
+                trace_file=output_detail_file if detailed_output else None,
+            )
+        print(f"{route}: stored as run {run_id} in {store_dir}")
+
+    if results:
+        total_length = results[-1]['cumulative_length']
+        total_time = results[-1]['cumulative_time']
+        total_energy = results[-1]['cumulative_energy']
+    else:
+        total_length = total_time = total_energy = 0
+
+    return {
+        'route': route,
+        'segments': len(segments),
+        'total_length': total_length,
+        'total_time': total_time,
+        'total_energy': total_energy,
+        'energy_per_km': total_energy / (total_length / 1000) if total_length else 0,
+    }
+
+
+def simulate_route_detailed(
+    segments, parameters, segment_cache=None, trace_writer=None, max_step=None
+):
+    # per segment results for the route. each segment's trace goes straight to
+    # trace_writer, which moves it on in time and carries the route's
+    # cumulative distance and energy, so no more than one trace is held
+    if max_step is not None:
+        # adaptive steps are cheap enough to simulate every segment afresh
+        simulate_segment = partial(process_segment_adaptive, max_step=max_step)
+    elif segment_cache is not None:
+        simulate_segment = segment_cache.process_segment
+    else:
+        simulate_segment = process_segment
+
     results = []
-    all_detailed_segments = []
     total_energy = 0
     total_time = 0
     total_length = 0
-    time_offset = 0
 
     for segment in segments:
-        detailed_df, segment_energy, segment_time = process_segment(
+        detailed_df, segment_energy, segment_time = simulate_segment(
             segment['segment_length'],
             segment['segment_elev_change'],
             parameters
         )
 
-        detailed_df['time_s'] += time_offset
-        time_offset = detailed_df['time_s'].iloc[-1] + 1
-
         total_energy += segment_energy
         total_time += segment_time
         total_length += segment['segment_length']
@@ -57,35 +288,52 @@ def main():
             'cumulative_energy': total_energy
         })
 
-        # add segment ID to detailed_df and append to master list
-        detailed_df['segment_id'] = segment['segment_id']
-        all_detailed_segments.append(detailed_df)
+        if trace_writer is not None:
+            detailed_df['segment_id'] = segment['segment_id']
+            trace_writer.write(detailed_df)
 
-    with open(output_file, 'w', newline='') as outfile:
-        fieldnames = [
-            'segment_id',
-            'segment_length', 'cumulative_length', 'segment_elev_change',
-            'segment_time', 'cumulative_time',
-            'segment_energy', 'cumulative_energy'
-        ]
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+    return results
 
-    # save full detailed CSV
-    stitched_df = pd.concat(all_detailed_segments, ignore_index=True)
-    stitched_df['cumulative_distance'] = stitched_df['incremental_distance'].cumsum()
-    stitched_df['cumulative_energy_J'] = stitched_df['incremental_energy_J'].cumsum()
-    stitched_df.to_csv(output_detail_file, index=False)
 
-    print(f"Processed {len(segments)} segments.")
-    print(f"Route data saved to {output_file}")
-    print(f"Detailed simulation saved to {output_detail_file}")
+def simulate_route_totals(segments, parameters, summary_method="batched"):
+    segment_lengths = [segment['segment_length'] for segment in segments]
+    segment_elev_changes = [segment['segment_elev_change'] for segment in segments]
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    
-    print(f"simulation took {elapsed_time} seconds")
+    if summary_method == "batched":
+        # run every segment through the batched simulator in one go
+        segment_energies, segment_times = process_segments_batch(
+            segment_lengths, segment_elev_changes, parameters
+        )
+    elif summary_method == "closed_form":
+        # solve each segment's motion profile without stepping
+        segment_energies, segment_times = solve_segments_profile(
+            segment_lengths, segment_elev_changes, parameters
+        )
+    else:
+        raise ValueError(f"Unknown summary method: {summary_method}")
+
+    results = []
+    total_energy = 0
+    total_time = 0
+    total_length = 0
+
+    for segment, segment_energy, segment_time in zip(segments, segment_energies, segment_times):
+        total_energy += segment_energy
+        total_time += segment_time
+        total_length += segment['segment_length']
+
+        results.append({
+            'segment_id': segment['segment_id'],
+            'segment_length': segment['segment_length'],
+            'cumulative_length': total_length,
+            'segment_elev_change': segment['segment_elev_change'],
+            'segment_time': float(segment_time),
+            'cumulative_time': float(total_time),
+            'segment_energy': float(segment_energy),
+            'cumulative_energy': float(total_energy)
+        })
+
+    return results
 
 
 if __name__ == "__main__":
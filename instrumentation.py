@@ -0,0 +1,185 @@
+import cProfile
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+
+# environment variables that carry the settings into worker processes
+METRICS_ENV = "AEV_METRICS"
+PROFILE_ENV = "AEV_PROFILE"
+PER_SEGMENT_ENV = "AEV_METRICS_PER_SEGMENT"
+
+# counters kept for every simulated segment
+SEGMENT_COUNTERS = [
+    "segments",
+    "steps",
+    "rows_allocated",
+    "stopping_distance_calls",
+    "fractional_steps",
+]
+
+# off unless enable() is called or AEV_METRICS is set. the simulators only
+# check this once per segment, never inside their step loops
+enabled = False
+metrics_file = None
+profile_stages = False
+per_segment = False
+
+# running totals of the segment counters in this process
+counters = dict.fromkeys(SEGMENT_COUNTERS, 0)
+
+# stages open in this process. only the outermost one is profiled, a nested
+# stage shows up inside its stats. python allows one profiler at a time
+open_stages = 0
+active_profiler = None
+# profile files written by this process, keeps their names unique
+profiles_written = 0
+
+
+def enable(path, profile=False, segments=False):
+    # start writing metrics to path as json lines, one object per event.
+    # profile=True also runs every stage under cProfile and saves the stats
+    # next to the metrics file, segments=True adds a line per simulated
+    # segment on top of the per stage totals. worker processes started after
+    # this pick the settings up from the environment
+    global enabled, metrics_file, profile_stages, per_segment
+    enabled = True
+    metrics_file = path
+    profile_stages = profile
+    per_segment = segments
+
+    os.environ[METRICS_ENV] = path
+    os.environ[PROFILE_ENV] = "1" if profile else ""
+    os.environ[PER_SEGMENT_ENV] = "1" if segments else ""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+
+def disable():
+    global enabled
+    enabled = False
+    for name in (METRICS_ENV, PROFILE_ENV, PER_SEGMENT_ENV):
+        os.environ.pop(name, None)
+
+
+def emit(event, **fields):
+    # append one json line. each line goes out in a single write so lines
+    # from several worker processes sharing the file do not interleave
+    if not enabled:
+        return
+    record = {"event": event, "time": time.time(), "pid": os.getpid(), **fields}
+    with open(metrics_file, 'a') as outfile:
+        outfile.write(json.dumps(record) + "\n")
+
+
+def record_segment(steps, rows_allocated, stopping_distance_calls, fractional_steps, **fields):
+    # called once at the end of each simulated segment when enabled
+    counters["segments"] += 1
+    counters["steps"] += steps
+    counters["rows_allocated"] += rows_allocated
+    counters["stopping_distance_calls"] += stopping_distance_calls
+    counters["fractional_steps"] += fractional_steps
+    if per_segment:
+        emit(
+            "segment", steps=steps, rows_allocated=rows_allocated,
+            stopping_distance_calls=stopping_distance_calls,
+            fractional_steps=fractional_steps, **fields
+        )
+
+
+def record_batch(segments, steps, stopping_distance_calls, fractional_steps):
+    # totals for a whole batch of segments from the array simulators
+    counters["segments"] += segments
+    counters["steps"] += steps
+    counters["stopping_distance_calls"] += stopping_distance_calls
+    counters["fractional_steps"] += fractional_steps
+
+
+@contextmanager
+def stage(name, **fields):
+    # time a stage of the pipeline. records wall and cpu time and how much
+    # each segment counter went up while it ran, and profiles it when asked.
+    # costs one flag check when instrumentation is off
+    global open_stages, active_profiler
+    if not enabled:
+        yield
+        return
+
+    before = dict(counters)
+    profiler = None
+    if profile_stages and open_stages == 0:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # something else is already profiling this process
+            profiler = None
+        active_profiler = profiler
+    open_stages += 1
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        open_stages -= 1
+
+        profile_file = None
+        if profiler is not None:
+            profiler.disable()
+            active_profiler = None
+            profile_file = profile_path(name, **fields)
+            profiler.dump_stats(profile_file)
+
+        emit(
+            "stage", stage=name, wall_s=wall, cpu_s=cpu,
+            counters={key: counters[key] - before[key] for key in SEGMENT_COUNTERS},
+            profile=profile_file, **fields
+        )
+
+
+def reset_after_fork():
+    # a forked worker starts inside the stage that started it, with that
+    # stage's profiler still hooked in. its own stages start from scratch
+    global open_stages, active_profiler
+    if active_profiler is not None:
+        active_profiler.disable()
+        active_profiler = None
+    open_stages = 0
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def run_stage(name, action, *args):
+    # run action(*args) as a timed stage, can be handed to a process pool
+    with stage(name):
+        return action(*args)
+
+
+def profile_path(name, **fields):
+    # cProfile stats file for a stage, named after the stage, its fields (e.g.
+    # the route), the process and a count so repeated stages never overwrite
+    # each other. combine them with pstats.Stats(*paths)
+    global profiles_written
+    profiles_written += 1
+    label = ".".join([name] + [str(value) for value in fields.values()])
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label)
+    base = os.path.splitext(metrics_file)[0]
+    return f"{base}.{safe_label}.{os.getpid()}.{profiles_written}.prof"
+
+
+def load_metrics(path):
+    # every record from a metrics file, for analysis
+    with open(path, 'r') as infile:
+        return [json.loads(line) for line in infile if line.strip()]
+
+
+# worker processes start with the settings the parent enabled
+if os.environ.get(METRICS_ENV):
+    enable(
+        os.environ[METRICS_ENV],
+        profile=bool(os.environ.get(PROFILE_ENV)),
+        segments=bool(os.environ.get(PER_SEGMENT_ENV)),
+    )
@@ -0,0 +1,219 @@
+import argparse
+import csv
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from aev_utils import calculate_incline_array, get_parameters, process_segment
+from power_kernel import ACCELERATION_RESISTANCE, GRAVITY, HALF_AIR_DENSITY
+from sweep import load_route_segments, route_name
+
+# the parameters that only change the power, not how the vehicle moves
+SAMPLED_PARAMETERS = ["mass", "drag", "frontal_area", "rolling_resistance"]
+# limits the speed and acceleration trace depends on
+KINEMATIC_PARAMETERS = ["max_velocity", "max_accel", "max_jerk"]
+
+# how the sampled parameters can be spread, each takes two numbers
+DISTRIBUTIONS = {
+    "normal": lambda rng, mean, sd, count: rng.normal(mean, sd, count),
+    "uniform": lambda rng, low, high, count: rng.uniform(low, high, count),
+    "lognormal": lambda rng, mean, sigma, count: rng.lognormal(np.log(mean), sigma, count),
+}
+
+# most samples x steps worked out at once, keeps a chunk to about 32 MB
+CHUNK_ELEMENTS = 2**22
+
+# speed traces kept from earlier segments, a route repeats a few lengths and
+# one trace is a few kB
+KINEMATIC_CACHE_SIZE = 4096
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Spread of route energy over uncertain vehicle parameters"
+    )
+    parser.add_argument("segments", help="route segments file")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", default=None,
+        help="csv to write every sampled parameter set and its route energy to"
+    )
+    args = parser.parse_args()
+
+    # vehicle design parameters from Julians spreadsheets etc.
+    parameters = get_parameters()
+
+    # spread of each sampled parameter around the design values, parameters
+    # left out stay at their design value
+    distributions = {
+        "mass": ("normal", parameters["mass"], 100),
+        "drag": ("uniform", 0.4, 0.6),
+        "frontal_area": ("normal", parameters["frontal_area"], 0.1),
+        "rolling_resistance": ("uniform", 0.02, 0.04),
+    }
+
+    start_time = time.time()
+    lengths, elev_changes = load_route_segments(args.segments)
+    kinematics = route_kinematics(lengths, elev_changes, parameters)
+    samples = sample_parameters(distributions, args.samples, parameters, args.seed)
+    energies = route_energy_samples(kinematics, samples)
+    statistics = energy_statistics(energies, kinematics["total_length"])
+    print(f"monte carlo took {time.time() - start_time} seconds")
+
+    print(f"{route_name(args.segments)}: {args.samples} samples")
+    for key, value in statistics.items():
+        print(f"{key}: {value}")
+
+    if args.output is not None:
+        write_samples(args.output, samples, energies)
+        print(f"Samples saved to {args.output}")
+
+
+def sample_parameters(distributions, count, parameters=None, seed=0):
+    # count values of every sampled parameter as arrays. distributions maps a
+    # parameter to (distribution, a, b) from DISTRIBUTIONS, the rest are held
+    # at their value in parameters
+    parameters = parameters or get_parameters()
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name in SAMPLED_PARAMETERS:
+        if name in distributions:
+            distribution, a, b = distributions[name]
+            if distribution not in DISTRIBUTIONS:
+                raise ValueError(f"Unknown distribution: {distribution}")
+            samples[name] = DISTRIBUTIONS[distribution](rng, a, b, count)
+        else:
+            samples[name] = np.full(count, float(parameters[name]))
+    for name in distributions:
+        if name not in SAMPLED_PARAMETERS:
+            raise ValueError(
+                f"{name} changes the speed trace, only {SAMPLED_PARAMETERS} can be sampled"
+            )
+    return samples
+
+
+def kinematic_trace(segment_length, parameters):
+    # step lengths (s), speeds and accelerations of one segment. worked out
+    # by process_segment on the flat, as the incline only changes the power
+    return flat_segment_trace(
+        segment_length, *(parameters[name] for name in KINEMATIC_PARAMETERS)
+    )
+
+
+@lru_cache(maxsize=KINEMATIC_CACHE_SIZE)
+def flat_segment_trace(segment_length, max_velocity, max_accel, max_jerk):
+    # the trace only depends on the length and the kinematic limits, so it is
+    # cached on those. the arrays are shared so they are made read only
+    parameters = get_parameters()
+    parameters.update(max_velocity=max_velocity, max_accel=max_accel, max_jerk=max_jerk)
+    segment_df, _, _ = process_segment(segment_length, 0, parameters)
+    time_s = segment_df["time_s"].to_numpy()
+    trace = (
+        np.diff(time_s, prepend=0),
+        segment_df["speed_ms"].to_numpy(),
+        segment_df["acceleration_mss"].to_numpy(),
+    )
+    for values in trace:
+        values.setflags(write=False)
+    return trace
+
+
+def route_kinematics(segment_lengths, segment_elev_changes, parameters):
+    # the speed trace of a whole route reduced to the three sums the energy
+    # of each step is made of. for a step of dt at speed v and acceleration a
+    # on an incline, the energy before clipping at zero is
+    #   aero_factor * v**3 * dt + weight * rolling_resistance * v * dt
+    #   + weight * v * dt * (incline + ACCELERATION_RESISTANCE * a)
+    # which is linear in aero_factor, weight * rolling_resistance and weight,
+    # so every parameter set is a dot product with these three columns.
+    # steps standing still never use energy and are left out
+    inclines = calculate_incline_array(segment_lengths, segment_elev_changes)
+
+    aero = []
+    rolling = []
+    grade = []
+    for segment_length, incline in zip(segment_lengths, inclines):
+        if segment_length <= 0:
+            continue
+        dt, velocity, acceleration = kinematic_trace(float(segment_length), parameters)
+        moving = velocity > 0
+        dt = dt[moving]
+        velocity = velocity[moving]
+        distance = velocity * dt
+        aero.append(np.power(velocity, 3) * dt)
+        rolling.append(distance)
+        grade.append(distance * (incline + ACCELERATION_RESISTANCE * acceleration[moving]))
+
+    return {
+        # steps x 3, one row per step
+        "features": np.column_stack([
+            np.concatenate(aero) if aero else np.empty(0),
+            np.concatenate(rolling) if rolling else np.empty(0),
+            np.concatenate(grade) if grade else np.empty(0),
+        ]),
+        "total_length": float(np.sum(segment_lengths)),
+    }
+
+
+def route_energy_samples(kinematics, samples, chunk_elements=CHUNK_ELEMENTS):
+    # route energy (J) for every sampled parameter set. the samples' power
+    # coefficients times the route's step columns give every step's energy
+    # for every sample as one matrix, only the positive part counts like in
+    # the simulators. samples and steps are taken in chunks so the matrix
+    # stays small
+    aero_factor = HALF_AIR_DENSITY * samples["frontal_area"] * samples["drag"]
+    weight = GRAVITY * samples["mass"]
+    # samples x 3, matching the columns of kinematics["features"]
+    coefficients = np.column_stack([aero_factor, weight * samples["rolling_resistance"], weight])
+
+    features = kinematics["features"]
+    count = len(coefficients)
+    sample_chunk = max(min(count, chunk_elements), 1)
+    step_chunk = max(chunk_elements // sample_chunk, 1)
+
+    energies = np.zeros(count)
+    for sample_start in range(0, count, sample_chunk):
+        sample_end = sample_start + sample_chunk
+        chunk_coefficients = coefficients[sample_start:sample_end]
+        for step_start in range(0, len(features), step_chunk):
+            step_energies = chunk_coefficients @ features[step_start:step_start + step_chunk].T
+            energies[sample_start:sample_end] += np.maximum(step_energies, 0).sum(axis=1)
+    return energies
+
+
+def energy_statistics(energies, total_length=None):
+    # summary of the spread of route energy, plus energy per km if the route
+    # length is given
+    statistics = {
+        "samples": len(energies),
+        "mean_energy_J": float(np.mean(energies)),
+        "std_energy_J": float(np.std(energies)),
+        "min_energy_J": float(np.min(energies)),
+        "p5_energy_J": float(np.percentile(energies, 5)),
+        "median_energy_J": float(np.median(energies)),
+        "p95_energy_J": float(np.percentile(energies, 95)),
+        "max_energy_J": float(np.max(energies)),
+    }
+    if total_length:
+        energy_per_km = energies / (total_length / 1000)
+        statistics.update({
+            "mean_energy_per_km": float(np.mean(energy_per_km)),
+            "p5_energy_per_km": float(np.percentile(energy_per_km, 5)),
+            "p95_energy_per_km": float(np.percentile(energy_per_km, 95)),
+        })
+    return statistics
+
+
+def write_samples(output_file, samples, energies):
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(SAMPLED_PARAMETERS + ["total_energy_J"])
+        writer.writerows(zip(*(samples[name] for name in SAMPLED_PARAMETERS), energies))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import elevations
+import energy
+import extract_segments
+import instrumentation
+import plotting
+import resample
+import route_ingest
+import segments
+import udds_smoothing
+from aev_utils import get_parameters
+from dem import DEMTiles
+
+# hashes of what each stage was last run with
+STATE_FILE = "data/.pipeline_state.json"
+
+
+class Stage:
+    # one step of the pipeline. a stage is re-run when the contents of its
+    # inputs, its code or its parameters change, or when an output is missing
+
+    def __init__(self, name, action, inputs, outputs, args=(), code=(), parameters=None):
+        self.name = name
+        self.action = action
+        self.args = args
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        # source files that change what the stage produces
+        self.code = list(code)
+        self.parameters = parameters
+
+    def fingerprint(self):
+        digest = hashlib.sha256()
+        for path in sorted(self.inputs) + sorted(self.code):
+            digest.update(path.encode())
+            digest.update(file_hash(path).encode())
+        digest.update(json.dumps(self.parameters, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def outputs_exist(self):
+        return all(os.path.exists(path) for path in self.outputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild whatever is out of date")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="re-run every stage")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only list the stages that would run"
+    )
+    parser.add_argument(
+        "--elevation-source", choices=["api", "dem"], default="api",
+        help="look elevations up online or sample the local DEM tiles"
+    )
+    parser.add_argument(
+        "--resample-spacing", type=float, default=None,
+        help="resample each route to a point every this many metres before segmenting"
+    )
+    parser.add_argument(
+        "--assume-built", action="store_true",
+        help="record the current files as up to date without running anything"
+    )
+    parser.add_argument(
+        "--metrics", default=None,
+        help="write stage timings and segment counters to this json lines file"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="also run each stage under cProfile"
+    )
+    args = parser.parse_args()
+
+    if args.metrics:
+        # set before the worker processes start so they inherit it
+        instrumentation.enable(args.metrics, args.profile)
+
+    start_time = time.time()
+    stages = build_stages(args.elevation_source, args.resample_spacing)
+    run_pipeline(stages, args.workers, args.force, args.dry_run, args.assume_built)
+    print(f"pipeline took {time.time() - start_time} seconds")
+
+
+def build_stages(elevation_source="api", resample_spacing=None):
+    # the route chain: elevations -> segments -> energy -> route plots
+    # and the udds chain: udds_smoothing -> extract_segments -> lane plots
+    parameters = get_parameters()
+
+    stages = []
+    # raw routes can be plain latitude,longitude csvs or any file route_ingest reads
+    raw_files = {}
+    for path in sorted(glob.glob("data/raw/route_*.*")):
+        route, extension = os.path.splitext(os.path.basename(path))
+        if extension.lower() in (".csv", ".gpx", ".geojson", ".parquet"):
+            raw_files.setdefault(route, path)
+    routes = sorted(raw_files)
+
+    for route in routes:
+        raw_file = raw_files[route]
+        elev_file = f"data/elevations/{route}_elev.csv"
+
+        if raw_file.endswith(".csv"):
+            if elevation_source == "dem":
+                elevation_action = elevations.sample_dem_elevations
+            else:
+                elevation_action = elevations.lookup_elevations
+            stages.append(Stage(
+                f"elevations_{route}",
+                elevation_action,
+                inputs=[raw_file],
+                outputs=[elev_file],
+                args=(raw_file, elev_file),
+                code=["elevations.py", "dem.py", "elevation_client.py"],
+                parameters=elevation_source,
+            ))
+        else:
+            # elevations in the file are kept, only missing ones are looked up
+            if elevation_source == "dem":
+                elevation_lookup = DEMTiles(elevations.DEM_DIR).sample
+            else:
+                elevation_lookup = None
+            stages.append(Stage(
+                f"ingest_{route}",
+                route_ingest.ingest_route,
+                inputs=[raw_file],
+                outputs=[elev_file],
+                args=(raw_file, elev_file, elevation_lookup),
+                code=["route_ingest.py", "dem.py", "elevation_client.py"],
+                parameters=elevation_source,
+            ))
+
+        segment_input = f"data/elevations/{route}_elev.csv"
+        if resample_spacing is not None:
+            resampled = f"data/elevations/{route}_resampled.csv"
+            stages.append(Stage(
+                f"resample_{route}",
+                resample.resample_route_file,
+                inputs=[segment_input],
+                outputs=[resampled],
+                args=(segment_input, resampled, resample_spacing),
+                code=["resample.py", "segments.py"],
+                parameters=resample_spacing,
+            ))
+            segment_input = resampled
+
+        stages.append(Stage(
+            f"segments_{route}",
+            segments.build_segments,
+            inputs=[segment_input],
+            outputs=[f"data/segments/{route}_segments.csv"],
+            args=(segment_input, f"data/segments/{route}_segments.csv"),
+            code=["segments.py"],
+        ))
+
+    energy_outputs = ["data/results/routes_summary.csv"]
+    for route in routes:
+        energy_outputs += [
+            f"data/results/{route}_energy.csv",
+            f"data/results/{route}_detailed.csv",
+        ]
+    # only the routes declared here, whatever else is in data/segments. one
+    # worker so the stage simulates the routes itself instead of starting a
+    # process pool inside the pipeline's own worker
+    segment_files = [f"data/segments/{route}_segments.csv" for route in routes]
+    stages.append(Stage(
+        "energy",
+        energy.run_routes,
+        inputs=segment_files,
+        outputs=energy_outputs,
+        args=(segment_files, "data/results", parameters, 1),
+        code=["energy.py", "aev_utils.py", "power_kernel.py", "segment_cache.py", "trace_io.py"],
+        parameters=parameters,
+    ))
+
+    stages.append(Stage(
+        "udds_smoothing",
+        udds_smoothing.main,
+        inputs=["data/raw/uddscol.csv"],
+        outputs=["data/processed/udds_processed.csv"],
+        code=["udds_smoothing.py", "drive_cycles.py", "aev_utils.py", "power_kernel.py", "segmentation.py"],
+    ))
+    stages.append(Stage(
+        "extract_segments",
+        extract_segments.main,
+        inputs=["data/processed/udds_processed.csv"],
+        outputs=["data/results/stitched_data.csv"],
+        code=["extract_segments.py", "segmentation.py", "aev_utils.py", "power_kernel.py", "segment_cache.py", "trace_io.py"],
+        parameters=parameters,
+    ))
+
+    # every plot is its own stage so only the plots with changed inputs are
+    # redrawn, and they are drawn in parallel like the other stages
+    plot_specs = [plotting.route_plot(name, routes) for name in plotting.ROUTE_PLOTS]
+    plot_specs += [plotting.lane_plot(name) for name in plotting.LANE_PLOTS]
+    for spec in plot_specs:
+        stages.append(Stage(
+            f"plot_{os.path.splitext(os.path.basename(spec.output))[0]}",
+            plotting.render_plot,
+            inputs=sorted({series.path for series in spec.series}),
+            outputs=[spec.output],
+            args=(spec,),
+            code=["plotting.py", "trace_io.py"],
+        ))
+
+    return stages
+
+
+def run_pipeline(stages, workers=None, force=False, dry_run=False, assume_built=False):
+    # run the stages in dependency order. a stage can start once every stage
+    # producing one of its inputs has finished, so independent branches run
+    # at the same time in the worker processes
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            producers[output] = stage.name
+
+    upstream = {
+        stage.name: {producers[path] for path in stage.inputs if path in producers}
+        for stage in stages
+    }
+    check_for_cycles(stages, upstream)
+
+    state = load_state()
+    stages_by_name = {stage.name: stage for stage in stages}
+    finished = set()
+    running = {}
+    ran = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while len(finished) < len(stages):
+            for stage in stages:
+                if stage.name in finished or stage.name in running:
+                    continue
+                if not upstream[stage.name] <= finished:
+                    continue
+
+                # inputs are final now that everything upstream has finished
+                fingerprint = stage.fingerprint()
+                up_to_date = stage.outputs_exist() and state.get(stage.name) == fingerprint
+
+                if assume_built:
+                    state[stage.name] = fingerprint
+                    finished.add(stage.name)
+                elif up_to_date and not force and not dry_run:
+                    finished.add(stage.name)
+                elif dry_run:
+                    # nothing is rebuilt so count everything downstream as stale too
+                    if up_to_date and not force and not upstream[stage.name] & set(ran):
+                        finished.add(stage.name)
+                        continue
+                    print(f"would run {stage.name}")
+                    ran.append(stage.name)
+                    finished.add(stage.name)
+                else:
+                    print(f"running {stage.name}")
+                    future = executor.submit(
+                        instrumentation.run_stage, stage.name, stage.action, *stage.args
+                    )
+                    running[stage.name] = future
+
+            if not running:
+                continue
+
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future not in done:
+                    continue
+                # let the error stop the pipeline, the state for every stage
+                # that already finished has been saved
+                future.result()
+                del running[name]
+                finished.add(name)
+                ran.append(name)
+                state[name] = stages_by_name[name].fingerprint()
+                save_state(state)
+
+    if assume_built:
+        save_state(state)
+        print(f"Recorded {len(stages)} stages as up to date")
+    elif not ran:
+        print("Everything is up to date")
+
+    return ran
+
+
+def check_for_cycles(stages, upstream):
+    # a stage that depends on itself would never become ready
+    remaining = {stage.name for stage in stages}
+    resolved = set()
+    while remaining:
+        ready = {name for name in remaining if upstream[name] <= resolved}
+        if not ready:
+            raise ValueError(f"Pipeline stages depend on each other: {sorted(remaining)}")
+        resolved |= ready
+        remaining -= ready
+
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return "missing"
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, 'r') as infile:
+        return json.load(infile)
+
+
+def save_state(state):
+    temp_file = f"{STATE_FILE}.tmp"
+    with open(temp_file, 'w') as outfile:
+        json.dump(state, outfile, indent=2, sort_keys=True)
+    os.replace(temp_file, STATE_FILE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib # type: ignore
+matplotlib.use("Agg")  # no display needed, the plots only go to files
+import matplotlib.pyplot as plt # type: ignore
+
+from trace_io import read_trace, trace_path
+
+# unit sizes for the axes, a column is divided by these before plotting
+METRES_PER_KM = 1000
+SECONDS_PER_MINUTE = 60
+JOULES_PER_KWH = 3600000
+
+FIGURE_SIZE = (10, 6)  # inches
+DPI = 300
+# points kept per series for each pixel across the figure. a line cannot
+# show more detail than this so the rest are dropped before drawing
+POINTS_PER_PIXEL = 2
+
+# plots comparing routes: file kind, x column, y column, x unit, x label, title.
+# each one is saved as <name>.png and has one series per route
+ROUTE_PLOTS = {
+    "cumulative_energy": (
+        "energy", "cumulative_length", "cumulative_energy", METRES_PER_KM,
+        "Distance (km)", "energy used over distance travelled",
+    ),
+    "energy_time": (
+        "energy", "cumulative_time", "cumulative_energy", SECONDS_PER_MINUTE,
+        "Time (minutes)", "energy used over time elapsed",
+    ),
+    "energy_distance_detailed": (
+        "detailed", "cumulative_distance", "cumulative_energy_J", METRES_PER_KM,
+        "Distance (km)", "energy used over distance travelled",
+    ),
+    "energy_time_detailed": (
+        "detailed", "time_s", "cumulative_energy_J", SECONDS_PER_MINUTE,
+        "Time (minutes)", "energy used over time elapsed",
+    ),
+}
+
+# plots comparing the stitched simulation with the udds cycle it came from:
+# stitched y column, udds y column, y label, title
+LANE_PLOTS = {
+    "udds_vs_stitched_energy_distance": (
+        "cumulative_energy", "cumulative_energy_J", "Energy (kWh)",
+        "Comparing simulation against UDDS journey by energy over distance",
+    ),
+    "udds_vs_stitched_speed_distance": (
+        "speed_ms", "speed_ms", r"Velocity (m s$^{-1}$)",
+        "Comparing simulation against UDDS journey by velocity over distance",
+    ),
+}
+
+
+class Series:
+    # one line on a plot, column y against column x of the file at path.
+    # style is passed straight on to plt.plot
+    def __init__(self, path, x, y, label=None, style=None):
+        self.path = path
+        self.x = x
+        self.y = y
+        self.label = label
+        self.style = style or {}
+
+
+class PlotSpec:
+    # everything needed to draw one plot. x_unit and y_unit are how much of
+    # the column makes one unit on the axis, e.g. METRES_PER_KM to plot a
+    # distance in metres as km. max_points is how many points each series is
+    # cut down to, by default POINTS_PER_PIXEL for every pixel across
+    def __init__(
+        self, output, series, title=None, xlabel=None, ylabel=None,
+        x_unit=1, y_unit=1, figsize=FIGURE_SIZE, dpi=DPI, max_points=None
+    ):
+        self.output = output
+        self.series = series
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.x_unit = x_unit
+        self.y_unit = y_unit
+        self.figsize = figsize
+        self.dpi = dpi
+        if max_points is None:
+            max_points = int(POINTS_PER_PIXEL * figsize[0] * dpi)
+        self.max_points = max_points
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw the route and lane plots")
+    parser.add_argument(
+        "routes", nargs="*",
+        help="routes to compare, defaults to every route with results"
+    )
+    parser.add_argument("--results-dir", default="data/results")
+    parser.add_argument("--plot-dir", default="plots")
+    parser.add_argument(
+        "--detail-format", default="csv",
+        help="file format of the detailed traces, csv, parquet, feather or npz"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="number of plots drawn at the same time"
+    )
+    args = parser.parse_args()
+
+    routes = args.routes or find_routes(args.results_dir)
+
+    start_time = time.time()
+    specs = report_specs(routes, args.results_dir, args.plot_dir, args.detail_format)
+    render_plots(specs, args.workers)
+    print(f"plotting took {time.time() - start_time} seconds")
+
+
+def find_routes(results_dir="data/results"):
+    # every route energy.py has written results for
+    return sorted(
+        os.path.basename(path)[:-len("_energy.csv")]
+        for path in glob.glob(os.path.join(results_dir, "*_energy.csv"))
+    )
+
+
+def route_label(route):
+    # route_a -> Route A
+    return route.replace("_", " ").title()
+
+
+def route_plot(
+    name, routes, results_dir="data/results", plot_dir="plots/route", detail_format="csv"
+):
+    # spec for one of ROUTE_PLOTS with a line for each route
+    kind, x, y, x_unit, xlabel, description = ROUTE_PLOTS[name]
+    series = []
+    for route in routes:
+        path = os.path.join(results_dir, f"{route}_{kind}.csv")
+        if kind == "detailed":
+            path = trace_path(os.path.join(results_dir, f"{route}_detailed"), detail_format)
+        series.append(Series(path, x, y, route_label(route)))
+
+    return PlotSpec(
+        os.path.join(plot_dir, f"{name}.png"), series,
+        title=f"Comparison of {len(routes)} routes using {description}",
+        xlabel=xlabel, ylabel="Energy (kWh)",
+        x_unit=x_unit, y_unit=JOULES_PER_KWH,
+    )
+
+
+def lane_plot(
+    name, stitched_file="data/results/stitched_data.csv",
+    udds_file="data/processed/udds_processed.csv", plot_dir="plots/lane"
+):
+    # spec for one of LANE_PLOTS, the stitched simulation over the udds cycle
+    stitched_y, udds_y, ylabel, title = LANE_PLOTS[name]
+    series = [
+        Series(stitched_file, "cumulative_distance", stitched_y, "Simulated Route", {"linewidth": 2}),
+        Series(
+            udds_file, "cumulative_distance", udds_y, "UDDS Reference",
+            {"linewidth": 2, "linestyle": "--"}
+        ),
+    ]
+    return PlotSpec(
+        os.path.join(plot_dir, f"{name}.png"), series,
+        title=title, xlabel="Distance (km)", ylabel=ylabel, x_unit=METRES_PER_KM,
+    )
+
+
+def report_specs(routes, results_dir="data/results", plot_dir="plots", detail_format="csv"):
+    # every route plot for the routes and both lane plots
+    specs = [
+        route_plot(name, routes, results_dir, os.path.join(plot_dir, "route"), detail_format)
+        for name in ROUTE_PLOTS
+    ]
+    specs += [
+        lane_plot(
+            name, os.path.join(results_dir, "stitched_data.csv"),
+            plot_dir=os.path.join(plot_dir, "lane")
+        )
+        for name in LANE_PLOTS
+    ]
+    return specs
+
+
+def render_plots(specs, workers=None):
+    # draw every plot in parallel worker processes, returns the files written
+    if workers == 1 or len(specs) <= 1:
+        return [render_plot(spec) for spec in specs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_plot, spec) for spec in specs]
+        return [future.result() for future in futures]
+
+
+def render_plot(spec):
+    # read only the columns each series needs, thin every series down to
+    # spec.max_points and save the plot to spec.output
+    columns = {}
+    for series in spec.series:
+        columns.setdefault(series.path, set()).update((series.x, series.y))
+    # a file with several series on the plot is only read once
+    data = {path: read_trace(path, columns=sorted(names)) for path, names in columns.items()}
+
+    figure, axes = plt.subplots(figsize=spec.figsize)
+    for series in spec.series:
+        x = data[series.path][series.x].to_numpy(dtype=float) / spec.x_unit
+        y = data[series.path][series.y].to_numpy(dtype=float) / spec.y_unit
+        x, y = downsample(x, y, spec.max_points)
+        axes.plot(x, y, label=series.label, **series.style)
+
+    if spec.title:
+        axes.set_title(spec.title)
+    if spec.xlabel:
+        axes.set_xlabel(spec.xlabel)
+    if spec.ylabel:
+        axes.set_ylabel(spec.ylabel)
+    if any(series.label for series in spec.series):
+        axes.legend()
+    axes.grid(True)
+    figure.tight_layout()
+
+    os.makedirs(os.path.dirname(spec.output) or ".", exist_ok=True)
+    figure.savefig(spec.output, dpi=spec.dpi)
+    plt.close(figure)
+
+    print(f"Output plot to {spec.output}.")
+    return spec.output
+
+
+def downsample(x, y, points):
+    # drop the samples that would not be drawn (NaN) then cut the series down
+    # to at most points with lttb, so the drawn line keeps its shape
+    keep = ~(np.isnan(x) | np.isnan(y))
+    if not keep.all():
+        x = x[keep]
+        y = y[keep]
+    if len(x) <= points:
+        return x, y
+    selected = lttb(x, y, points)
+    return x[selected], y[selected]
+
+
+def lttb(x, y, points):
+    # largest triangle three buckets. keeps the first and last sample and
+    # splits the rest into points - 2 buckets. from each bucket it keeps the
+    # sample making the biggest triangle with the one kept from the bucket
+    # before and the average of the bucket after, so peaks, dips and the
+    # corners where the line changes direction survive. returns the indices
+    # of the samples to keep
+    count = len(x)
+    if points >= count or points < 3:
+        return np.arange(count)
+
+    # bucket b covers edges[b] to edges[b + 1], the first and last samples
+    # are not in any bucket
+    edges = np.linspace(1, count - 1, points - 1).astype(np.intp)
+    bucket_sizes = np.diff(edges)
+    average_x = np.add.reduceat(x[:count - 1], edges[:-1]) / bucket_sizes
+    average_y = np.add.reduceat(y[:count - 1], edges[:-1]) / bucket_sizes
+    # the last bucket looks ahead to the last sample
+    next_x = np.append(average_x[1:], x[-1])
+    next_y = np.append(average_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start = edges[bucket]
+        end = edges[bucket + 1]
+        previous_x = x[previous]
+        previous_y = y[previous]
+        # twice the triangle area, only the largest matters
+        areas = np.abs(
+            (previous_x - next_x[bucket]) * (y[start:end] - previous_y)
+            - (previous_x - x[start:end]) * (next_y[bucket] - previous_y)
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+if __name__ == "__main__":
+    main()
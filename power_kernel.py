@@ -0,0 +1,44 @@
+import numpy as np
+
+# constants of the power equation from Julian's document
+HALF_AIR_DENSITY = 0.6125  # kg/m^3, half of 1.225
+GRAVITY = 9.81  # m/s/s
+# extra resistance per m/s/s of acceleration
+ACCELERATION_RESISTANCE = 0.107
+
+
+class PowerKernel:
+    # road load power and energy for one set of vehicle parameters. the
+    # constants are worked out once here so a call does no dict lookups, and
+    # every method takes scalars or numpy arrays of any shape. this is the
+    # one copy of the power equation, everything else should go through it
+
+    def __init__(self, parameters):
+        self.aero_factor = HALF_AIR_DENSITY * parameters["frontal_area"] * parameters["drag"]
+        self.weight = GRAVITY * parameters["mass"]
+        self.rolling_resistance = parameters["rolling_resistance"]
+
+    def power(self, acceleration, velocity, incline=0):
+        # power at the wheels, negative when the vehicle could give energy back.
+        # np.power even for scalars so single steps and arrays agree to the bit
+        return self.aero_factor * np.power(velocity, 3) + self.weight * velocity * (
+            self.rolling_resistance + incline + ACCELERATION_RESISTANCE * acceleration
+        )
+
+    def positive_energy(self, power, dt):
+        # energy drawn over dt, negative power counts as nothing. a NaN power
+        # (no step before the first sample of a cycle) stays NaN
+        if isinstance(power, float):
+            return max(power * dt, 0)
+        return np.maximum(power * dt, 0)
+
+    def regen_energy(self, power, dt):
+        # energy that could be given back over dt, zero or negative
+        if isinstance(power, float):
+            return min(power * dt, 0)
+        return np.minimum(power * dt, 0)
+
+    def energy(self, acceleration, velocity, dt, incline=0):
+        # power, positive energy and regenerative energy in one call
+        power = self.power(acceleration, velocity, incline)
+        return power, self.positive_energy(power, dt), self.regen_energy(power, dt)
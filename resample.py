@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from segments import segment_arrays, equirectangular_distance
+
+# waypoints handled at a time when streaming a long route
+CHUNK_POINTS = 100000
+
+
+def main():
+    input_csv = "data/elevations/route_c_elev.csv"
+    output_csv = "data/elevations/route_c_resampled.csv"
+
+    # distance between resampled points in metres
+    spacing = 10.0
+
+    resample_route_file(input_csv, output_csv, spacing)
+
+
+def resample_route_file(
+    input_csv, output_csv, spacing=10.0, elevation_sampler=None, chunk_points=CHUNK_POINTS
+):
+    # densify a latitude,longitude,elevation file so that segments.py gets a
+    # point every `spacing` metres instead of only the original waypoints.
+    # the file is read chunk_points waypoints at a time
+    first_chunk = True
+    with open(output_csv, 'w', newline='') as outfile:
+        for latitudes, longitudes, elevations in densify_stream(
+            read_chunks(input_csv, chunk_points), spacing, elevation_sampler
+        ):
+            pd.DataFrame({
+                'latitude': latitudes,
+                'longitude': longitudes,
+                'elevation': elevations,
+            }).to_csv(outfile, index=False, header=first_chunk, lineterminator='\r\n')
+            first_chunk = False
+
+    print(f"Resampled route saved to: {output_csv}")
+
+
+def read_chunks(input_csv, chunk_points=CHUNK_POINTS):
+    # latitude, longitude, elevation arrays from a points file, chunk_points
+    # rows at a time. densify_stream carries the last waypoint of each chunk
+    # over to the next, so the chunks themselves do not overlap
+    with pd.read_csv(
+        input_csv, usecols=['latitude', 'longitude', 'elevation'],
+        float_precision='round_trip', chunksize=chunk_points
+    ) as reader:
+        for chunk in reader:
+            yield (
+                chunk['latitude'].to_numpy(dtype=float),
+                chunk['longitude'].to_numpy(dtype=float),
+                chunk['elevation'].to_numpy(dtype=float),
+            )
+
+
+def densify_route(latitudes, longitudes, elevations, spacing=10.0, elevation_sampler=None):
+    # whole route version of densify_stream, returns the resampled points
+    chunks = list(densify_stream(
+        [(latitudes, longitudes, elevations)], spacing, elevation_sampler
+    ))
+    return tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+def densify_stream(chunks, spacing=10.0, elevation_sampler=None):
+    # resample a polyline given as chunks of (latitudes, longitudes, elevations)
+    # so there is a point every `spacing` metres along it, plus the final point.
+    # positions are interpolated linearly along the distance travelled. the
+    # elevation is interpolated the same way unless an elevation_sampler such
+    # as dem.DEMTiles(...).sample is given, which is then called on the new
+    # points so the extra resolution picks up real changes in the ground.
+    # only one chunk is held at a time, the last waypoint and the distance
+    # travelled are carried over so the spacing runs on across chunk boundaries
+    carry = None
+    distance_so_far = 0
+    last_target = None
+
+    for latitudes, longitudes, elevations in chunks:
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        elevations = np.asarray(elevations, dtype=float)
+        if len(latitudes) == 0:
+            continue
+
+        if carry is not None:
+            # start from the last waypoint of the previous chunk
+            latitudes = np.concatenate([[carry[0]], latitudes])
+            longitudes = np.concatenate([[carry[1]], longitudes])
+            elevations = np.concatenate([[carry[2]], elevations])
+
+        distances = distance_so_far + np.concatenate([[0], np.cumsum(
+            equirectangular_distance(
+                latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]
+            )
+        )])
+
+        # every multiple of the spacing that falls inside this chunk and was
+        # not already produced at the end of the previous one
+        first = np.ceil(distances[0] / spacing)
+        if last_target is not None and first * spacing <= last_target:
+            first += 1
+        targets = np.arange(first, np.floor(distances[-1] / spacing) + 1) * spacing
+
+        carry = (latitudes[-1], longitudes[-1], elevations[-1])
+        distance_so_far = distances[-1]
+
+        if len(targets):
+            last_target = targets[-1]
+            yield interpolate_along(
+                distances, latitudes, longitudes, elevations, targets, elevation_sampler
+            )
+
+    # always finish on the final waypoint
+    if carry is not None and last_target != distance_so_far:
+        yield interpolate_along(
+            np.array([distance_so_far]), np.array([carry[0]]), np.array([carry[1]]),
+            np.array([carry[2]]), np.array([distance_so_far]), elevation_sampler
+        )
+
+
+def interpolate_along(distances, latitudes, longitudes, elevations, targets, elevation_sampler=None):
+    new_latitudes = np.interp(targets, distances, latitudes)
+    new_longitudes = np.interp(targets, distances, longitudes)
+    if elevation_sampler is not None:
+        new_elevations = np.asarray(elevation_sampler(new_latitudes, new_longitudes), dtype=float)
+    else:
+        new_elevations = np.interp(targets, distances, elevations)
+    return new_latitudes, new_longitudes, new_elevations
+
+
+def resampled_segments(chunks, spacing=10.0, elevation_sampler=None, max_grade_change=None):
+    # segment lengths and elevation changes for a resampled route, one chunk
+    # at a time, ready for process_segments_batch or solve_segments_profile.
+    # with max_grade_change the fine segments are joined back up for as long
+    # as their grade stays within max_grade_change of the grade the joined
+    # segment started with, so only the parts of the route where the grade
+    # really changes end up with short segments. a joined segment still open
+    # at the end of a chunk carries on into the next one.
+    # process_segment runs every segment from a standstill to a stop, so short
+    # segments are only realistic where the vehicle really does stop that often
+    previous = None
+    open_run = None
+    for latitudes, longitudes, elevations in densify_stream(chunks, spacing, elevation_sampler):
+        if previous is not None:
+            # the first segment of this chunk starts at the last point of the previous one
+            latitudes = np.concatenate([[previous[0]], latitudes])
+            longitudes = np.concatenate([[previous[1]], longitudes])
+            elevations = np.concatenate([[previous[2]], elevations])
+        previous = (latitudes[-1], longitudes[-1], elevations[-1])
+
+        if len(latitudes) < 2:
+            continue
+
+        segment_lengths, elevation_changes = segment_arrays(latitudes, longitudes, elevations)
+
+        if max_grade_change is not None:
+            segment_lengths, elevation_changes, open_run = merge_grade_runs(
+                segment_lengths, elevation_changes, max_grade_change, open_run
+            )
+            if len(segment_lengths) == 0:
+                continue
+
+        yield segment_lengths, elevation_changes
+
+    if open_run is not None:
+        yield np.array([open_run[0]]), np.array([open_run[1]])
+
+
+def merge_by_grade(segment_lengths, elevation_changes, max_grade_change):
+    # join neighbouring segments for as long as their grade stays within
+    # max_grade_change of the first one's, so the grade inside a joined
+    # segment never varies by more than that from where it started
+    segment_lengths, elevation_changes, open_run = merge_grade_runs(
+        segment_lengths, elevation_changes, max_grade_change
+    )
+    if open_run is not None:
+        segment_lengths = np.append(segment_lengths, open_run[0])
+        elevation_changes = np.append(elevation_changes, open_run[1])
+    return segment_lengths, elevation_changes
+
+
+def merge_grade_runs(segment_lengths, elevation_changes, max_grade_change, open_run=None):
+    # merge_by_grade for one chunk of a route. open_run is the joined segment
+    # still open from the previous chunk as (length, elevation change, grade
+    # it started with), or None. returns the joined segments that are
+    # finished and the one left open at the end of this chunk.
+    # zero length segments have no grade and join whichever segment is open
+    merged_lengths = []
+    merged_changes = []
+    if open_run is None:
+        run_length, run_change, start_grade = 0.0, 0.0, None
+    else:
+        run_length, run_change, start_grade = open_run
+
+    # a joined segment only ends once a grade strays from its first one, so
+    # this has to go one segment after the other
+    for length, change in zip(
+        np.asarray(segment_lengths, dtype=float).tolist(),
+        np.asarray(elevation_changes, dtype=float).tolist(),
+    ):
+        if length > 0:
+            grade = change / length
+            if start_grade is None:
+                start_grade = grade
+            elif abs(grade - start_grade) > max_grade_change:
+                merged_lengths.append(run_length)
+                merged_changes.append(run_change)
+                run_length, run_change, start_grade = 0.0, 0.0, grade
+        run_length += length
+        run_change += change
+        open_run = (run_length, run_change, start_grade)
+
+    return np.array(merged_lengths), np.array(merged_changes), open_run
+
+
+if __name__ == "__main__":
+    main()
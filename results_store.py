@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from segment_cache import parameters_hash
+from trace_io import TraceWriter, read_trace, trace_format, trace_metadata, trace_path
+
+STORE_DIR = "data/store"
+INDEX_FILE = "index.sqlite"
+# traces are kept in a columnar format so single columns load quickly
+STORE_TRACE_FORMAT = "feather"
+# seconds a worker waits for another process writing to the index
+LOCK_TIMEOUT = 60
+# rows of a csv trace converted at a time when it is stored
+TRACE_CHUNK_ROWS = 100000
+# parameter values held fixed in a query match stored values this close,
+# relative to the value, so a value that went through a float sum still matches
+PARAMETER_TOLERANCE = 1e-9
+
+# per segment results kept for every run, besides the segment ids
+SEGMENT_COLUMNS = ['segment_length', 'segment_elev_change', 'segment_time', 'segment_energy']
+
+# route totals kept for every run, any of them can be queried against a parameter
+RUN_TOTALS = ['segments', 'total_length', 'total_time', 'total_energy', 'energy_per_km']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    route TEXT NOT NULL,
+    method TEXT NOT NULL,
+    parameters_hash TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    segments INTEGER NOT NULL,
+    total_length REAL NOT NULL,
+    total_time REAL NOT NULL,
+    total_energy REAL NOT NULL,
+    energy_per_km REAL NOT NULL,
+    trace_file TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_route ON runs (route, parameters_hash);
+
+CREATE TABLE IF NOT EXISTS run_parameters (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS run_parameters_value ON run_parameters (name, value);
+
+CREATE TABLE IF NOT EXISTS segments (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    segment_index INTEGER NOT NULL,
+    segment_id TEXT,
+    segment_length REAL NOT NULL,
+    segment_elev_change REAL NOT NULL,
+    segment_time REAL NOT NULL,
+    segment_energy REAL NOT NULL,
+    PRIMARY KEY (run_id, segment_index)
+);
+"""
+
+
+class ResultsStore:
+    # every simulation run kept side by side instead of overwriting the last
+    # one. a sqlite index holds each run's route, parameters, code version,
+    # route totals and per segment summary, so comparing runs never opens a
+    # detailed trace. detailed traces go in store_dir/traces as feather files
+    # named after the run. several worker processes can record runs at once,
+    # sqlite makes each one wait for the others
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        os.makedirs(os.path.join(store_dir, "traces"), exist_ok=True)
+        self.connection = sqlite3.connect(
+            os.path.join(store_dir, INDEX_FILE), timeout=LOCK_TIMEOUT
+        )
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def record_run(
+        self, route, parameters, segments, method="detailed", trace_file=None, code_version=None
+    ):
+        # add one route run. segments is the per segment results, a list of
+        # dicts like energy.py's or a dict of columns, with segment_length,
+        # segment_elev_change, segment_time, segment_energy and optionally
+        # segment_id. trace_file is copied into the store. returns the run id
+        segments = pd.DataFrame(segments)
+        if segments.empty:
+            # a route with no segments is still a run, with zero totals
+            segments = pd.DataFrame(columns=SEGMENT_COLUMNS, dtype=float)
+        if 'segment_id' not in segments:
+            segments['segment_id'] = np.arange(1, len(segments) + 1)
+
+        total_length = float(segments['segment_length'].sum())
+        total_energy = float(segments['segment_energy'].sum())
+        run = {
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'route': route,
+            'method': method,
+            'parameters_hash': parameters_hash(parameters),
+            'parameters': json.dumps(parameters, sort_keys=True),
+            'code_version': code_version or git_commit(),
+            'segments': len(segments),
+            'total_length': total_length,
+            'total_time': float(segments['segment_time'].sum()),
+            'total_energy': total_energy,
+            'energy_per_km': total_energy / (total_length / 1000) if total_length else 0,
+        }
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO runs ({', '.join(run)}) VALUES ({', '.join('?' * len(run))})",
+                list(run.values()),
+            )
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO run_parameters VALUES (?, ?, ?)",
+                [
+                    (run_id, name, value) for name, value in sorted(parameters.items())
+                    if isinstance(value, (int, float))
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                zip(
+                    [run_id] * len(segments), range(len(segments)),
+                    segments['segment_id'].astype(str),
+                    segments['segment_length'].astype(float),
+                    segments['segment_elev_change'].astype(float),
+                    segments['segment_time'].astype(float),
+                    segments['segment_energy'].astype(float),
+                ),
+            )
+
+        if trace_file is not None:
+            stored = self.store_trace(run_id, trace_file, trace_metadata(parameters, route))
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE runs SET trace_file = ? WHERE run_id = ?", (stored, run_id)
+                )
+
+        return run_id
+
+    def store_trace(self, run_id, trace_file, metadata):
+        # a columnar trace is copied as it is, a csv one is converted once
+        # here, TRACE_CHUNK_ROWS at a time so a long route is never all in memory
+        stored = trace_path(
+            os.path.join(self.store_dir, "traces", str(run_id)), STORE_TRACE_FORMAT
+        )
+        if trace_format(trace_file) == STORE_TRACE_FORMAT:
+            shutil.copyfile(trace_file, stored)
+            return stored
+
+        if trace_format(trace_file) == "csv":
+            columns = pd.read_csv(trace_file, nrows=0).columns
+            chunks = pd.read_csv(
+                trace_file, chunksize=TRACE_CHUNK_ROWS, float_precision='round_trip'
+            )
+        else:
+            chunks = [read_trace(trace_file)]
+            columns = chunks[0].columns
+        # the trace is already on the route's time line, so it is copied as is.
+        # an empty trace still gets its columns
+        with TraceWriter(stored, metadata, time_column=None, columns=columns) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        return stored
+
+    def runs(self, route=None, latest=False, **parameters):
+        # runs as a dataframe with one column per numeric parameter. filter on
+        # route and parameter values, e.g. runs("route_b", mass=1350).
+        # latest=True keeps only the newest run of each route, method and
+        # parameter set
+        conditions, values = run_filters(route, latest, parameters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        runs = pd.read_sql_query(
+            f"SELECT * FROM runs {where} ORDER BY run_id", self.connection, params=values
+        )
+        if runs.empty:
+            return runs
+
+        run_parameters = pd.read_sql_query(
+            "SELECT run_id, name, value FROM run_parameters "
+            f"WHERE run_id IN (SELECT run_id FROM runs {where})",
+            self.connection, params=values,
+        ).pivot(index='run_id', columns='name', values='value')
+        return runs.join(run_parameters, on='run_id')
+
+    def compare(self, parameter, route=None, metric='energy_per_km', latest=True, **parameters):
+        # a route total against one parameter across every stored run, e.g.
+        # energy per km for route_b for every mass value, straight from the
+        # index. other parameters can be held at a value, e.g. drag=0.5.
+        # parameter names are only ever bound as values, never put in the sql
+        if metric not in RUN_TOTALS:
+            raise ValueError(f"Unknown metric: {metric}, use one of {RUN_TOTALS}")
+
+        conditions, values = run_filters(route, latest, parameters)
+        conditions.insert(0, "p.name = ?")
+        values.insert(0, parameter)
+
+        comparison = pd.read_sql_query(
+            f"SELECT runs.route, runs.method, p.value, runs.{metric}, runs.run_id FROM runs "
+            "JOIN run_parameters AS p ON p.run_id = runs.run_id "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY runs.route, p.value, runs.run_id",
+            self.connection, params=values,
+        )
+        return comparison.rename(columns={'value': parameter})
+
+    def segments(self, run_id):
+        # the per segment summary of one run
+        return pd.read_sql_query(
+            "SELECT segment_id, segment_length, segment_elev_change, segment_time, "
+            "segment_energy FROM segments WHERE run_id = ? ORDER BY segment_index",
+            self.connection, params=[run_id],
+        )
+
+    def parameters(self, run_id):
+        row = self.connection.execute(
+            "SELECT parameters FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No run {run_id}")
+        return json.loads(row[0])
+
+    def trace(self, run_id, columns=None):
+        # the detailed trace of one run, only reading the columns asked for
+        row = self.connection.execute(
+            "SELECT trace_file FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            raise KeyError(f"No trace stored for run {run_id}")
+        return read_trace(row[0], columns=columns)
+
+
+def run_filters(route=None, latest=False, parameters=None):
+    # sql conditions on the runs table and their values
+    conditions = []
+    values = []
+    if route is not None:
+        conditions.append("runs.route = ?")
+        values.append(route)
+    for name, value in (parameters or {}).items():
+        tolerance = PARAMETER_TOLERANCE * max(abs(value), 1)
+        conditions.append(
+            "EXISTS (SELECT 1 FROM run_parameters AS fixed "
+            "WHERE fixed.run_id = runs.run_id AND fixed.name = ? "
+            "AND fixed.value BETWEEN ? AND ?)"
+        )
+        values += [name, value - tolerance, value + tolerance]
+    if latest:
+        conditions.append(
+            "runs.run_id IN (SELECT MAX(run_id) FROM runs "
+            "GROUP BY route, method, parameters_hash)"
+        )
+    return conditions, values
+
+
+def parse_fixed(pairs):
+    # ["drag=0.5", "mass=1350"] -> {"drag": 0.5, "mass": 1350.0}
+    fixed = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        fixed[name] = float(value)
+    return fixed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look through stored simulation runs")
+    parser.add_argument("--store", default=STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    runs_parser = commands.add_parser("runs", help="list the stored runs")
+    runs_parser.add_argument("--route")
+    runs_parser.add_argument("--latest", action="store_true")
+    runs_parser.add_argument("--where", nargs="*", help="parameter values, e.g. mass=1350")
+
+    compare_parser = commands.add_parser(
+        "compare", help="a route total against one parameter across runs"
+    )
+    compare_parser.add_argument("parameter", help="e.g. mass")
+    compare_parser.add_argument("--route")
+    compare_parser.add_argument("--metric", default="energy_per_km", choices=RUN_TOTALS)
+    compare_parser.add_argument(
+        "--all-runs", action="store_true", help="include older runs of the same parameters"
+    )
+    compare_parser.add_argument("--where", nargs="*", help="hold parameters, e.g. drag=0.5")
+
+    args = parser.parse_args()
+
+    with ResultsStore(args.store) as store:
+        if args.command == "runs":
+            runs = store.runs(args.route, args.latest, **parse_fixed(args.where))
+            runs = runs.drop(columns=['parameters'], errors='ignore')
+        else:
+            runs = store.compare(
+                args.parameter, args.route, args.metric, not args.all_runs,
+                **parse_fixed(args.where)
+            )
+    print(runs.to_string(index=False))
+
+
+@lru_cache(maxsize=None)
+def git_commit():
+    # short hash of the checked out commit, marked when there are local changes
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+if __name__ == "__main__":
+    main()
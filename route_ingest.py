@@ -0,0 +1,213 @@
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+# points per chunk handed on to the next stage
+CHUNK_POINTS = 100000
+
+
+def main():
+    input_path = "data/raw/route_c.gpx"
+    output_csv = "data/elevations/route_c_elev.csv"
+
+    ingest_route(input_path, output_csv)
+
+
+def ingest_route(input_path, output_csv, elevation_lookup=None, chunk_points=CHUNK_POINTS):
+    # stream a route file into a latitude,longitude,elevation csv ready for
+    # segments.py. elevations in the file are used as they are, points without
+    # one are passed to elevation_lookup(latitudes, longitudes), which defaults
+    # to the online elevation service
+    if elevation_lookup is None:
+        elevation_lookup = lookup_online
+
+    first_chunk = True
+    point_count = 0
+    looked_up = 0
+    with open(output_csv, 'w', newline='') as outfile:
+        for latitudes, longitudes, elevations in read_route(input_path, chunk_points):
+            missing = np.isnan(elevations)
+            if missing.any():
+                elevations[missing] = elevation_lookup(latitudes[missing], longitudes[missing])
+                looked_up += missing.sum()
+
+            pd.DataFrame({
+                'latitude': latitudes,
+                'longitude': longitudes,
+                'elevation': elevations,
+            }).to_csv(outfile, index=False, header=first_chunk, lineterminator='\r\n')
+            first_chunk = False
+            point_count += len(latitudes)
+
+    print(f"{point_count} points read, {looked_up} elevations looked up")
+    print(f"New file written: {output_csv}")
+
+
+def lookup_online(latitudes, longitudes):
+    # imported here so reading files with elevations works without aiohttp
+    import elevation_client
+    return elevation_client.lookup(latitudes, longitudes)
+
+
+def read_route(input_path, chunk_points=CHUNK_POINTS):
+    # chunks of (latitudes, longitudes, elevations) arrays from any supported
+    # route file, elevations are NaN where the file does not have them
+    extension = os.path.splitext(input_path)[1].lower()
+    readers = {
+        ".gpx": read_gpx,
+        ".geojson": read_geojson,
+        ".json": read_geojson,
+        ".parquet": read_parquet,
+        ".csv": read_csv,
+    }
+    if extension not in readers:
+        raise ValueError(f"Unsupported route file type: {input_path}")
+    return readers[extension](input_path, chunk_points)
+
+
+class ChunkBuffer:
+    # fixed size arrays that points are written into one at a time, handed
+    # out as a chunk whenever they fill up
+
+    def __init__(self, chunk_points):
+        self.latitudes = np.empty(chunk_points)
+        self.longitudes = np.empty(chunk_points)
+        self.elevations = np.empty(chunk_points)
+        self.count = 0
+
+    def add(self, latitude, longitude, elevation):
+        self.latitudes[self.count] = latitude
+        self.longitudes[self.count] = longitude
+        self.elevations[self.count] = elevation
+        self.count += 1
+        return self.count == len(self.latitudes)
+
+    def take(self):
+        # copies so the buffer can be reused for the next chunk
+        chunk = (
+            self.latitudes[:self.count].copy(),
+            self.longitudes[:self.count].copy(),
+            self.elevations[:self.count].copy(),
+        )
+        self.count = 0
+        return chunk
+
+
+def read_gpx(input_path, chunk_points=CHUNK_POINTS):
+    # track and route points from a gpx file. parsed as a stream of xml events
+    # and every finished point is cleared, so memory stays flat however long
+    # the track is
+    buffer = ChunkBuffer(chunk_points)
+
+    context = ET.iterparse(input_path, events=("start", "end"))
+    _, root = next(context)
+
+    for event, element in context:
+        if event != "end" or local_name(element.tag) not in ("trkpt", "rtept"):
+            continue
+
+        elevation = np.nan
+        for child in element:
+            if local_name(child.tag) == "ele" and child.text:
+                elevation = float(child.text)
+                break
+
+        full = buffer.add(float(element.get("lat")), float(element.get("lon")), elevation)
+
+        # drop the finished point and anything else parsed so far
+        element.clear()
+        root.clear()
+
+        if full:
+            yield buffer.take()
+
+    if buffer.count:
+        yield buffer.take()
+
+
+def local_name(tag):
+    # tag without its xml namespace
+    return tag.rsplit("}", 1)[-1]
+
+
+def read_geojson(input_path, chunk_points=CHUNK_POINTS):
+    # points of every LineString in a geojson file, whether it is a bare
+    # geometry, a Feature or a FeatureCollection. positions are [lon, lat] or
+    # [lon, lat, elevation]. read with ijson as a stream of parser events so
+    # the whole file is never loaded
+    import ijson
+
+    buffer = ChunkBuffer(chunk_points)
+    position = []
+
+    with open(input_path, 'rb') as infile:
+        for prefix, event, value in ijson.parse(infile):
+            # LineString positions sit two array levels below "coordinates"
+            if event == "start_array" and prefix.endswith("coordinates.item"):
+                position = []
+            elif event == "number" and prefix.endswith("coordinates.item.item"):
+                position.append(float(value))
+            elif event == "end_array" and prefix.endswith("coordinates.item"):
+                # anything else (points, polygons, multi lines) is not a route
+                if len(position) < 2:
+                    continue
+                elevation = position[2] if len(position) > 2 else np.nan
+                if buffer.add(position[1], position[0], elevation):
+                    yield buffer.take()
+
+    if buffer.count:
+        yield buffer.take()
+
+
+def read_parquet(input_path, chunk_points=CHUNK_POINTS):
+    # latitude, longitude and optional elevation columns, read a batch at a time
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(input_path)
+    columns = ['latitude', 'longitude']
+    has_elevation = 'elevation' in parquet_file.schema_arrow.names
+    if has_elevation:
+        columns.append('elevation')
+
+    for batch in parquet_file.iter_batches(batch_size=chunk_points, columns=columns):
+        yield batch_arrays(
+            batch.column(0).to_numpy(zero_copy_only=False),
+            batch.column(1).to_numpy(zero_copy_only=False),
+            batch.column(2).to_numpy(zero_copy_only=False) if has_elevation else None,
+        )
+
+
+def read_csv(input_path, chunk_points=CHUNK_POINTS):
+    # latitude, longitude and optional elevation columns, read a chunk at a time
+    header = pd.read_csv(input_path, nrows=0).columns
+    columns = ['latitude', 'longitude']
+    has_elevation = 'elevation' in header
+    if has_elevation:
+        columns.append('elevation')
+
+    for chunk in pd.read_csv(
+        input_path, usecols=columns, chunksize=chunk_points, float_precision='round_trip'
+    ):
+        yield batch_arrays(
+            chunk['latitude'].to_numpy(),
+            chunk['longitude'].to_numpy(),
+            chunk['elevation'].to_numpy() if has_elevation else None,
+        )
+
+
+def batch_arrays(latitudes, longitudes, elevations=None):
+    # float arrays for a chunk, missing elevations as NaN
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if elevations is None:
+        elevations = np.full(len(latitudes), np.nan)
+    else:
+        # nulls come through as NaN so those points are looked up
+        elevations = np.array(elevations, dtype=float)
+    return latitudes, longitudes, elevations
+
+
+if __name__ == "__main__":
+    main()
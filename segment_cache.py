@@ -0,0 +1,214 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+from functools import lru_cache
+
+import aev_utils
+import power_kernel
+from aev_utils import process_segment
+
+# modules whose source decides what process_segment returns, cached results
+# are kept apart by a hash of it so a change to the simulator never reuses them
+SIMULATOR_MODULES = [aev_utils, power_kernel]
+
+# the on-disk tier is cut back to this size, oldest used entries first
+MAX_DISK_BYTES = 2 * 1024**3
+# saves between checks of the on-disk tier's size
+PRUNE_INTERVAL = 1000
+# file a cache leaves in each simulator version directory it creates, prune
+# only ever removes directories that have it
+VERSION_MARKER = ".segment_cache"
+
+
+class SegmentCache:
+    # cache of simulated segments keyed on the parameter set and the segment
+    # length and elevation change rounded to a tolerance. recently used results
+    # are kept in memory and every result is also saved to disk so that it
+    # survives between runs. the disk tier lives under a directory named after
+    # the simulator version and is pruned back to max_disk_bytes. cache_dir=None
+    # keeps everything in memory
+
+    def __init__(
+        self,
+        cache_dir="data/cache/segments",
+        max_memory_entries=1024,
+        length_tolerance=0.001,
+        elev_tolerance=0.001,
+        max_disk_bytes=MAX_DISK_BYTES,
+    ):
+        self.root_dir = cache_dir
+        self.cache_dir = None
+        if cache_dir is not None:
+            self.cache_dir = os.path.join(cache_dir, simulator_version())
+        self.max_memory_entries = max_memory_entries
+        self.length_tolerance = length_tolerance
+        self.elev_tolerance = elev_tolerance
+        self.max_disk_bytes = max_disk_bytes
+
+        self.memory = OrderedDict()
+        self.saves_since_prune = 0
+        self.marked = False
+
+        # counters for how the lookups went
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def process_segment(
+        self, segment_length, segment_elev_change, parameters, record_trace=True
+    ):
+        # same as aev_utils.process_segment but reusing earlier results. the
+        # rounded length and elevation change only find the entry, a miss is
+        # simulated at the exact values. a hit can come from a nearby segment
+        # so results are only as close as the tolerances
+        length_steps = round(segment_length / self.length_tolerance)
+        elev_steps = round(segment_elev_change / self.elev_tolerance)
+        key = (parameters_hash(parameters), length_steps, elev_steps)
+
+        entry = self.memory.get(key)
+        if entry is not None and (entry[0] is not None or not record_trace):
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return copy_entry(entry)
+
+        entry = self.load(key)
+        if entry is not None and (entry[0] is not None or not record_trace):
+            self.disk_hits += 1
+            self.remember(key, entry)
+            return copy_entry(entry)
+
+        self.misses += 1
+        entry = process_segment(
+            segment_length, segment_elev_change, parameters, record_trace=record_trace
+        )
+        self.remember(key, entry)
+        self.save(key, entry)
+        return copy_entry(entry)
+
+    def remember(self, key, entry):
+        # add to the in memory tier, dropping the least recently used entry
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def entry_path(self, key):
+        params_hash, length_steps, elev_steps = key
+        return os.path.join(
+            self.cache_dir, params_hash, f"{length_steps}_{elev_steps}.pkl"
+        )
+
+    def load(self, key):
+        if self.cache_dir is None:
+            return None
+
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as infile:
+                entry = pickle.load(infile)
+        except FileNotFoundError:
+            # not cached, or pruned by another process
+            return None
+        # mark it used so pruning drops the least recently used entries
+        os.utime(path)
+        return entry
+
+    def save(self, key, entry):
+        if self.cache_dir is None:
+            return
+
+        if not self.marked:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            open(os.path.join(self.cache_dir, VERSION_MARKER), "a").close()
+            self.marked = True
+
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first so a crash never leaves half a file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as outfile:
+            pickle.dump(entry, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+        self.saves_since_prune += 1
+        if self.saves_since_prune >= PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self):
+        # remove entries from older simulator versions, then the least
+        # recently used entries until the disk tier fits in max_disk_bytes.
+        # anything in cache_dir a segment cache did not create is left alone.
+        # returns the number of files removed
+        if self.cache_dir is None:
+            return 0
+        self.saves_since_prune = 0
+
+        current = os.path.basename(self.cache_dir)
+        if os.path.isdir(self.root_dir):
+            for name in os.listdir(self.root_dir):
+                path = os.path.join(self.root_dir, name)
+                if name != current and os.path.exists(os.path.join(path, VERSION_MARKER)):
+                    shutil.rmtree(path, ignore_errors=True)
+
+        files = []
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name == VERSION_MARKER:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((status.st_mtime, status.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0,
+        }
+
+
+def parameters_hash(parameters):
+    # short stable hash of a parameters dict from get_parameters()
+    text = json.dumps(parameters, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def simulator_version():
+    # short hash of the simulator source, changes whenever the code does
+    digest = hashlib.sha256()
+    for module in SIMULATOR_MODULES:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()[:16]
+
+
+def copy_entry(entry):
+    # callers change the trace in place, so never hand out the cached one
+    segment_df, segment_energy, segment_time = entry
+    if segment_df is not None:
+        segment_df = segment_df.copy()
+    return segment_df, segment_energy, segment_time
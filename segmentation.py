@@ -0,0 +1,100 @@
+import numpy as np
+
+
+def find_runs(is_stopped):
+    # run length encode a boolean stopped flag. returns the start and end
+    # (exclusive) index of every run of equal values, and whether each run is
+    # stopped. the boundaries come from one comparison of neighbouring
+    # samples, so a week of logged samples costs no more than a few array passes
+    is_stopped = np.asarray(is_stopped, dtype=bool)
+    if len(is_stopped) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=bool)
+
+    boundaries = np.flatnonzero(is_stopped[1:] != is_stopped[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(is_stopped)]])
+    return starts, ends, is_stopped[starts]
+
+
+def run_views(columns, start, end):
+    # the samples of one run from a dict of column arrays, as views not copies
+    return {name: values[start:end] for name, values in columns.items()}
+
+
+def stitch_runs(
+    columns, starts, ends, stopped, simulate_moving, output_columns,
+    time_column="time_s", run_column="segment_number", time_gap=1,
+    capacity=None, cumulative_columns=None
+):
+    # put a drive cycle back together with every moving run replaced by a
+    # simulated one. columns is a dict of input arrays, simulate_moving(views)
+    # is called with run_views of each moving run and returns a dict of
+    # arrays (or a dataframe) for the simulated run. stopped runs are copied
+    # through unchanged. every run is written straight into one set of
+    # preallocated output arrays, each run's time carries on from the end of
+    # the last one plus time_gap, and run_column numbers the runs from 1.
+    # output columns a run does not have are left as NaN. capacity is the
+    # expected number of output rows, the arrays double if it is too small.
+    # cumulative_columns maps a cumulative column to the incremental column
+    # it sums over the whole output, skipping NaNs like a pandas cumsum.
+    # returns a dict of output column arrays trimmed to the rows written
+    output_columns = list(output_columns)
+    if capacity is None:
+        capacity = len(columns[time_column])
+    output = allocate_output(output_columns, max(capacity, 1))
+
+    row = 0
+    time_offset = 0
+    for run_number, (start, end, run_stopped) in enumerate(zip(starts, ends, stopped), start=1):
+        views = run_views(columns, start, end)
+        if run_stopped:
+            run = dict(views)
+            # the run keeps its own sample spacing, starting from zero
+            run[time_column] = views[time_column] - views[time_column][0]
+        else:
+            run = simulate_moving(views)
+
+        run_rows = len(run[time_column])
+        if run_rows == 0:
+            continue
+        while row + run_rows > len(output[time_column]):
+            output = grow_output(output)
+
+        for name in output_columns:
+            if name == run_column:
+                output[name][row:row + run_rows] = run_number
+            elif name == time_column:
+                output[name][row:row + run_rows] = time_offset + np.asarray(run[name])
+            elif name in run:
+                output[name][row:row + run_rows] = np.asarray(run[name])
+            else:
+                output[name][row:row + run_rows] = np.nan
+
+        time_offset = output[time_column][row + run_rows - 1] + time_gap
+        row += run_rows
+
+    output = {name: values[:row] for name, values in output.items()}
+    if run_column in output:
+        output[run_column] = output[run_column].astype(np.int64)
+
+    for cumulative, incremental in (cumulative_columns or {}).items():
+        values = output[incremental]
+        running = np.nancumsum(values)
+        running[np.isnan(values)] = np.nan
+        output[cumulative] = running
+
+    return output
+
+
+def allocate_output(output_columns, rows):
+    return {name: np.empty(rows) for name in output_columns}
+
+
+def grow_output(output):
+    # double the size of every output column, keeping the rows so far
+    rows = len(next(iter(output.values())))
+    grown = allocate_output(output, 2 * rows)
+    for name, values in output.items():
+        grown[name][:rows] = values
+    return grown
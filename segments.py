@@ -1,55 +1,191 @@
-import csv
 import math
 
+import numpy as np
+import pandas as pd
+
 def main():
     input_csv = "data/elevations/route_c_elev.csv"
     output_csv = "data/segments/route_c_segments.csv"
 
-    points = []
-    with open(input_csv, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            points.append({'latitude': float(row['latitude']),
-                           'longitude': float(row['longitude']),
-                           'elevation': float(row['elevation'])
-                           })
-            
-    segments = []
-    for i in range(len(points) -1):
-        start = points[i]
-        end = points[i + 1]
-        distance = coords_to_distance(start['latitude'],
-                                      start['longitude'],
-                                      end['latitude'],
-                                      end['longitude']
-                                      )
-        elevation_change = end['elevation'] - start['elevation']
-
-        segments.append({'segment_number': i + 1,
-                         'start_latitude': start['latitude'],
-                         'start_longitude': start['longitude'],
-                         'start_elevation': start['elevation'],
-                         'end_latitude': end['latitude'],
-                         'end_longitude': end['longitude'],
-                         'end_elevation': end['elevation'],
-                         'segment_length': distance,
-                         'segment_elev_change': elevation_change
-                         })
-    with open(output_csv, mode='w', newline='') as csvfile:
-        fieldnames = [
-            'segment_number',
-            'start_latitude', 'start_longitude', 'start_elevation',
-            'end_latitude', 'end_longitude', 'end_elevation',
-            'segment_length', 'segment_elev_change'
-        ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for segment in segments:
-            writer.writerow(segment)
+    # "equirectangular", "haversine" or "vincenty" (most accurate)
+    distance_method = "equirectangular"
+    # include the elevation change in the segment length
+    slope_distance = False
+
+    build_segments(input_csv, output_csv, distance_method, slope_distance)
+
+
+def build_segments(input_csv, output_csv, method="equirectangular", slope_distance=False):
+    points = pd.read_csv(
+        input_csv, usecols=['latitude', 'longitude', 'elevation'], float_precision='round_trip'
+    )
+    latitudes = points['latitude'].to_numpy(dtype=float)
+    longitudes = points['longitude'].to_numpy(dtype=float)
+    elevations = points['elevation'].to_numpy(dtype=float)
+
+    segment_lengths, elevation_changes = segment_arrays(
+        latitudes, longitudes, elevations, method, slope_distance
+    )
+
+    segments = pd.DataFrame({
+        'segment_number': np.arange(1, len(segment_lengths) + 1),
+        'start_latitude': latitudes[:-1],
+        'start_longitude': longitudes[:-1],
+        'start_elevation': elevations[:-1],
+        'end_latitude': latitudes[1:],
+        'end_longitude': longitudes[1:],
+        'end_elevation': elevations[1:],
+        'segment_length': segment_lengths,
+        'segment_elev_change': elevation_changes
+    })
+    # same line endings as the csv module used to write
+    segments.to_csv(output_csv, index=False, lineterminator='\r\n')
 
     print(f"Segments saved to: {output_csv}")
 
 
+def segment_arrays(latitudes, longitudes, elevations, method="equirectangular", slope_distance=False):
+    # segment lengths and elevation changes between consecutive points.
+    # method picks the accuracy: "equirectangular" is the original flat
+    # approximation, "haversine" uses a spherical earth and "vincenty" the
+    # WGS84 ellipsoid. slope_distance adds the climb to the length
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    elevations = np.asarray(elevations, dtype=float)
+
+    distance_functions = {
+        "equirectangular": equirectangular_distance,
+        "haversine": haversine_distance,
+        "vincenty": vincenty_distance,
+    }
+    if method not in distance_functions:
+        raise ValueError(f"Unknown distance method: {method}")
+
+    segment_lengths = distance_functions[method](
+        latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]
+    )
+    elevation_changes = np.diff(elevations)
+
+    if slope_distance:
+        segment_lengths = np.sqrt(segment_lengths**2 + elevation_changes**2)
+
+    return segment_lengths, elevation_changes
+
+
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    # array version of coords_to_distance, same maths
+    earth_radius = 6371000
+
+    latitude_distance = (lat2 - lat1)
+    longitude_distance = (lon2 - lon1)
+
+    latitude_metres = ((2 * math.pi * earth_radius)/360) * latitude_distance
+    longitude_metres = ((2 * math.pi * earth_radius)/360) * np.cos(lat1*math.pi/180) * longitude_distance
+
+    return np.sqrt(latitude_metres**2 + longitude_metres**2)
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    # great circle distance on a sphere
+    earth_radius = 6371000
+
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    half_dlat = (lat2 - lat1) / 2
+    half_dlon = np.radians(lon2 - lon1) / 2
+
+    a = np.sin(half_dlat)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(half_dlon)**2
+    return 2 * earth_radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def vincenty_distance(lat1, lon1, lat2, lon2, max_iterations=200, tolerance=1e-12):
+    # distance on the WGS84 ellipsoid with vincenty's inverse formula, all
+    # pairs iterate together and stop updating once they have converged.
+    # nearly antipodal points can fail to converge, they fall back to haversine
+    semi_major = 6378137.0
+    flattening = 1 / 298.257223563
+    semi_minor = (1 - flattening) * semi_major
+
+    lat1 = np.asarray(lat1, dtype=float)
+    lat2 = np.asarray(lat2, dtype=float)
+    lon_difference = np.radians(np.asarray(lon2, dtype=float) - lon1)
+
+    # reduced latitudes
+    u1 = np.arctan((1 - flattening) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - flattening) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = lon_difference.copy()
+    active = np.ones(lam.shape, dtype=bool)
+
+    sin_sigma = np.zeros(lam.shape)
+    cos_sigma = np.ones(lam.shape)
+    sigma = np.zeros(lam.shape)
+    cos_sq_alpha = np.ones(lam.shape)
+    cos_2sigma_m = np.zeros(lam.shape)
+
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+
+        sin_lam = np.sin(lam[active])
+        cos_lam = np.cos(lam[active])
+        a_sin_u1, a_cos_u1 = sin_u1[active], cos_u1[active]
+        a_sin_u2, a_cos_u2 = sin_u2[active], cos_u2[active]
+
+        s_sigma = np.sqrt(
+            (a_cos_u2 * sin_lam)**2
+            + (a_cos_u1 * a_sin_u2 - a_sin_u1 * a_cos_u2 * cos_lam)**2
+        )
+        c_sigma = a_sin_u1 * a_sin_u2 + a_cos_u1 * a_cos_u2 * cos_lam
+        sig = np.arctan2(s_sigma, c_sigma)
+
+        # coincident points have no direction, leave them at zero distance
+        safe_s_sigma = np.where(s_sigma == 0, 1, s_sigma)
+        sin_alpha = np.where(s_sigma == 0, 0, a_cos_u1 * a_cos_u2 * sin_lam / safe_s_sigma)
+        c_sq_alpha = 1 - sin_alpha**2
+
+        # points on the equator have cos_sq_alpha of zero
+        safe_c_sq_alpha = np.where(c_sq_alpha == 0, 1, c_sq_alpha)
+        c_2sigma_m = np.where(
+            c_sq_alpha == 0, 0, c_sigma - 2 * a_sin_u1 * a_sin_u2 / safe_c_sq_alpha
+        )
+
+        c = flattening / 16 * c_sq_alpha * (4 + flattening * (4 - 3 * c_sq_alpha))
+        new_lam = lon_difference[active] + (1 - c) * flattening * sin_alpha * (
+            sig + c * s_sigma * (c_2sigma_m + c * c_sigma * (-1 + 2 * c_2sigma_m**2))
+        )
+
+        converged = np.abs(new_lam - lam[active]) <= tolerance
+
+        indices = np.flatnonzero(active)
+        lam[indices] = new_lam
+        sin_sigma[indices] = s_sigma
+        cos_sigma[indices] = c_sigma
+        sigma[indices] = sig
+        cos_sq_alpha[indices] = c_sq_alpha
+        cos_2sigma_m[indices] = c_2sigma_m
+
+        active[indices[converged]] = False
+
+    u_sq = cos_sq_alpha * (semi_major**2 - semi_minor**2) / semi_minor**2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (
+        cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+            - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2)
+        )
+    )
+    distance = semi_minor * big_a * (sigma - delta_sigma)
+
+    if active.any():
+        distance[active] = haversine_distance(lat1, lon1, lat2, lon2)[active]
+
+    return distance
+
+
 def coords_to_distance(lat1, lon1, lat2, lon2):
     # radius of the earth in m
     earth_radius = 6371000
@@ -0,0 +1,178 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from aev_utils import get_parameters, process_segments_batch, solve_segments_profile
+from segments import segment_arrays
+
+
+def main():
+    input_csv = "data/elevations/route_c_elev.csv"
+    output_csv = "data/elevations/route_c_simplified.csv"
+
+    # how far the simplified route may stray from the original sideways (m)
+    horizontal_tolerance = 5.0
+    # how much the grade of a simplified leg may differ from the original, None to ignore grade
+    grade_tolerance = 0.02
+
+    points = pd.read_csv(
+        input_csv, usecols=['latitude', 'longitude', 'elevation'],
+        float_precision='round_trip'
+    )
+    latitudes = points['latitude'].to_numpy(dtype=float)
+    longitudes = points['longitude'].to_numpy(dtype=float)
+    elevations = points['elevation'].to_numpy(dtype=float)
+
+    keep = simplify_route(
+        latitudes, longitudes, elevations, horizontal_tolerance, grade_tolerance
+    )
+    points[keep].to_csv(output_csv, index=False, lineterminator='\r\n')
+    print(f"Kept {keep.sum()} of {len(keep)} points, saved to {output_csv}")
+
+    report = energy_error(latitudes, longitudes, elevations, keep, get_parameters())
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+def simplify_route(latitudes, longitudes, elevations, horizontal_tolerance=5.0, grade_tolerance=None):
+    # ramer-douglas-peucker on a lat/lon/elevation polyline. returns a boolean
+    # mask of the points to keep. a leg is split at its worst point while any
+    # point is further than horizontal_tolerance from the straight leg, or
+    # while splitting there would change the grade by more than grade_tolerance.
+    # all the legs still being split are handled together in one set of array
+    # operations per pass, so the number of passes only grows with the depth
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    elevations = np.asarray(elevations, dtype=float)
+
+    point_count = len(latitudes)
+    keep = np.zeros(point_count, dtype=bool)
+    if point_count == 0:
+        return keep
+    keep[[0, -1]] = True
+
+    x, y = local_metres(latitudes, longitudes)
+    # distance along the original route, used for the grades
+    along = np.concatenate([[0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+
+    starts = np.array([0])
+    ends = np.array([point_count - 1])
+
+    while len(starts):
+        # only legs with points between their ends can be split
+        inner_counts = ends - starts - 1
+        has_inner = inner_counts > 0
+        starts, ends, inner_counts = starts[has_inner], ends[has_inner], inner_counts[has_inner]
+        if len(starts) == 0:
+            break
+
+        # every inner point of every leg laid out in one array
+        leg_offsets = np.cumsum(inner_counts) - inner_counts
+        leg_ids = np.repeat(np.arange(len(starts)), inner_counts)
+        indices = starts[leg_ids] + 1 + np.arange(inner_counts.sum()) - leg_offsets[leg_ids]
+        first = starts[leg_ids]
+        last = ends[leg_ids]
+
+        error = point_segment_distance(
+            x[indices], y[indices], x[first], y[first], x[last], y[last]
+        ) / horizontal_tolerance
+
+        if grade_tolerance is not None:
+            grade_error = split_grade_error(
+                along[first], elevations[first], along[indices], elevations[indices],
+                along[last], elevations[last]
+            )
+            error = np.maximum(error, grade_error / grade_tolerance)
+
+        # worst point of each leg, first one if there is a tie
+        worst = np.maximum.reduceat(error, leg_offsets)
+        is_worst = error == worst[leg_ids]
+        worst_legs, worst_positions = np.unique(leg_ids[is_worst], return_index=True)
+        split_points = indices[is_worst][worst_positions]
+
+        # split the legs that are out of tolerance
+        to_split = worst[worst_legs] > 1
+        split_legs = worst_legs[to_split]
+        split_points = split_points[to_split]
+        keep[split_points] = True
+
+        starts = np.concatenate([starts[split_legs], split_points])
+        ends = np.concatenate([split_points, ends[split_legs]])
+
+    return keep
+
+
+def local_metres(latitudes, longitudes):
+    # flat x/y in metres around the middle of the route, fine for the short
+    # distances a single leg covers
+    earth_radius = 6371000
+    metres_per_degree = (2 * math.pi * earth_radius) / 360
+    mid_latitude = np.mean(latitudes)
+
+    x = (longitudes - longitudes[0]) * metres_per_degree * math.cos(math.radians(mid_latitude))
+    y = (latitudes - latitudes[0]) * metres_per_degree
+    return x, y
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    # distance from each point to the straight leg between a and b
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx**2 + dy**2
+    safe_length_sq = np.where(length_sq == 0, 1, length_sq)
+    t = np.where(length_sq == 0, 0, ((px - ax) * dx + (py - ay) * dy) / safe_length_sq)
+    t = np.clip(t, 0, 1)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def split_grade_error(start_along, start_elev, point_along, point_elev, end_along, end_elev):
+    # how far the grades either side of a point are from the grade of the whole leg
+    leg_grade = safe_grade(end_elev - start_elev, end_along - start_along)
+    before_grade = safe_grade(point_elev - start_elev, point_along - start_along)
+    after_grade = safe_grade(end_elev - point_elev, end_along - point_along)
+    return np.maximum(np.abs(before_grade - leg_grade), np.abs(after_grade - leg_grade))
+
+
+def safe_grade(rise, run):
+    safe_run = np.where(run == 0, 1, run)
+    return np.where(run == 0, 0, rise / safe_run)
+
+
+def energy_error(latitudes, longitudes, elevations, keep, parameters, summary_method="batched"):
+    # simulate the full and simplified routes and compare them. every segment
+    # is driven from a stop to a stop, so fewer segments also means fewer stops
+    totals = {}
+    for name, mask in (("full", slice(None)), ("simplified", keep)):
+        segment_lengths, elevation_changes = segment_arrays(
+            latitudes[mask], longitudes[mask], elevations[mask]
+        )
+        if summary_method == "closed_form":
+            segment_energies, segment_times = solve_segments_profile(
+                segment_lengths, elevation_changes, parameters
+            )
+        else:
+            segment_energies, segment_times = process_segments_batch(
+                segment_lengths, elevation_changes, parameters
+            )
+        totals[name] = (len(segment_lengths), np.sum(segment_energies), np.sum(segment_times))
+
+    full_segments, full_energy, full_time = totals["full"]
+    simple_segments, simple_energy, simple_time = totals["simplified"]
+
+    return {
+        "full_segments": full_segments,
+        "simplified_segments": simple_segments,
+        "full_energy": float(full_energy),
+        "simplified_energy": float(simple_energy),
+        "energy_difference": float(simple_energy - full_energy),
+        "relative_energy_difference": float(
+            (simple_energy - full_energy) / full_energy if full_energy else 0
+        ),
+        "full_time": float(full_time),
+        "simplified_time": float(simple_time),
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from aev_utils import (
+    VEHICLE_PARAMETERS, get_parameters, process_segments_batch, solve_segments_profile
+)
+from results_store import ResultsStore, parameters_hash
+
+# jobs handed to a worker in one go, keeps the pool overhead small when
+# each job only takes a few milliseconds
+JOBS_PER_TASK = 16
+
+# routes loaded once per worker process by load_worker_routes
+worker_routes = {}
+
+
+def main():
+    # values to try for any of the keys in VEHICLE_PARAMETERS, every
+    # combination is run on every route. keys left out keep their default
+    parameter_grid = {
+        "mass": [1200, 1350, 1500],
+        "drag": [0.4, 0.5, 0.6],
+        "frontal_area": [2.4, 2.646],
+    }
+
+    route_files = [
+        "data/segments/route_a_segments.csv",
+        "data/segments/route_b_segments.csv",
+        "data/segments/route_c_segments.csv",
+    ]
+    output_file = "data/results/sweep_summary.csv"
+
+    # "batched" matches energy.py, "closed_form" solves each segment's motion
+    # profile directly, several times quicker and within a percent or two
+    summary_method = "batched"
+    workers = os.cpu_count()
+    # results store every job is also recorded in, None to only write the csv
+    store_dir = None
+
+    start_time = time.time()
+    run_sweep(parameter_grid, route_files, output_file, summary_method, workers, store_dir)
+    print(f"sweep took {time.time() - start_time} seconds")
+
+
+def run_sweep(
+    parameter_grid, route_files, output_file, summary_method="batched", workers=None,
+    store_dir=None
+):
+    # run every (parameter set, route) job over a process pool. finished jobs
+    # are appended to the output file straight away, so running the same sweep
+    # again after an interruption only runs the jobs that are missing. with
+    # store_dir each job's totals and per segment results are also recorded
+    # in that ResultsStore, by this process so the workers never wait on it
+    swept_keys = sorted(parameter_grid)
+    for key in swept_keys:
+        if key not in VEHICLE_PARAMETERS:
+            raise ValueError(f"Unknown vehicle parameter: {key}")
+
+    fieldnames = (
+        ['job_id', 'route'] + swept_keys
+        + ['total_length', 'total_time', 'total_energy', 'energy_per_km']
+    )
+
+    finished = load_finished_jobs(output_file, fieldnames)
+    store = ResultsStore(store_dir) if store_dir is not None else None
+    # a sweep killed between checkpointing rows and recording them leaves
+    # finished jobs the store is missing, those are run again for the store
+    stored = load_stored_jobs(store, summary_method)
+
+    routes = {route_name(route_file): route_file for route_file in route_files}
+    jobs = []
+    unstored = set()
+    for parameters in expand_grid(parameter_grid):
+        for route in routes:
+            job_id = make_job_id(route, parameters, swept_keys)
+            if job_id not in finished:
+                jobs.append((job_id, route, parameters))
+            elif store is not None and (route, parameters_hash(parameters)) not in stored:
+                jobs.append((job_id, route, parameters))
+                unstored.add(job_id)
+
+    print(
+        f"{len(finished)} jobs already done, {len(jobs)} to run"
+        + (f" ({len(unstored)} only for the store)" if unstored else "")
+    )
+    if not jobs:
+        if store is not None:
+            store.close()
+        return
+
+    tasks = [jobs[i:i + JOBS_PER_TASK] for i in range(0, len(jobs), JOBS_PER_TASK)]
+    parameters_by_job = {job_id: parameters for job_id, _, parameters in jobs}
+
+    write_header = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+    with open(output_file, 'a', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        if write_header:
+            writer.writeheader()
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=load_worker_routes,
+            initargs=(routes,),
+        ) as executor:
+            futures = [
+                executor.submit(run_jobs, task, swept_keys, summary_method, store is not None)
+                for task in tasks
+            ]
+            done = 0
+            for future in as_completed(futures):
+                rows = future.result()
+                job_segments = [row.pop('segments', None) for row in rows]
+                writer.writerows(row for row in rows if row['job_id'] not in unstored)
+                # flush so the rows count as checkpointed if the sweep is killed
+                outfile.flush()
+                # only recorded once checkpointed, so a killed sweep never
+                # runs and records a job the store already has again
+                if store is not None:
+                    for row, segments in zip(rows, job_segments):
+                        store.record_run(
+                            row['route'], parameters_by_job[row['job_id']],
+                            segments, method=summary_method
+                        )
+                done += len(rows)
+                print(f"{done}/{len(jobs)} jobs done")
+
+    if store is not None:
+        store.close()
+        print(f"Sweep runs recorded in {store_dir}")
+    print(f"Sweep summary saved to {output_file}")
+
+
+def expand_grid(parameter_grid):
+    # every combination of the grid values on top of the default parameters
+    keys = sorted(parameter_grid)
+    for values in itertools.product(*(parameter_grid[key] for key in keys)):
+        parameters = get_parameters()
+        parameters.update(zip(keys, values))
+        yield parameters
+
+
+def make_job_id(route, parameters, swept_keys):
+    # readable id that is the same every time the sweep is run
+    values = ",".join(f"{key}={parameters[key]!r}" for key in swept_keys)
+    return f"{route}|{values}"
+
+
+def route_name(route_file):
+    # data/segments/route_a_segments.csv -> route_a
+    return os.path.basename(route_file).replace("_segments.csv", "")
+
+
+def load_finished_jobs(output_file, fieldnames):
+    # job ids already written by an earlier run of the same sweep
+    if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+        return set()
+
+    drop_partial_row(output_file)
+
+    with open(output_file, 'r', newline='') as infile:
+        reader = csv.DictReader(infile)
+        if reader.fieldnames != fieldnames:
+            raise ValueError(
+                f"{output_file} was written by a different sweep, "
+                "move it or choose another output file"
+            )
+        return {row['job_id'] for row in reader}
+
+
+def load_stored_jobs(store, summary_method):
+    # (route, parameters hash) of every run of this method already in the store
+    if store is None:
+        return set()
+    runs = store.runs()
+    if runs.empty:
+        return set()
+    runs = runs[runs['method'] == summary_method]
+    return set(zip(runs['route'], runs['parameters_hash']))
+
+
+def drop_partial_row(output_file):
+    # a sweep killed mid write can leave half a row at the end of the file,
+    # cut the file back to the last complete line so the job is run again
+    with open(output_file, 'rb+') as outfile:
+        contents = outfile.read()
+        if contents.endswith(b"\n"):
+            return
+        outfile.truncate(contents.rfind(b"\n") + 1)
+
+
+def load_route_segments(route_file):
+    lengths = []
+    elev_changes = []
+    with open(route_file, 'r') as infile:
+        reader = csv.DictReader(infile)
+        for row in reader:
+            lengths.append(float(row['segment_length']))
+            elev_changes.append(float(row['segment_elev_change']))
+    return np.array(lengths), np.array(elev_changes)
+
+
+def load_worker_routes(routes):
+    # runs once in each worker so the route files are not re-read per job
+    for route, route_file in routes.items():
+        worker_routes[route] = load_route_segments(route_file)
+
+
+def run_jobs(jobs, swept_keys, summary_method, keep_segments=False):
+    # keep_segments adds each job's per segment results to its row as
+    # 'segments', for the results store
+    rows = []
+    for job_id, route, parameters in jobs:
+        lengths, elev_changes = worker_routes[route]
+
+        if summary_method == "batched":
+            segment_energies, segment_times = process_segments_batch(
+                lengths, elev_changes, parameters
+            )
+        elif summary_method == "closed_form":
+            segment_energies, segment_times = solve_segments_profile(
+                lengths, elev_changes, parameters
+            )
+        else:
+            raise ValueError(f"Unknown summary method: {summary_method}")
+
+        total_length = float(np.sum(lengths))
+        total_energy = float(np.sum(segment_energies))
+
+        row = {'job_id': job_id, 'route': route}
+        row.update({key: parameters[key] for key in swept_keys})
+        row.update({
+            'total_length': total_length,
+            'total_time': float(np.sum(segment_times)),
+            'total_energy': total_energy,
+            'energy_per_km': total_energy / (total_length / 1000) if total_length else 0,
+        })
+        if keep_segments:
+            row['segments'] = {
+                'segment_length': lengths,
+                'segment_elev_change': elev_changes,
+                'segment_time': segment_times,
+                'segment_energy': segment_energies,
+            }
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from aev_utils import (
+    MIN_MACRO_STEPS, get_parameters, process_segment, process_segment_adaptive, resample_trace
+)
+
+
+SEGMENTS = [
+    (length, elev_change)
+    for length in [0.5, 5, 20, 50, 120, 500, 2000, 3000]
+    for elev_change in [0, -15, 25]
+]
+
+
+@pytest.fixture
+def parameters():
+    return get_parameters()
+
+
+@pytest.mark.parametrize("segment_length, segment_elev_change", SEGMENTS)
+def test_totals_match_fixed_steps(segment_length, segment_elev_change, parameters):
+    _, energy, time = process_segment(segment_length, segment_elev_change, parameters)
+    _, adaptive_energy, adaptive_time = process_segment_adaptive(
+        segment_length, segment_elev_change, parameters
+    )
+    assert adaptive_energy == energy
+    assert adaptive_time == time
+
+
+@pytest.mark.parametrize("segment_length, segment_elev_change", SEGMENTS)
+def test_resampled_trace_matches_fixed_steps(segment_length, segment_elev_change, parameters):
+    fixed, energy, _ = process_segment(segment_length, segment_elev_change, parameters)
+    adaptive, _, _ = process_segment_adaptive(segment_length, segment_elev_change, parameters)
+    resampled = resample_trace(adaptive)
+
+    # compare at the fixed steps' times, the final steps may fall differently.
+    # inside a row held at max acceleration or braking the energy is spread
+    # over the steps, so it only matches to within the row's curvature
+    times = fixed["time_s"].to_numpy()
+
+    def at_fixed_times(column):
+        return np.interp(
+            times, np.concatenate([[0], resampled["time_s"]]),
+            np.concatenate([[0], resampled[column]])
+        )
+
+    np.testing.assert_allclose(at_fixed_times("speed_ms"), fixed["speed_ms"], atol=1e-9)
+    np.testing.assert_allclose(
+        at_fixed_times("cumulative_distance"), fixed["cumulative_distance"],
+        atol=1e-9 * segment_length
+    )
+    np.testing.assert_allclose(
+        at_fixed_times("cumulative_energy_J"), fixed["cumulative_energy_J"],
+        atol=1e-4 * max(energy, 1)
+    )
+
+
+def test_long_segments_take_fewer_rows(parameters):
+    fixed, _, _ = process_segment(2000, 0, parameters)
+    adaptive, _, _ = process_segment_adaptive(2000, 0, parameters)
+    assert len(adaptive) < len(fixed) / 5
+
+
+def test_acceleration_and_braking_are_macro_stepped(parameters):
+    # holding max acceleration or braking spans many rows of at most 1 m/s
+    # each, instead of one row per fixed step
+    fixed, _, _ = process_segment(5000, 0, parameters)
+    adaptive, _, _ = process_segment_adaptive(5000, 0, parameters)
+    max_velocity = parameters["max_velocity"]
+    for trace in (fixed, adaptive):
+        assert trace["speed_ms"].max() == pytest.approx(max_velocity)
+
+    def changing_speed_rows(trace):
+        return int((trace["acceleration_mss"] != 0).sum())
+
+    fixed_rows = changing_speed_rows(fixed)
+    adaptive_rows = changing_speed_rows(adaptive)
+    assert adaptive_rows < fixed_rows / 5
+    # 0 to max velocity and back at 1 m/s a row, with the jerk ramps and
+    # the steps around the start of braking taken one at a time
+    assert adaptive_rows < 2 * max_velocity + 2 * MIN_MACRO_STEPS + 40
+    assert len(adaptive) < 100
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from aev_utils import get_parameters, process_segment, process_segments_batch
+
+# flat, uphill and downhill, from under a metre (a single fractional step)
+# up to segments that cruise for minutes
+SEGMENTS = [
+    (length, length * grade)
+    for length in [0.0, 0.01, 0.3, 0.99, 5.0, 50.0, 120.0, 500.0, 3000.0]
+    for grade in [0.0, 0.05, -0.05, -0.15]
+]
+
+
+@pytest.fixture
+def parameters():
+    return get_parameters()
+
+
+def test_matches_process_segment(parameters):
+    lengths = np.array([length for length, _ in SEGMENTS])
+    elev_changes = np.array([elev_change for _, elev_change in SEGMENTS])
+    energies, times = process_segments_batch(lengths, elev_changes, parameters)
+
+    for (length, elev_change), energy, time in zip(SEGMENTS, energies, times):
+        _, expected_energy, expected_time = process_segment(length, elev_change, parameters)
+        # the same steps summed in the same order
+        assert energy == expected_energy, (length, elev_change)
+        assert time == expected_time, (length, elev_change)
+
+
+def test_order_and_batch_size_do_not_matter(parameters):
+    lengths = np.array([length for length, _ in SEGMENTS])
+    elev_changes = np.array([elev_change for _, elev_change in SEGMENTS])
+    energies, times = process_segments_batch(lengths, elev_changes, parameters)
+
+    order = np.random.default_rng(0).permutation(len(lengths))
+    shuffled_energies, shuffled_times = process_segments_batch(
+        lengths[order], elev_changes[order], parameters
+    )
+    np.testing.assert_array_equal(shuffled_energies, energies[order])
+    np.testing.assert_array_equal(shuffled_times, times[order])
+
+    single_energies, single_times = process_segments_batch(lengths[-1:], elev_changes[-1:], parameters)
+    assert (single_energies[0], single_times[0]) == (energies[-1], times[-1])
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import aev_utils
+from aev_utils import (
+    get_parameters, process_segments_batch, solve_segment_profile, solve_segments_profile
+)
+
+
+@pytest.fixture
+def parameters():
+    return get_parameters()
+
+
+def segments(count=2000, seed=0):
+    # very short segments that brake before reaching any phase's end up to
+    # long ones that cruise, uphill and downhill
+    rng = np.random.default_rng(seed)
+    lengths = np.concatenate([
+        np.exp(rng.uniform(np.log(0.01), np.log(3000), count)), [0, 0.001, 1, 10, 50]
+    ])
+    elev_changes = lengths * np.clip(rng.normal(0, 0.05, len(lengths)), -0.15, 0.15)
+    return lengths, elev_changes
+
+
+def test_matches_the_scalar_solver(parameters):
+    lengths, elev_changes = segments()
+    energies, times = solve_segments_profile(lengths, elev_changes, parameters)
+
+    expected = np.array([
+        solve_segment_profile(length, elev_change, parameters)
+        for length, elev_change in zip(lengths, elev_changes)
+    ])
+    np.testing.assert_allclose(energies, expected[:, 0], rtol=1e-10, atol=1e-9)
+    np.testing.assert_allclose(times, expected[:, 1], rtol=1e-12, atol=1e-12)
+
+
+def test_chunks_give_the_same_totals(parameters, monkeypatch):
+    lengths, elev_changes = segments(500)
+    whole = solve_segments_profile(lengths, elev_changes, parameters)
+    monkeypatch.setattr(aev_utils, "PROFILE_CHUNK_SEGMENTS", 64)
+    chunked = solve_segments_profile(lengths, elev_changes, parameters)
+    np.testing.assert_array_equal(whole, chunked)
+
+
+def test_close_to_the_stepping_simulator(parameters):
+    # route segments of 10 m and up, the 0.1 s steps matter more below that
+    lengths, elev_changes = segments(500)
+    lengths, elev_changes = lengths[lengths >= 10], elev_changes[lengths >= 10]
+    energies, times = solve_segments_profile(lengths, elev_changes, parameters)
+    batch_energies, batch_times = process_segments_batch(lengths, elev_changes, parameters)
+    assert np.sum(energies) == pytest.approx(np.sum(batch_energies), rel=0.01)
+    assert np.sum(times) == pytest.approx(np.sum(batch_times), rel=0.01)
+
+
+def test_empty_route(parameters):
+    energies, times = solve_segments_profile([], [], parameters)
+    assert len(energies) == len(times) == 0
+
+
+def test_drive_phases_are_shared_across_non_kinematic_parameters(parameters):
+    lengths, elev_changes = segments(count=50)
+    aev_utils.drive_phases.cache_clear()
+    energies, times = solve_segments_profile(lengths, elev_changes, parameters)
+    heavier = dict(parameters, mass=parameters["mass"] * 1.5)
+    heavier_energies, heavier_times = solve_segments_profile(lengths, elev_changes, heavier)
+
+    info = aev_utils.drive_phases.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+    # the power still follows the parameters
+    np.testing.assert_array_equal(heavier_times, times)
+    assert heavier_energies.sum() > energies.sum()
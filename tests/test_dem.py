@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from dem import VOID_VALUE, DEMTiles, tile_name
+
+
+SAMPLES = 11  # a small tile, 10 cells a side
+
+
+def write_tile(directory, lat_index, lon_index, grid):
+    grid.astype(">i2").tofile(directory / tile_name(lat_index, lon_index))
+
+
+def plane(offset=0):
+    # elevation rising 2 m per row (southwards) and 3 m per column (eastwards),
+    # bilinear interpolation of a plane is exact
+    rows, cols = np.mgrid[0:SAMPLES, 0:SAMPLES]
+    return offset + 2 * rows + 3 * cols
+
+
+def plane_elevation(lat_fraction, lon_fraction, offset=0):
+    cells = SAMPLES - 1
+    return offset + 2 * (1 - lat_fraction) * cells + 3 * lon_fraction * cells
+
+
+def test_tile_names():
+    assert tile_name(52, -1) == "N52W001.hgt"
+    assert tile_name(-34, 151) == "S34E151.hgt"
+    assert tile_name(0, 0) == "N00E000.hgt"
+
+
+def test_grid_points_and_known_bilinear_values(tmp_path):
+    grid = np.array(
+        [[0, 0, 0], [10, 20, 0], [30, 40, 0]]
+    )
+    write_tile(tmp_path, 52, -1, grid)
+    tiles = DEMTiles(str(tmp_path))
+
+    # a 3 x 3 tile has samples every half degree, row 0 is the north edge
+    elevations = tiles.sample(
+        [52.5, 52.5, 52.0, 52.25, 52.25, 52.375],
+        [-1.0, -0.5, -1.0, -0.75, -1.0, -0.875],
+    )
+    np.testing.assert_allclose(elevations, [
+        10,  # top left sample
+        20,  # one column east
+        30,  # one row south
+        25,  # middle of the cell, average of the four corners
+        20,  # halfway between 10 and 30
+        # a quarter of the way into the cell both ways
+        10 * 0.75 * 0.75 + 20 * 0.75 * 0.25 + 30 * 0.25 * 0.75 + 40 * 0.25 * 0.25,
+    ])
+
+
+def test_plane_is_exact_inside_and_on_edges(tmp_path):
+    write_tile(tmp_path, 52, -1, plane())
+    tiles = DEMTiles(str(tmp_path))
+
+    rng = np.random.default_rng(0)
+    lat_fractions = np.concatenate([rng.uniform(0, 1, 200), [0, 0, 0.999999, 0.999999, 0.5, 0.999999]])
+    lon_fractions = np.concatenate([rng.uniform(0, 1, 200), [0, 0.999999, 0, 0.999999, 0, 0.5]])
+
+    elevations = tiles.sample(52 + lat_fractions, -1 + lon_fractions)
+    np.testing.assert_allclose(elevations, plane_elevation(lat_fractions, lon_fractions))
+
+
+def test_north_and_east_edges_read_the_next_tile(tmp_path):
+    # srtm tiles repeat the samples along their shared edges, a point exactly
+    # on the north or east edge is looked up in the tile it is the corner of
+    south = plane()
+    north = plane(-2 * (SAMPLES - 1))  # its bottom row is the top row of south
+    east = plane(3 * (SAMPLES - 1))  # its left column is the right column of south
+    write_tile(tmp_path, 52, -1, south)
+    write_tile(tmp_path, 53, -1, north)
+    write_tile(tmp_path, 52, 0, east)
+    tiles = DEMTiles(str(tmp_path))
+
+    elevations = tiles.sample([53.0, 52.5, 53.0 - 1e-9], [-0.5, 0.0, -0.5])
+    np.testing.assert_allclose(elevations, [
+        plane_elevation(1, 0.5), plane_elevation(0.5, 1), plane_elevation(1, 0.5)
+    ], atol=1e-6)
+    assert set(tiles.tiles) == {(52, -1), (53, -1), (52, 0)}
+
+
+def test_points_spread_over_tiles_keep_their_order(tmp_path):
+    write_tile(tmp_path, 52, -1, plane())
+    write_tile(tmp_path, 52, 0, plane(1000))
+    write_tile(tmp_path, -34, 151, plane(2000))
+    tiles = DEMTiles(str(tmp_path))
+
+    latitudes = np.array([[52.25, -33.5], [52.5, 52.75]])
+    longitudes = np.array([[0.5, 151.25], [-0.5, 0.125]])
+
+    elevations = tiles.sample(latitudes, longitudes)
+    assert elevations.shape == latitudes.shape
+    np.testing.assert_allclose(elevations, [
+        [plane_elevation(0.25, 0.5, 1000), plane_elevation(0.5, 0.25, 2000)],
+        [plane_elevation(0.5, 0.5), plane_elevation(0.75, 0.125, 1000)],
+    ])
+    assert len(tiles.tiles) == 3
+
+
+def test_void_samples_give_nan_only_around_them(tmp_path):
+    grid = plane()
+    grid[5, 5] = VOID_VALUE
+    write_tile(tmp_path, 52, -1, grid)
+    tiles = DEMTiles(str(tmp_path))
+
+    # row 5, column 5 sits at the middle of the tile
+    elevations = tiles.sample([52.5, 52.45, 52.55, 52.05, 52.95], [-0.5, -0.55, -0.45, -0.95, -0.05])
+    assert np.isnan(elevations[:3]).all()
+    np.testing.assert_allclose(
+        elevations[3:], plane_elevation(np.array([0.05, 0.95]), np.array([0.05, 0.95]))
+    )
+
+
+def test_missing_and_broken_tiles(tmp_path):
+    tiles = DEMTiles(str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        tiles.sample([52.5], [-0.5])
+
+    (tmp_path / tile_name(52, -1)).write_bytes(b"\x00" * 10)
+    with pytest.raises(ValueError):
+        tiles.sample([52.5], [-0.5])
@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aev_utils import convert_mph_ms, get_parameters
+from drive_cycles import (
+    convert_kmh_ms, find_column, load_cycle, process_cycle, process_cycle_file, speed_column_unit
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UDDS = os.path.join(ROOT, "data", "raw", "uddscol.csv")
+
+
+def udds_smoothing(dataframe, parameters, cap_mph=25.0):
+    # the pandas column by column version udds_smoothing.py used to have
+    dataframe = dataframe.copy()
+    time_differences = dataframe['time_s'].diff().fillna(0)
+    dataframe['speed_mph_capped'] = dataframe['speed_mph'].clip(upper=cap_mph)
+    dataframe['speed_ms'] = dataframe['speed_mph_capped'].apply(convert_mph_ms)
+    dataframe['incremental_distance'] = dataframe['speed_ms'] * time_differences
+    dataframe['cumulative_distance'] = dataframe['incremental_distance'].cumsum()
+    dataframe['acceleration_mss'] = (
+        dataframe['speed_ms'].diff().fillna(0) / time_differences
+    )
+    velocity = dataframe['speed_ms']
+    dataframe['power_W'] = (
+        0.6125 * parameters['frontal_area'] * parameters['drag'] * np.power(velocity, 3)
+        + 9.81 * parameters['mass'] * velocity
+        * (parameters['rolling_resistance'] + 0 + 0.107 * dataframe['acceleration_mss'])
+    )
+    dataframe['incremental_energy_J'] = (time_differences * dataframe['power_W']).clip(lower=0)
+    dataframe['cumulative_energy_J'] = dataframe['incremental_energy_J'].cumsum()
+    return dataframe
+
+
+@pytest.fixture
+def parameters():
+    return get_parameters()
+
+
+def test_process_cycle_matches_udds_smoothing(parameters):
+    dataframe = pd.read_csv(UDDS)
+    expected = udds_smoothing(dataframe, parameters)
+
+    columns = process_cycle(
+        dataframe['time_s'].to_numpy(), dataframe['speed_mph'].to_numpy(),
+        parameters, "mph", convert_mph_ms(25)
+    )
+    # the same operations in the same order, so bit for bit the same
+    np.testing.assert_array_equal(columns.pop('speed_capped'), expected['speed_mph_capped'])
+    columns.pop('regen_energy_J')
+    for name, values in columns.items():
+        np.testing.assert_array_equal(values, expected[name], err_msg=name)
+
+    # the first sample has no step before it
+    assert np.isnan(columns['acceleration_mss'][0])
+    assert np.isnan(columns['cumulative_energy_J'][0])
+
+
+def test_process_cycle_file_matches_udds_smoothing(tmp_path, parameters):
+    output_file = tmp_path / "udds_processed.csv"
+    summary = process_cycle_file(
+        UDDS, output_file, parameters, speed_cap=convert_mph_ms(25), name="udds"
+    )
+    expected_file = tmp_path / "expected.csv"
+    expected = udds_smoothing(pd.read_csv(UDDS), parameters)
+    expected.to_csv(expected_file)
+
+    assert output_file.read_bytes() == expected_file.read_bytes()
+
+    assert summary['cycle'] == "udds"
+    assert summary['speed_unit'] == "mph"
+    assert summary['samples'] == len(expected)
+    assert summary['distance_m'] == pytest.approx(expected['incremental_distance'].sum())
+    assert summary['total_energy_J'] == pytest.approx(expected['incremental_energy_J'].sum())
+    assert summary['max_speed_ms'] == pytest.approx(convert_mph_ms(25))
+
+
+@pytest.mark.parametrize("names, columns, expected", [
+    (("time", "sec", "secs", "seconds"), ["Time (s)", "Speed (km/h)"], "Time (s)"),
+    (("time", "sec", "secs", "seconds"), ["speed_mph", "elapsed_sec"], "elapsed_sec"),
+    # a lone t in a name is not a time column
+    (("time", "sec", "secs", "seconds"), ["t_ambient", "speed_mph"], None),
+    # whole words only
+    (("speed", "velocity", "v"), ["speedometer_id", "Vehicle Speed (km/h)"], "Vehicle Speed (km/h)"),
+    (("speed", "velocity", "v"), ["time_s", "v_mps"], "v_mps"),
+    (("speed", "velocity", "v"), ["time_s", "avg"], None),
+])
+def test_find_column(names, columns, expected):
+    assert find_column(columns, names) == expected
+
+
+@pytest.mark.parametrize("column, unit", [
+    ("speed_mph", "mph"),
+    ("Speed (miles/hour)", "mph"),
+    ("Vehicle Speed (km/h)", "kmh"),
+    ("speed_kph", "kmh"),
+    ("v_mps", "ms"),
+    ("speed (m/s)", "ms"),
+    ("speed_ms", "ms"),
+    ("speed", None),
+    ("speed_msec", None),
+])
+def test_speed_column_unit(column, unit):
+    assert speed_column_unit(column) == unit
+
+
+def write_cycle(path, columns):
+    pd.DataFrame(columns).to_csv(path, index=False)
+
+
+def test_load_cycle_detects_units(tmp_path):
+    path = tmp_path / "wltc.csv"
+    write_cycle(path, {" Time (ms) ": [0, 500, 1000], "Vehicle Speed (km/h)": [0, 18, 36]})
+    dataframe, speed_column, speed_unit = load_cycle(path)
+
+    assert speed_column == "Vehicle Speed (km/h)"
+    assert speed_unit == "kmh"
+    # milliseconds are turned into seconds
+    assert list(dataframe.columns) == ['time_s', "Vehicle Speed (km/h)"]
+    assert dataframe['time_s'].tolist() == [0, 0.5, 1.0]
+    assert convert_kmh_ms(36) == 10
+
+
+def test_load_cycle_errors(tmp_path):
+    path = tmp_path / "cycle.csv"
+    write_cycle(path, {"t": [0, 1], "speed_mph": [0, 1]})
+    with pytest.raises(ValueError, match="time"):
+        load_cycle(path)
+
+    write_cycle(path, {"time_s": [0, 1], "speed": [0, 1]})
+    with pytest.raises(ValueError, match="units"):
+        load_cycle(path)
+    # unless the unit is passed in
+    _, _, speed_unit = load_cycle(path, speed_unit="ms")
+    assert speed_unit == "ms"
+    with pytest.raises(ValueError, match="Unknown"):
+        load_cycle(path, speed_unit="knots")
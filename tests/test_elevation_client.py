@@ -0,0 +1,206 @@
+import asyncio
+import math
+import threading
+
+import pytest
+from aiohttp import web
+
+import elevation_client
+from elevation_client import ElevationCache, lookup
+
+
+def fake_elevation(latitude, longitude):
+    return round(100 + 1000 * latitude - 500 * longitude, 3)
+
+
+class StandInServer:
+    # a local elevation api. fail_first makes the first requests answer with
+    # a status, delay holds every request for a while
+    def __init__(self, fail_first=0, fail_status=503, delay=0.0):
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.requests = 0
+        self.batch_sizes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.requests <= self.fail_first:
+                return web.Response(status=self.fail_status)
+            locations = (await request.json())["locations"]
+            self.batch_sizes.append(len(locations))
+            return web.json_response({"results": [
+                {
+                    "latitude": location["latitude"],
+                    "longitude": location["longitude"],
+                    "elevation": fake_elevation(location["latitude"], location["longitude"]),
+                }
+                for location in locations
+            ]})
+        finally:
+            self.in_flight -= 1
+
+    def start(self):
+        # serve from a thread with its own loop, lookup() runs its own asyncio.run
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_post("/lookup", self.handle)
+            self.runner = web.AppRunner(app)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}/lookup"
+            ready.set()
+
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(serve(), self.loop)
+        ready.wait(10)
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def start(**options):
+        servers.append(StandInServer(**options).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ElevationCache(str(tmp_path / "elevations.sqlite"))
+    yield cache
+    cache.close()
+
+
+def grid_points(count):
+    latitudes = [52.0 + 0.0001 * (index % 100) for index in range(count)]
+    longitudes = [-1.0 - 0.0001 * (index // 100) for index in range(count)]
+    return latitudes, longitudes
+
+
+def test_batches_and_values(server_factory, cache):
+    server = server_factory()
+    latitudes, longitudes = grid_points(250)
+
+    elevations = lookup(latitudes, longitudes, server.url, cache, batch_size=100)
+
+    assert server.requests == math.ceil(250 / 100)
+    assert sorted(server.batch_sizes) == [50, 100, 100]
+    assert elevations == [
+        fake_elevation(*cache.coordinate(cache.key(lat, lon)))
+        for lat, lon in zip(latitudes, longitudes)
+    ]
+
+
+def test_repeated_points_and_cache_reuse(server_factory, cache):
+    server = server_factory()
+    latitudes, longitudes = grid_points(150)
+
+    first = lookup(latitudes * 2, longitudes * 2, server.url, cache, batch_size=100)
+    assert server.requests == 2
+
+    # everything is cached now, so no more requests
+    second = lookup(latitudes, longitudes, server.url, cache, batch_size=100)
+    assert server.requests == 2
+    assert second == first[:150]
+
+
+def test_retries_with_backoff(server_factory, cache, monkeypatch):
+    server = server_factory(fail_first=2)
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def record_sleep(seconds):
+        sleeps.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(elevation_client.asyncio, "sleep", record_sleep)
+    latitudes, longitudes = grid_points(10)
+
+    elevations = lookup(latitudes, longitudes, server.url, cache, backoff=0.1, max_retries=3)
+
+    assert server.requests == 3
+    assert len(elevations) == 10
+    # each wait doubles, with up to +-50% jitter
+    assert 0.05 <= sleeps[0] <= 0.15
+    assert 0.1 <= sleeps[1] <= 0.3
+
+
+def test_gives_up_after_max_retries(server_factory, cache):
+    server = server_factory(fail_first=100)
+    latitudes, longitudes = grid_points(10)
+
+    with pytest.raises(Exception):
+        lookup(latitudes, longitudes, server.url, cache, backoff=0.001, max_retries=2)
+    assert server.requests == 3
+
+
+def test_failed_lookup_keeps_finished_batches(server_factory, cache):
+    # one batch at a time, the third request fails for good
+    server = server_factory()
+    latitudes, longitudes = grid_points(500)
+    original = server.handle
+    calls = []
+
+    async def fail_third(request):
+        calls.append(1)
+        if len(calls) == 3:
+            return web.Response(status=400)
+        return await original(request)
+
+    server.handle = fail_third
+    server.stop()
+    server.start()
+
+    with pytest.raises(Exception):
+        lookup(latitudes, longitudes, server.url, cache, batch_size=100, max_concurrency=1)
+
+    finished = cache.get_many(cache.key(lat, lon) for lat, lon in zip(latitudes, longitudes))
+    assert len(finished) == 200
+
+    # the next lookup only asks for the three missing batches
+    server.handle = original
+    server.stop()
+    server.start()
+    server.requests = 0
+    lookup(latitudes, longitudes, server.url, cache, batch_size=100, max_concurrency=1)
+    assert server.requests == 3
+
+
+def test_queued_batches_do_not_time_out(server_factory, cache):
+    # 20 batches through 2 connections take far longer than the read timeout
+    # in total, which is fine as long as each request is quick enough
+    server = server_factory(delay=0.1)
+    latitudes, longitudes = grid_points(200)
+
+    elevations = lookup(
+        latitudes, longitudes, server.url, cache, batch_size=10,
+        max_concurrency=2, max_retries=0, read_timeout=0.5
+    )
+
+    assert len(elevations) == 200
+    assert server.requests == 20
+    assert server.max_in_flight <= 2
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+from aev_utils import get_parameters
+from energy import DETAIL_COLUMNS, run_routes
+from results_store import ResultsStore
+from trace_io import read_trace
+
+
+@pytest.mark.parametrize("detail_format", ["csv", "parquet", "feather", "npz"])
+def test_empty_route_is_stored(tmp_path, detail_format):
+    segments_file = tmp_path / "empty_segments.csv"
+    segments_file.write_text("segment_number,segment_length,segment_elev_change\n")
+    store_dir = str(tmp_path / "store")
+    output_dir = str(tmp_path / "results")
+
+    summaries = run_routes(
+        [str(segments_file)], output_dir, get_parameters(), workers=1,
+        detail_format=detail_format, store_dir=store_dir
+    )
+    assert summaries[0]['segments'] == 0
+    assert summaries[0]['total_energy'] == 0
+
+    detail_file = os.path.join(output_dir, f"empty_detailed.{detail_format}")
+    trace = read_trace(detail_file)
+    assert len(trace) == 0
+    assert list(trace.columns) == DETAIL_COLUMNS
+
+    with ResultsStore(store_dir) as store:
+        runs = store.runs(route="empty")
+        assert len(runs) == 1
+        assert runs['total_energy'][0] == 0
+        stored = store.trace(int(runs['run_id'][0]))
+    assert len(stored) == 0
+    assert list(stored.columns) == DETAIL_COLUMNS
+
+
+def test_route_with_segments_is_stored(tmp_path):
+    segments_file = tmp_path / "short_segments.csv"
+    segments_file.write_text(
+        "segment_number,segment_length,segment_elev_change\n1,50.0,1.0\n2,120.0,-2.0\n"
+    )
+    store_dir = str(tmp_path / "store")
+    output_dir = str(tmp_path / "results")
+
+    summaries = run_routes(
+        [str(segments_file)], output_dir, get_parameters(), workers=1, store_dir=store_dir
+    )
+    detail = pd.read_csv(os.path.join(output_dir, "short_detailed.csv"))
+    assert list(detail.columns) == DETAIL_COLUMNS
+    assert detail['cumulative_energy_J'].iloc[-1] == pytest.approx(summaries[0]['total_energy'])
+
+    with ResultsStore(store_dir) as store:
+        runs = store.runs(route="short")
+        stored = store.trace(int(runs['run_id'][0]))
+    pd.testing.assert_frame_equal(stored, detail, check_dtype=False)
@@ -0,0 +1,65 @@
+import os
+import pstats
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def metrics_file(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    instrumentation.enable(path, profile=True)
+    yield path
+    instrumentation.disable()
+    instrumentation.profile_stages = False
+
+
+def busy():
+    return sum(index * index for index in range(10000))
+
+
+def test_nested_stages_profile_only_the_outermost(metrics_file):
+    with instrumentation.stage("route", route="route_a"):
+        with instrumentation.stage("simulate", route="route_a"):
+            busy()
+        with instrumentation.stage("write", route="route_a"):
+            busy()
+
+    records = {record["stage"]: record for record in instrumentation.load_metrics(metrics_file)}
+    assert records["simulate"]["profile"] is None
+    assert records["write"]["profile"] is None
+    stats = pstats.Stats(records["route"]["profile"])
+    assert any(function[2] == "busy" for function in stats.stats)
+
+
+def test_repeated_stages_write_separate_profiles(metrics_file):
+    for route in ["route_a", "route_b", "route_b"]:
+        with instrumentation.stage("simulate", route=route):
+            busy()
+
+    paths = [record["profile"] for record in instrumentation.load_metrics(metrics_file)]
+    assert len(set(paths)) == 3
+    assert all(os.path.exists(path) for path in paths)
+    assert "route_a" in paths[0] and "route_b" in paths[1]
+    # they add up into one set of stats
+    assert pstats.Stats(*paths).total_calls >= 3 * 10000
+
+
+def profiled_stage(route):
+    with instrumentation.stage("simulate", route=route):
+        busy()
+
+
+def test_forked_workers_profile_their_own_stages(metrics_file):
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    with instrumentation.stage("routes"):
+        with ProcessPoolExecutor(1, mp_context=get_context("fork")) as executor:
+            executor.submit(profiled_stage, "route_a").result()
+
+    records = {record["stage"]: record for record in instrumentation.load_metrics(metrics_file)}
+    assert records["simulate"]["pid"] != records["routes"]["pid"]
+    assert records["simulate"]["profile"] is not None
+    assert records["routes"]["profile"] is not None
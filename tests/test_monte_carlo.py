@@ -0,0 +1,30 @@
+import numpy as np
+
+import monte_carlo
+from aev_utils import get_parameters, process_segments_batch
+from monte_carlo import route_energy_samples, route_kinematics, sample_parameters
+
+
+def test_design_values_match_the_batched_simulator():
+    parameters = get_parameters()
+    rng = np.random.default_rng(0)
+    lengths = rng.uniform(10, 1500, 40)
+    elev_changes = lengths * rng.uniform(-0.06, 0.06, 40)
+
+    kinematics = route_kinematics(lengths, elev_changes, parameters)
+    samples = sample_parameters({}, 3, parameters)
+    energies = route_energy_samples(kinematics, samples)
+
+    batch_energies, _ = process_segments_batch(lengths, elev_changes, parameters)
+    np.testing.assert_allclose(energies, np.sum(batch_energies), rtol=1e-12)
+
+
+def test_trace_cache_is_bounded():
+    cache_info = monte_carlo.flat_segment_trace.cache_info
+    assert cache_info().maxsize == monte_carlo.KINEMATIC_CACHE_SIZE
+
+    parameters = get_parameters()
+    monte_carlo.kinematic_trace(123.0, parameters)
+    dt, velocity, acceleration = monte_carlo.kinematic_trace(123.0, parameters)
+    assert cache_info().hits >= 1
+    assert not velocity.flags.writeable
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from resample import (
+    densify_route, merge_by_grade, resample_route_file, resampled_segments
+)
+from segments import equirectangular_distance, segment_arrays
+
+
+def route(points=400, seed=0):
+    # a wandering route with rolling hills and waypoints a few to a few
+    # hundred metres apart
+    rng = np.random.default_rng(seed)
+    latitudes = 52 + np.cumsum(rng.uniform(0, 5e-4, points))
+    longitudes = -0.75 + np.cumsum(rng.uniform(-5e-4, 5e-4, points))
+    elevations = 100 + 20 * np.sin(np.arange(points) / 15) + rng.normal(0, 0.5, points)
+    return latitudes, longitudes, elevations
+
+
+def chunked(latitudes, longitudes, elevations, size):
+    return [
+        (latitudes[i:i + size], longitudes[i:i + size], elevations[i:i + size])
+        for i in range(0, len(latitudes), size)
+    ]
+
+
+def test_densified_points_are_spaced_along_the_route():
+    latitudes, longitudes, elevations = route()
+    new_latitudes, new_longitudes, _ = densify_route(latitudes, longitudes, elevations, 10.0)
+
+    steps = equirectangular_distance(
+        new_latitudes[:-1], new_longitudes[:-1], new_latitudes[1:], new_longitudes[1:]
+    )
+    # straight between waypoints the spacing is exact, corners cut it short
+    assert np.all(steps <= 10.0 + 1e-6)
+    assert np.median(steps) == pytest.approx(10.0)
+    assert (new_latitudes[-1], new_longitudes[-1]) == (latitudes[-1], longitudes[-1])
+
+
+@pytest.mark.parametrize("chunk_points", [1, 2, 7, 1000])
+def test_file_is_streamed_in_chunks(tmp_path, chunk_points):
+    latitudes, longitudes, elevations = route()
+    input_csv = tmp_path / "route.csv"
+    pd.DataFrame({
+        'latitude': latitudes, 'longitude': longitudes, 'elevation': elevations,
+    }).to_csv(input_csv, index=False)
+
+    output_csv = tmp_path / "resampled.csv"
+    resample_route_file(input_csv, output_csv, 10.0, chunk_points=chunk_points)
+
+    # the distance along the route is summed a chunk at a time, so the points
+    # only match the whole route version to rounding
+    expected = densify_route(latitudes, longitudes, elevations, 10.0)
+    resampled = pd.read_csv(output_csv, float_precision='round_trip')
+    assert len(resampled) == len(expected[0])
+    for column, values in zip(['latitude', 'longitude', 'elevation'], expected):
+        np.testing.assert_allclose(resampled[column], values, rtol=1e-12)
+
+
+def test_grade_runs_are_measured_from_their_start():
+    lengths = np.full(6, 10.0)
+    # each grade only 0.6% from the last, but 1.2% from the start two on
+    grades = np.array([0, 0.006, 0.012, 0.018, -0.05, -0.05])
+    merged_lengths, merged_changes = merge_by_grade(lengths, grades * lengths, 0.01)
+    np.testing.assert_allclose(merged_lengths, [20, 20, 20])
+    np.testing.assert_allclose(merged_changes, [0.06, 0.3, -1.0])
+
+    # either side of a multiple of the limit is still one run
+    grades = np.array([0.009, 0.011])
+    merged_lengths, _ = merge_by_grade(lengths[:2], grades * lengths[:2], 0.01)
+    np.testing.assert_allclose(merged_lengths, [20])
+
+
+def test_zero_length_segments_join_the_open_run():
+    merged_lengths, merged_changes = merge_by_grade([0, 10, 0, 10, 10], [0, 1, 0, 1, 3], 0.05)
+    np.testing.assert_allclose(merged_lengths, [20, 10])
+    np.testing.assert_allclose(merged_changes, [2, 3])
+    assert len(merge_by_grade([], [], 0.01)[0]) == 0
+
+
+@pytest.mark.parametrize("chunk_points", [1, 3, 50, 1000])
+def test_grade_runs_carry_across_chunks(chunk_points):
+    latitudes, longitudes, elevations = route()
+    whole = densify_route(latitudes, longitudes, elevations, 10.0)
+    lengths, elev_changes = segment_arrays(*whole)
+    expected_lengths, expected_changes = merge_by_grade(lengths, elev_changes, 0.02)
+    assert len(expected_lengths) < len(lengths)
+
+    chunks = list(resampled_segments(
+        chunked(latitudes, longitudes, elevations, chunk_points), 10.0, max_grade_change=0.02
+    ))
+    np.testing.assert_allclose(
+        np.concatenate([chunk[0] for chunk in chunks]), expected_lengths, rtol=1e-12
+    )
+    np.testing.assert_allclose(
+        np.concatenate([chunk[1] for chunk in chunks]), expected_changes,
+        rtol=1e-12, atol=1e-9
+    )
+
+
+def test_unmerged_segments_cover_the_whole_route():
+    latitudes, longitudes, elevations = route()
+    chunks = list(resampled_segments(chunked(latitudes, longitudes, elevations, 37), 10.0))
+    lengths = np.concatenate([chunk[0] for chunk in chunks])
+    elev_changes = np.concatenate([chunk[1] for chunk in chunks])
+
+    whole_lengths, whole_changes = segment_arrays(
+        *densify_route(latitudes, longitudes, elevations, 10.0)
+    )
+    np.testing.assert_allclose(lengths, whole_lengths, rtol=1e-9)
+    np.testing.assert_allclose(elev_changes, whole_changes, atol=1e-9)
+    assert elev_changes.sum() == pytest.approx(elevations[-1] - elevations[0])
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import results_store
+from aev_utils import get_parameters
+from results_store import ResultsStore
+from trace_io import read_trace, read_trace_metadata
+
+
+def segments(energy):
+    return {
+        'segment_length': [100.0, 200.0],
+        'segment_elev_change': [1.0, -2.0],
+        'segment_time': [10.0, 20.0],
+        'segment_energy': [energy, 2 * energy],
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultsStore(str(tmp_path / "store")) as store:
+        yield store
+
+
+def test_fixed_parameters_match_within_tolerance(store):
+    parameters = get_parameters()
+    for drag, mass in [(0.1 + 0.2, 1350), (0.3, 1400), (0.5, 1350)]:
+        store.record_run("route_a", {**parameters, "drag": drag, "mass": mass}, segments(mass))
+
+    # 0.1 + 0.2 is not exactly 0.3
+    runs = store.runs("route_a", drag=0.3)
+    assert sorted(runs['mass']) == [1350, 1400]
+
+    comparison = store.compare("mass", "route_a", drag=0.3)
+    assert list(comparison.columns) == ['route', 'method', 'mass', 'energy_per_km', 'run_id']
+    assert list(comparison['mass']) == [1350, 1400]
+
+
+def test_parameter_names_are_not_sql(store):
+    store.record_run("route_a", get_parameters(), segments(1000))
+
+    comparison = store.compare("mass FROM runs; DROP TABLE runs; --", "route_a")
+    assert comparison.empty
+    assert len(store.runs()) == 1
+
+    with pytest.raises(ValueError):
+        store.compare("mass", metric="run_id; DROP TABLE runs")
+
+
+def test_csv_traces_are_converted_in_chunks(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(results_store, "TRACE_CHUNK_ROWS", 7)
+    rng = np.random.default_rng(0)
+    trace = pd.DataFrame({
+        'time_s': np.arange(50) * 0.1,
+        'speed_ms': rng.random(50),
+        'cumulative_energy_J': np.cumsum(rng.random(50)),
+        'segment_id': np.repeat([1, 2], 25),
+    })
+    trace_file = str(tmp_path / "route_a_detailed.csv")
+    trace.to_csv(trace_file, index=False)
+
+    run_id = store.record_run("route_a", get_parameters(), segments(1000), trace_file=trace_file)
+
+    stored = store.trace(run_id)
+    pd.testing.assert_frame_equal(stored, read_trace(trace_file))
+    stored_file = store.runs()['trace_file'][0]
+    assert read_trace_metadata(stored_file)['route'] == "route_a"
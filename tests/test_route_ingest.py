@@ -0,0 +1,157 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from route_ingest import ChunkBuffer, ingest_route, read_route
+
+LATITUDES = [52.0368, 52.0369, 52.0371, 52.0374, 52.0376, 52.0379, 52.0381]
+LONGITUDES = [-0.7488, -0.7485, -0.7481, -0.7478, -0.7474, -0.7470, -0.7467]
+# the third point has no elevation in the file
+ELEVATIONS = [99.0, 99.5, np.nan, 101.25, 102.0, 101.0, 100.5]
+
+
+def write_gpx(path):
+    points = []
+    for latitude, longitude, elevation in zip(LATITUDES, LONGITUDES, ELEVATIONS):
+        ele = "" if np.isnan(elevation) else f"<ele>{elevation}</ele>"
+        points.append(f'<trkpt lat="{latitude}" lon="{longitude}">{ele}<time>x</time></trkpt>')
+    # two segments of one track, the points carry on across them
+    path.write_text(
+        '<?xml version="1.0"?>'
+        '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        '<wpt lat="1" lon="1"><ele>5</ele></wpt>'
+        f'<trk><name>t</name><trkseg>{"".join(points[:3])}</trkseg>'
+        f'<trkseg>{"".join(points[3:])}</trkseg></trk></gpx>'
+    )
+
+
+def write_geojson(path):
+    positions = [
+        [longitude, latitude] if np.isnan(elevation) else [longitude, latitude, elevation]
+        for latitude, longitude, elevation in zip(LATITUDES, LONGITUDES, ELEVATIONS)
+    ]
+    path.write_text(json.dumps({
+        "type": "FeatureCollection",
+        "features": [
+            # a point feature is not part of the route
+            {"type": "Feature", "properties": {}, "geometry": {
+                "type": "Point", "coordinates": [1.0, 1.0]}},
+            {"type": "Feature", "properties": {"name": "route"}, "geometry": {
+                "type": "LineString", "coordinates": positions}},
+        ],
+    }))
+
+
+def write_table(path):
+    frame = pd.DataFrame({
+        'latitude': LATITUDES, 'longitude': LONGITUDES, 'elevation': ELEVATIONS,
+        'time': range(len(LATITUDES)),
+    })
+    if path.suffix == ".parquet":
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+WRITERS = {
+    "route.gpx": write_gpx,
+    "route.geojson": write_geojson,
+    "route.parquet": write_table,
+    "route.csv": write_table,
+}
+
+
+def read_all(path, chunk_points):
+    chunks = list(read_route(str(path), chunk_points))
+    return chunks, tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+@pytest.mark.parametrize("name", WRITERS)
+@pytest.mark.parametrize("chunk_points", [1, 3, 7, 100])
+def test_reads_every_format(tmp_path, name, chunk_points):
+    path = tmp_path / name
+    WRITERS[name](path)
+
+    chunks, (latitudes, longitudes, elevations) = read_all(path, chunk_points)
+    np.testing.assert_array_equal(latitudes, LATITUDES)
+    np.testing.assert_array_equal(longitudes, LONGITUDES)
+    np.testing.assert_array_equal(elevations, ELEVATIONS)
+
+    # full chunks until the last one
+    sizes = [len(chunk[0]) for chunk in chunks]
+    assert all(size == chunk_points for size in sizes[:-1])
+    assert 0 < sizes[-1] <= chunk_points
+
+
+@pytest.mark.parametrize("name", ["route.csv", "route.parquet"])
+def test_tables_without_elevation(tmp_path, name):
+    path = tmp_path / name
+    frame = pd.DataFrame({'latitude': LATITUDES, 'longitude': LONGITUDES})
+    if path.suffix == ".parquet":
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+    _, (latitudes, _, elevations) = read_all(path, 4)
+    np.testing.assert_array_equal(latitudes, LATITUDES)
+    assert np.isnan(elevations).all()
+
+
+def test_bare_geojson_geometry(tmp_path):
+    path = tmp_path / "route.json"
+    path.write_text(json.dumps({
+        "type": "LineString",
+        "coordinates": [[longitude, latitude] for latitude, longitude in zip(LATITUDES, LONGITUDES)],
+    }))
+    _, (latitudes, longitudes, elevations) = read_all(path, 3)
+    np.testing.assert_array_equal(latitudes, LATITUDES)
+    np.testing.assert_array_equal(longitudes, LONGITUDES)
+    assert np.isnan(elevations).all()
+
+
+def test_unsupported_file(tmp_path):
+    with pytest.raises(ValueError):
+        read_route(str(tmp_path / "route.kml"))
+
+
+def test_only_missing_elevations_are_looked_up(tmp_path):
+    path = tmp_path / "route.gpx"
+    write_gpx(path)
+    looked_up = []
+
+    def lookup(latitudes, longitudes):
+        looked_up.append(latitudes.copy())
+        return np.full(len(latitudes), 50.0)
+
+    output_csv = tmp_path / "route_elev.csv"
+    ingest_route(str(path), output_csv, lookup, chunk_points=2)
+
+    assert [len(latitudes) for latitudes in looked_up] == [1]
+    assert looked_up[0][0] == LATITUDES[2]
+    points = pd.read_csv(output_csv, float_precision='round_trip')
+    assert list(points.columns) == ['latitude', 'longitude', 'elevation']
+    np.testing.assert_array_equal(points['latitude'], LATITUDES)
+    np.testing.assert_array_equal(
+        points['elevation'], [50.0 if np.isnan(value) else value for value in ELEVATIONS]
+    )
+
+
+def test_chunk_buffer_boundaries():
+    buffer = ChunkBuffer(3)
+    assert buffer.take()[0].tolist() == []
+
+    # only the third point fills it
+    assert not buffer.add(1, 10, 100)
+    assert not buffer.add(2, 20, np.nan)
+    assert buffer.add(3, 30, 300)
+    latitudes, longitudes, elevations = buffer.take()
+    assert latitudes.tolist() == [1, 2, 3]
+    assert longitudes.tolist() == [10, 20, 30]
+    assert np.isnan(elevations[1])
+
+    # the chunk taken is a copy, reusing the buffer leaves it alone
+    assert not buffer.add(4, 40, 400)
+    assert latitudes.tolist() == [1, 2, 3]
+    assert buffer.take()[0].tolist() == [4]
+    assert buffer.count == 0
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import segment_cache
+from aev_utils import get_parameters, process_segment
+from segment_cache import SegmentCache, simulator_version
+
+
+@pytest.fixture
+def parameters():
+    return get_parameters()
+
+
+def entry_files(cache):
+    return [
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(cache.cache_dir) for name in names
+        if name != segment_cache.VERSION_MARKER
+    ]
+
+
+def test_misses_are_simulated_at_the_exact_values(tmp_path, parameters):
+    cache = SegmentCache(str(tmp_path))
+    _, energy, time = cache.process_segment(123.4567, 1.2345, parameters)
+    _, expected_energy, expected_time = process_segment(123.4567, 1.2345, parameters)
+    assert (energy, time) == (expected_energy, expected_time)
+
+    # a nearby segment shares the entry
+    _, near_energy, _ = cache.process_segment(123.4568, 1.2345, parameters)
+    assert near_energy == energy
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_is_kept_per_simulator_version(tmp_path, parameters):
+    SegmentCache(str(tmp_path)).process_segment(50.0, 0.0, parameters)
+    assert os.listdir(tmp_path) == [simulator_version()]
+
+    cache = SegmentCache(str(tmp_path))
+    cache.process_segment(50.0, 0.0, parameters)
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_prune_drops_old_versions_and_least_recently_used(tmp_path, parameters):
+    stale = tmp_path / "0123456789abcdef"
+    stale.mkdir()
+    (stale / "old.pkl").write_bytes(b"x")
+    (stale / segment_cache.VERSION_MARKER).touch()
+    # not made by a segment cache, so never touched
+    unrelated = tmp_path / "notes"
+    unrelated.mkdir()
+    (unrelated / "keep.txt").write_bytes(b"x")
+
+    cache = SegmentCache(str(tmp_path), max_disk_bytes=0)
+    for length in [10.0, 20.0, 30.0]:
+        cache.process_segment(length, 0.0, parameters)
+    paths = sorted(entry_files(cache))
+    sizes = [os.path.getsize(path) for path in paths]
+    for age, path in zip([3, 2, 1], paths):
+        os.utime(path, (1000 - age, 1000 - age))
+    # reading the 10 m entry again leaves the 20 m one least recently used
+    cache.load(next(iter(cache.memory)))
+
+    cache.max_disk_bytes = sum(sizes) - 1
+    assert cache.prune() == 1
+    assert not stale.exists()
+    assert (unrelated / "keep.txt").exists()
+    left = {os.path.basename(path) for path in entry_files(cache)}
+    assert len(left) == 2
+    assert not any(name.startswith("20000_") for name in left)
+
+
+def test_prune_runs_every_interval(tmp_path, parameters, monkeypatch):
+    monkeypatch.setattr(segment_cache, "PRUNE_INTERVAL", 2)
+    cache = SegmentCache(str(tmp_path), max_disk_bytes=0)
+    cache.process_segment(10.0, 0.0, parameters)
+    cache.process_segment(20.0, 0.0, parameters)
+    assert not entry_files(cache)
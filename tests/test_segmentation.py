@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aev_utils import get_parameters, process_segment
+from extract_segments import STITCHED_COLUMNS, stitch_drive_cycle
+from segment_cache import SegmentCache
+from segmentation import find_runs, stitch_runs
+
+
+def loop_runs(is_stopped):
+    # one sample at a time
+    starts, ends, stopped = [], [], []
+    for index, value in enumerate(is_stopped):
+        if index == 0 or value != is_stopped[index - 1]:
+            starts.append(index)
+            stopped.append(bool(value))
+            if index:
+                ends.append(index)
+    if len(is_stopped):
+        ends.append(len(is_stopped))
+    return starts, ends, stopped
+
+
+@pytest.mark.parametrize("is_stopped", [
+    [],
+    [True],
+    [False],
+    [True, True, True],
+    [False, True],
+    [True, False],
+    # single sample runs at both edges and in the middle
+    [True, False, False, True, False, True, True, False],
+    [False, True, False, True, False],
+])
+def test_find_runs_edges(is_stopped):
+    starts, ends, stopped = find_runs(is_stopped)
+    expected_starts, expected_ends, expected_stopped = loop_runs(is_stopped)
+    assert starts.tolist() == expected_starts
+    assert ends.tolist() == expected_ends
+    assert stopped.tolist() == expected_stopped
+
+
+def test_find_runs_matches_loop():
+    rng = np.random.default_rng(0)
+    # long and single sample runs mixed together
+    is_stopped = np.repeat(rng.random(500) < 0.5, rng.integers(1, 6, 500))
+    starts, ends, stopped = find_runs(is_stopped)
+    expected_starts, expected_ends, expected_stopped = loop_runs(is_stopped.tolist())
+    assert starts.tolist() == expected_starts
+    assert ends.tolist() == expected_ends
+    assert stopped.tolist() == expected_stopped
+    assert np.all(stopped[1:] != stopped[:-1])
+
+
+def cycle(samples=200, seed=0):
+    # a 1 s drive cycle that starts and ends moving, with single sample stops
+    # and single sample moving runs
+    rng = np.random.default_rng(seed)
+    moving = np.repeat(rng.random(samples // 4) < 0.6, rng.integers(1, 8, samples // 4))
+    moving[[0, -1]] = True
+    # a one sample stop, a one sample move and another one sample stop
+    moving[9:14] = [True, False, True, False, True]
+    speed = np.where(moving, rng.uniform(0.5, 12, len(moving)), 0)
+    return {
+        'time_s': np.arange(len(moving), dtype=float),
+        'speed_ms': speed,
+        'incremental_distance': speed * 1.0,
+        'power_W': rng.normal(0, 1000, len(moving)),
+    }
+
+
+def simulate(views):
+    # stand in simulation with as many rows as metres covered, at least one
+    rows = max(int(views['incremental_distance'].sum()), 1)
+    return {
+        'time_s': np.arange(1, rows + 1) * 0.1,
+        'speed_ms': np.full(rows, views['speed_ms'].mean()),
+        'incremental_distance': np.full(rows, views['incremental_distance'].sum() / rows),
+    }
+
+
+def reference_stitch(columns, simulate_moving, output_columns):
+    # the dataframe concatenation stitch_runs replaced
+    frame = pd.DataFrame(columns)
+    starts, ends, stopped = find_runs(frame['speed_ms'].to_numpy() == 0)
+    pieces = []
+    time_offset = 0
+    for run_number, (start, end, run_stopped) in enumerate(zip(starts, ends, stopped), start=1):
+        run = frame.iloc[start:end].reset_index(drop=True)
+        if run_stopped:
+            run['time_s'] -= run['time_s'].iloc[0]
+        else:
+            run = pd.DataFrame(simulate_moving({name: run[name].to_numpy() for name in run}))
+        run['time_s'] += time_offset
+        time_offset = run['time_s'].iloc[-1] + 1
+        run['segment_number'] = run_number
+        pieces.append(run)
+    stitched = pd.concat(pieces, ignore_index=True).reindex(columns=output_columns)
+    stitched['cumulative_distance'] = stitched['incremental_distance'].cumsum()
+    return stitched
+
+
+@pytest.mark.parametrize("capacity", [None, 1, 3, 100000])
+def test_stitch_runs_matches_concatenation(capacity):
+    columns = cycle()
+    output_columns = [
+        'time_s', 'speed_ms', 'incremental_distance', 'cumulative_distance',
+        'power_W', 'segment_number',
+    ]
+    starts, ends, stopped = find_runs(columns['speed_ms'] == 0)
+    stitched = stitch_runs(
+        columns, starts, ends, stopped, simulate, output_columns, capacity=capacity,
+        cumulative_columns={'cumulative_distance': 'incremental_distance'}
+    )
+    expected = reference_stitch(columns, simulate, output_columns)
+
+    # capacities too small for the output take the growth path
+    pd.testing.assert_frame_equal(pd.DataFrame(stitched), expected, check_dtype=False)
+    assert stitched['segment_number'].dtype == np.int64
+    # simulated runs have no power, so it is NaN there
+    assert np.isnan(stitched['power_W']).any()
+
+
+def test_stitch_runs_skips_empty_simulations():
+    columns = {
+        'time_s': np.arange(5, dtype=float),
+        'speed_ms': np.array([0, 3, 3, 0, 0], dtype=float),
+        'incremental_distance': np.array([0, 3, 3, 0, 0], dtype=float),
+    }
+    starts, ends, stopped = find_runs(columns['speed_ms'] == 0)
+    stitched = stitch_runs(
+        columns, starts, ends, stopped, lambda views: {'time_s': np.empty(0)},
+        ['time_s', 'segment_number'], capacity=1
+    )
+    # the moving run left nothing, the stops keep their numbers
+    assert stitched['segment_number'].tolist() == [1, 3, 3]
+    assert stitched['time_s'].tolist() == [0, 1, 2]
+
+
+def test_stitch_drive_cycle_matches_per_run_simulation():
+    parameters = get_parameters()
+    columns = cycle(120)
+    dataframe = pd.DataFrame(columns)
+    stitched = pd.DataFrame(
+        stitch_drive_cycle(dataframe, parameters, SegmentCache(cache_dir=None)),
+        columns=STITCHED_COLUMNS,
+    )
+
+    # what extract_segments used to do: process_segment each moving run
+    def simulate_exactly(views):
+        trace, _, _ = process_segment(views['incremental_distance'].sum(), 0, parameters)
+        return {name: trace[name].to_numpy() for name in trace}
+
+    expected = reference_stitch(columns, simulate_exactly, STITCHED_COLUMNS)
+    expected['cumulative_energy'] = expected['incremental_energy_J'].cumsum()
+
+    pd.testing.assert_frame_equal(stitched, expected, check_dtype=False)
+    starts, _, stopped = find_runs(columns['speed_ms'] == 0)
+    assert stitched['segment_number'].max() == len(starts)
+    assert not stopped[0] and not stopped[-1]
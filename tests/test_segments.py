@@ -0,0 +1,120 @@
+import csv
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from segments import (
+    build_segments, coords_to_distance, haversine_distance, segment_arrays, vincenty_distance
+)
+
+FIELDNAMES = [
+    'segment_number',
+    'start_latitude', 'start_longitude', 'start_elevation',
+    'end_latitude', 'end_longitude', 'end_elevation',
+    'segment_length', 'segment_elev_change'
+]
+
+
+def points(count=500, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(-80, 80, count)
+    longitudes = rng.uniform(-180, 180, count)
+    elevations = rng.uniform(-10, 900, count).round(1)
+    return latitudes, longitudes, elevations
+
+
+def loop_segments(input_csv, output_csv):
+    # the point by point version build_segments replaced
+    with open(input_csv, newline='') as csvfile:
+        rows = [
+            {name: float(row[name]) for name in ['latitude', 'longitude', 'elevation']}
+            for row in csv.DictReader(csvfile)
+        ]
+    with open(output_csv, mode='w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for i, (start, end) in enumerate(zip(rows[:-1], rows[1:])):
+            writer.writerow({
+                'segment_number': i + 1,
+                'start_latitude': start['latitude'],
+                'start_longitude': start['longitude'],
+                'start_elevation': start['elevation'],
+                'end_latitude': end['latitude'],
+                'end_longitude': end['longitude'],
+                'end_elevation': end['elevation'],
+                'segment_length': coords_to_distance(
+                    start['latitude'], start['longitude'], end['latitude'], end['longitude']
+                ),
+                'segment_elev_change': end['elevation'] - start['elevation'],
+            })
+
+
+def test_equirectangular_matches_the_loop():
+    latitudes, longitudes, elevations = points()
+    lengths, elev_changes = segment_arrays(latitudes, longitudes, elevations)
+
+    expected = [
+        coords_to_distance(latitudes[i], longitudes[i], latitudes[i + 1], longitudes[i + 1])
+        for i in range(len(latitudes) - 1)
+    ]
+    np.testing.assert_array_equal(lengths, expected)
+    np.testing.assert_array_equal(elev_changes, np.diff(elevations))
+
+
+def test_segments_file_matches_the_loop(tmp_path):
+    latitudes, longitudes, elevations = points()
+    input_csv = tmp_path / "route_elev.csv"
+    pd.DataFrame({
+        'latitude': latitudes, 'longitude': longitudes, 'elevation': elevations,
+    }).to_csv(input_csv, index=False)
+
+    build_segments(input_csv, tmp_path / "vectorised.csv")
+    loop_segments(input_csv, tmp_path / "loop.csv")
+    assert (tmp_path / "vectorised.csv").read_bytes() == (tmp_path / "loop.csv").read_bytes()
+
+
+@pytest.mark.parametrize("lat1, lon1, lat2, lon2, expected", [
+    # one degree along the equator and a quarter meridian on the WGS84 ellipsoid
+    (0, 0, 0, 1, 111319.49079327357),
+    (0, 0, 90, 0, 10001965.729),
+    # vincenty's own test line, Flinders Peak to Buninyong
+    (-37.95103342, 144.42486789, -37.65282114, 143.92649554, 54972.271),
+])
+def test_vincenty_known_distances(lat1, lon1, lat2, lon2, expected):
+    distance = vincenty_distance(np.array([lat1]), np.array([lon1]), np.array([lat2]), np.array([lon2]))
+    assert distance[0] == pytest.approx(expected, abs=1e-3)
+
+
+@pytest.mark.parametrize("lat1, lon1, lat2, lon2, expected", [
+    # arcs of the 6371 km sphere
+    (0, 0, 0, 1, 6371000 * np.pi / 180),
+    (0, 0, 90, 0, 6371000 * np.pi / 2),
+    (0, 0, 0, 180, 6371000 * np.pi),
+    (51.5, -0.1, 51.5, -0.1, 0),
+])
+def test_haversine_known_distances(lat1, lon1, lat2, lon2, expected):
+    assert haversine_distance(lat1, lon1, lat2, lon2) == pytest.approx(expected, abs=1e-6)
+
+
+def test_vincenty_falls_back_to_haversine_when_nearly_antipodal():
+    lat1 = np.array([0.0, 51.5, 0.0])
+    lon1 = np.array([0.0, -0.1, 0.0])
+    lat2 = np.array([0.5, 51.5, 0.0])
+    lon2 = np.array([179.5, -0.1, 1.0])
+    distances = vincenty_distance(lat1, lon1, lat2, lon2, max_iterations=50)
+
+    # the first pair never converges, the others are unaffected by it
+    assert distances[0] == haversine_distance(lat1, lon1, lat2, lon2)[0]
+    assert distances[1] == 0
+    assert distances[2] == pytest.approx(111319.49079327357, abs=1e-3)
+
+
+def test_slope_distance_and_methods():
+    latitudes, longitudes, elevations = points(50)
+    flat, elev_changes = segment_arrays(latitudes, longitudes, elevations, "haversine")
+    sloped, _ = segment_arrays(latitudes, longitudes, elevations, "haversine", slope_distance=True)
+    np.testing.assert_allclose(sloped, np.hypot(flat, elev_changes))
+
+    with pytest.raises(ValueError):
+        segment_arrays(latitudes, longitudes, elevations, "manhattan")
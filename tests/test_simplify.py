@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from aev_utils import get_parameters, process_segment
+from segments import segment_arrays
+from simplify import (
+    energy_error, local_metres, point_segment_distance, simplify_route, split_grade_error
+)
+
+
+def route(points=300, seed=0):
+    # a winding, hilly route with waypoints 10 to 60 m apart
+    rng = np.random.default_rng(seed)
+    headings = np.cumsum(rng.normal(0, 0.3, points))
+    steps = rng.uniform(10, 60, points)
+    latitudes = 52 + np.cumsum(steps * np.cos(headings)) / 111195
+    longitudes = -0.75 + np.cumsum(steps * np.sin(headings)) / (111195 * np.cos(np.radians(52)))
+    elevations = 100 + np.cumsum(rng.normal(0, 1.5, points))
+    return latitudes, longitudes, elevations
+
+
+def recursive_rdp(latitudes, longitudes, elevations, horizontal_tolerance, grade_tolerance):
+    # the textbook recursive version, one leg at a time
+    x, y = local_metres(latitudes, longitudes)
+    along = np.concatenate([[0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+    keep = np.zeros(len(latitudes), dtype=bool)
+    keep[[0, -1]] = True
+
+    def split(start, end):
+        if end - start < 2:
+            return
+        inner = np.arange(start + 1, end)
+        error = point_segment_distance(
+            x[inner], y[inner], x[start], y[start], x[end], y[end]
+        ) / horizontal_tolerance
+        if grade_tolerance is not None:
+            error = np.maximum(error, split_grade_error(
+                along[start], elevations[start], along[inner], elevations[inner],
+                along[end], elevations[end]
+            ) / grade_tolerance)
+        worst = int(np.argmax(error))
+        if error[worst] > 1:
+            keep[inner[worst]] = True
+            split(start, inner[worst])
+            split(inner[worst], end)
+
+    split(0, len(latitudes) - 1)
+    return keep
+
+
+@pytest.mark.parametrize("horizontal_tolerance", [1.0, 5.0, 25.0])
+@pytest.mark.parametrize("grade_tolerance", [None, 0.01, 0.05])
+def test_matches_recursive_rdp(horizontal_tolerance, grade_tolerance):
+    latitudes, longitudes, elevations = route()
+    keep = simplify_route(latitudes, longitudes, elevations, horizontal_tolerance, grade_tolerance)
+    expected = recursive_rdp(
+        latitudes, longitudes, elevations, horizontal_tolerance, grade_tolerance
+    )
+    np.testing.assert_array_equal(keep, expected)
+    assert 2 <= keep.sum() < len(keep)
+
+
+def test_grade_tolerance_keeps_more_points():
+    latitudes, longitudes, elevations = route()
+    flat_only = simplify_route(latitudes, longitudes, elevations, 5.0)
+    with_grade = simplify_route(latitudes, longitudes, elevations, 5.0, 0.01)
+    # the grade can pick other split points, so only the count is compared
+    assert with_grade.sum() > flat_only.sum()
+
+
+def test_straight_level_route_keeps_only_its_ends():
+    latitudes = np.linspace(52, 52.01, 20)
+    longitudes = np.full(20, -0.75)
+    keep = simplify_route(latitudes, longitudes, np.full(20, 100.0), 1.0, 0.01)
+    assert keep.tolist() == [True] + [False] * 18 + [True]
+    assert simplify_route([], [], []).tolist() == []
+
+
+def test_energy_error_compares_full_and_simplified():
+    latitudes, longitudes, elevations = route(60)
+    parameters = get_parameters()
+
+    keep_all = np.ones(len(latitudes), dtype=bool)
+    report = energy_error(latitudes, longitudes, elevations, keep_all, parameters)
+    assert report["full_segments"] == report["simplified_segments"] == len(latitudes) - 1
+    assert report["energy_difference"] == 0
+    assert report["relative_energy_difference"] == 0
+
+    ends_only = np.zeros(len(latitudes), dtype=bool)
+    ends_only[[0, -1]] = True
+    report = energy_error(latitudes, longitudes, elevations, ends_only, parameters)
+    lengths, elev_changes = segment_arrays(latitudes, longitudes, elevations)
+    full_energy = sum(
+        process_segment(length, elev_change, parameters)[1]
+        for length, elev_change in zip(lengths, elev_changes)
+    )
+    (length,), (elev_change,) = segment_arrays(
+        latitudes[[0, -1]], longitudes[[0, -1]], elevations[[0, -1]]
+    )
+    _, simple_energy, simple_time = process_segment(length, elev_change, parameters)
+
+    assert report["simplified_segments"] == 1
+    assert report["full_energy"] == pytest.approx(full_energy, rel=1e-12)
+    assert report["simplified_energy"] == pytest.approx(simple_energy, rel=1e-12)
+    assert report["simplified_time"] == pytest.approx(simple_time, rel=1e-12)
+    assert report["energy_difference"] == pytest.approx(simple_energy - full_energy, rel=1e-9)
+    # one stop instead of dozens
+    assert report["relative_energy_difference"] < 0
+
+
+def test_energy_error_closed_form_is_close_to_batched():
+    latitudes, longitudes, elevations = route(60)
+    parameters = get_parameters()
+    keep = simplify_route(latitudes, longitudes, elevations, 5.0, 0.02)
+    batched = energy_error(latitudes, longitudes, elevations, keep, parameters)
+    closed_form = energy_error(
+        latitudes, longitudes, elevations, keep, parameters, summary_method="closed_form"
+    )
+    assert closed_form["full_segments"] == batched["full_segments"]
+    assert closed_form["full_energy"] == pytest.approx(batched["full_energy"], rel=0.02)
+    assert closed_form["simplified_energy"] == pytest.approx(batched["simplified_energy"], rel=0.02)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from aev_utils import (
+    StoppingDistanceTable, calculate_stopping_distance, get_parameters, stopping_table
+)
+
+
+@pytest.fixture
+def parameters():
+    return get_parameters()
+
+
+def states(table, count=60, seed=0):
+    # velocities and accelerations across the whole grid, with some grid
+    # points and the edges of the range themselves included
+    rng = np.random.default_rng(seed)
+    velocities = np.concatenate([
+        rng.uniform(0, table.max_velocity, count), table.velocities[::16],
+        [0, table.max_velocity],
+    ])
+    accelerations = np.concatenate([
+        rng.uniform(-table.max_accel, table.max_accel, count), table.accelerations[::16],
+        [-table.max_accel, table.max_accel],
+    ])
+    return np.meshgrid(velocities, accelerations)
+
+
+def test_brakes_matches_the_formula(parameters):
+    table = StoppingDistanceTable(parameters)
+    velocities, accelerations = states(table)
+    for velocity, current_accel in zip(velocities.ravel(), accelerations.ravel()):
+        distance = calculate_stopping_distance(
+            velocity, current_accel, table.max_accel, table.max_jerk
+        )
+        # either side of the stopping distance and right on it, plus far away
+        # and just inside the envelope where the screen decides on its own
+        envelope = table.envelope_list[int(velocity * table.velocity_scale) + 1]
+        for distance_remaining in [
+            distance, np.nextafter(distance, np.inf), np.nextafter(distance, -np.inf),
+            distance * 1.01, distance * 0.99, envelope, envelope * 1.001, 1e6, 0,
+        ]:
+            assert table.brakes(distance_remaining, velocity, current_accel) == (
+                distance_remaining <= distance
+            )
+
+
+def test_brakes_outside_the_grid_uses_the_formula(parameters):
+    table = StoppingDistanceTable(parameters)
+    for velocity, current_accel in [(table.max_velocity * 1.5, 0), (5, table.max_accel * 2)]:
+        distance = calculate_stopping_distance(
+            velocity, current_accel, table.max_accel, table.max_jerk
+        )
+        assert table.brakes(distance, velocity, current_accel)
+        assert not table.brakes(np.nextafter(distance, np.inf), velocity, current_accel)
+
+
+def test_lookup_is_within_the_error_bound(parameters):
+    table = StoppingDistanceTable(parameters)
+    rng = np.random.default_rng(1)
+    velocities = rng.uniform(0, table.max_velocity, 200000)
+    accelerations = rng.uniform(-table.max_accel, table.max_accel, 200000)
+    # the middle of the cells is where interpolation is furthest out
+    middles = (table.velocities[:-1] + table.velocities[1:]) / 2
+    accel_middles = (table.accelerations[:-1] + table.accelerations[1:]) / 2
+    middle_velocities, middle_accelerations = np.meshgrid(middles, accel_middles)
+    velocities = np.concatenate([velocities, middle_velocities.ravel()])
+    accelerations = np.concatenate([accelerations, middle_accelerations.ravel()])
+
+    expected = np.array([
+        calculate_stopping_distance(velocity, current_accel, table.max_accel, table.max_jerk)
+        for velocity, current_accel in zip(velocities, accelerations)
+    ])
+    errors = np.abs(table.lookup(velocities, accelerations) - expected)
+    assert errors.max() <= table.error_bound
+    assert table.lookup(0, 0.5) == 0
+
+
+def test_tables_are_shared_across_non_braking_parameters(parameters):
+    heavier = dict(parameters, mass=parameters["mass"] * 2, drag=0.7)
+    assert stopping_table(heavier) is stopping_table(parameters)
+    quicker = dict(parameters, max_jerk=parameters["max_jerk"] * 2)
+    assert stopping_table(quicker) is not stopping_table(parameters)
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+import pytest
+
+import results_store
+from results_store import ResultsStore
+from sweep import run_sweep
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = [os.path.join(ROOT, "data", "segments", "route_a_segments.csv")]
+GRID = {"mass": [1200, 1350], "drag": [0.4, 0.5]}
+
+
+def test_rows_are_checkpointed_before_they_are_stored(tmp_path, monkeypatch):
+    output_file = str(tmp_path / "sweep.csv")
+    store_dir = str(tmp_path / "store")
+
+    def killed(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(results_store.ResultsStore, "record_run", killed)
+    with pytest.raises(KeyboardInterrupt):
+        run_sweep(GRID, ROUTES, output_file, workers=1, store_dir=store_dir)
+    monkeypatch.undo()
+
+    # every job had finished and was written before the store was touched
+    assert len(pd.read_csv(output_file)) == 4
+
+    # so running the sweep again does not write them again, but does record
+    # the ones the store never got
+    run_sweep(GRID, ROUTES, output_file, workers=1, store_dir=store_dir)
+    assert len(pd.read_csv(output_file)) == 4
+    with ResultsStore(store_dir) as store:
+        runs = store.runs()
+    assert len(runs) == 4
+    assert sorted(zip(runs['mass'], runs['drag'])) == [
+        (1200, 0.4), (1200, 0.5), (1350, 0.4), (1350, 0.5)
+    ]
+
+
+def test_resume_records_only_the_jobs_the_store_is_missing(tmp_path, monkeypatch):
+    output_file = str(tmp_path / "sweep.csv")
+    store_dir = str(tmp_path / "store")
+    record_run = results_store.ResultsStore.record_run
+    recorded = []
+
+    def killed_after_one(self, *args, **kwargs):
+        if recorded:
+            raise KeyboardInterrupt
+        recorded.append(record_run(self, *args, **kwargs))
+
+    monkeypatch.setattr(results_store.ResultsStore, "record_run", killed_after_one)
+    with pytest.raises(KeyboardInterrupt):
+        run_sweep(GRID, ROUTES, output_file, workers=1, store_dir=store_dir)
+    monkeypatch.undo()
+
+    run_sweep(GRID, ROUTES, output_file, workers=1, store_dir=store_dir)
+    with ResultsStore(store_dir) as store:
+        runs = store.runs()
+    assert len(runs) == 4
+    assert len(set(runs['parameters_hash'])) == 4
+    assert len(pd.read_csv(output_file)) == 4
+
+
+def test_a_finished_sweep_is_stored_once(tmp_path):
+    output_file = str(tmp_path / "sweep.csv")
+    store_dir = str(tmp_path / "store")
+
+    run_sweep(GRID, ROUTES, output_file, workers=1, store_dir=store_dir)
+    run_sweep(GRID, ROUTES, output_file, workers=1, store_dir=store_dir)
+
+    assert len(pd.read_csv(output_file)) == 4
+    with ResultsStore(store_dir) as store:
+        runs = store.runs()
+    assert len(runs) == 4
+    assert sorted(zip(runs['mass'], runs['drag'])) == [
+        (1200, 0.4), (1200, 0.5), (1350, 0.4), (1350, 0.5)
+    ]
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aev_utils import get_parameters, process_segment
+from trace_io import (
+    TraceWriter, read_trace, read_trace_metadata, trace_metadata, trace_path, write_trace
+)
+
+CUMULATIVE_COLUMNS = {
+    'cumulative_distance': 'incremental_distance',
+    'cumulative_energy_J': 'incremental_energy_J',
+}
+FORMATS = ["csv", "parquet", "feather", "npz"]
+
+
+def segment_traces():
+    parameters = get_parameters()
+    traces = []
+    for segment_id, (length, elev_change) in enumerate(
+        [(35.0, 0.5), (0.4, 0.0), (120.0, -4.0), (90.0, 2.0)], start=1
+    ):
+        trace, _, _ = process_segment(length, elev_change, parameters)
+        trace['segment_id'] = segment_id
+        traces.append(trace)
+    return traces
+
+
+def whole_route(traces, time_gap=1):
+    # what TraceWriter should give, built in one go: each trace moved on to
+    # start time_gap after the last and the totals summed down the route
+    offset = 0
+    shifted = []
+    for trace in traces:
+        trace = trace.copy()
+        trace['time_s'] += offset
+        offset = trace['time_s'].iloc[-1] + time_gap
+        shifted.append(trace)
+    route = pd.concat(shifted, ignore_index=True)
+    for cumulative, incremental in CUMULATIVE_COLUMNS.items():
+        route[cumulative] = np.cumsum(route[incremental].to_numpy())
+    return route
+
+
+def assert_same_trace(written, expected):
+    if written.endswith(".csv"):
+        with open(written, 'rb') as infile, open(expected, 'rb') as expected_file:
+            assert infile.read() == expected_file.read()
+        return
+    pd.testing.assert_frame_equal(read_trace(written), read_trace(expected))
+    assert read_trace_metadata(written) == read_trace_metadata(expected)
+
+
+@pytest.mark.parametrize("detail_format", FORMATS)
+def test_segments_written_one_at_a_time_match_the_whole_route(tmp_path, detail_format):
+    traces = segment_traces()
+    metadata = trace_metadata(get_parameters(), "route_t")
+
+    expected = trace_path(str(tmp_path / "expected"), detail_format)
+    write_trace(whole_route(traces), expected, metadata)
+
+    written = trace_path(str(tmp_path / "written"), detail_format)
+    with TraceWriter(written, metadata, cumulative_columns=CUMULATIVE_COLUMNS) as writer:
+        for trace in traces:
+            writer.write(trace.copy())
+    assert_same_trace(written, expected)
+
+
+@pytest.mark.parametrize("detail_format", FORMATS)
+@pytest.mark.parametrize("chunk_rows", [2, 7, 250, 100000])
+def test_any_chunk_size_matches_one_write(tmp_path, detail_format, chunk_rows):
+    route = whole_route(segment_traces())
+    metadata = trace_metadata(get_parameters(), "route_t")
+
+    expected = trace_path(str(tmp_path / "expected"), detail_format)
+    write_trace(route, expected, metadata)
+
+    # the route is already on one time line, the writer only redoes the totals
+    written = trace_path(str(tmp_path / "written"), detail_format)
+    with TraceWriter(
+        written, metadata, time_column=None, cumulative_columns=CUMULATIVE_COLUMNS
+    ) as writer:
+        for start in range(0, len(route), chunk_rows):
+            writer.write(route.iloc[start:start + chunk_rows].copy())
+    assert_same_trace(written, expected)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 100000])
+def test_csv_index_runs_on_across_chunks(tmp_path, chunk_rows):
+    route = whole_route(segment_traces())
+    expected = str(tmp_path / "expected.csv")
+    write_trace(route, expected, index=True)
+
+    written = str(tmp_path / "written.csv")
+    with TraceWriter(written, time_column=None, index=True) as writer:
+        for start in range(0, len(route), chunk_rows):
+            writer.write(route.iloc[start:start + chunk_rows].copy())
+    assert_same_trace(written, expected)
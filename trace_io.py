@@ -0,0 +1,324 @@
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from aev_utils import TIMESTEP
+
+# file extension for each detailed trace format
+TRACE_EXTENSIONS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "npz": ".npz",
+}
+
+# dtypes the binary formats are written with, any other column keeps its own
+TRACE_DTYPES = {
+    "time_s": "float64",
+    "speed_ms": "float64",
+    "speed_mph": "float64",
+    "incremental_distance": "float64",
+    "cumulative_distance": "float64",
+    "acceleration_mss": "float64",
+    "power_W": "float64",
+    "incremental_energy_J": "float64",
+    "cumulative_energy_J": "float64",
+    "cumulative_energy": "float64",
+    "segment_id": "int64",
+    "segment_number": "int64",
+}
+
+# key the metadata is stored under in parquet and feather files and in npz archives
+METADATA_KEY = "aev_trace"
+
+
+def trace_metadata(parameters, route=None, timestep=TIMESTEP, **extra):
+    # what a trace was simulated with, stored alongside the columns
+    metadata = {
+        "route": route,
+        "timestep": timestep,
+        "parameters": parameters,
+    }
+    metadata.update(extra)
+    return metadata
+
+
+def trace_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    for detail_format, format_extension in TRACE_EXTENSIONS.items():
+        if extension == format_extension:
+            return detail_format
+    raise ValueError(f"Unsupported trace file type: {path}")
+
+
+def trace_path(path, detail_format):
+    # the same file name with the extension for detail_format
+    if detail_format not in TRACE_EXTENSIONS:
+        raise ValueError(f"Unknown trace format: {detail_format}")
+    return os.path.splitext(path)[0] + TRACE_EXTENSIONS[detail_format]
+
+
+def write_trace(dataframe, path, metadata=None, index=False):
+    # write a detailed trace in the format given by the file extension.
+    # csv is written exactly as before and has no metadata, the binary formats
+    # store every column with an explicit dtype plus the metadata as json.
+    # feather is written uncompressed so it can be memory mapped when read
+    detail_format = trace_format(path)
+
+    if detail_format == "csv":
+        dataframe.to_csv(path, index=index)
+        return
+
+    dataframe = trace_dtypes(dataframe)
+    metadata_json = json.dumps(metadata or {})
+
+    if detail_format == "npz":
+        # uncompressed so a column can be loaded without reading the others
+        np.savez(
+            path, **{column: dataframe[column].to_numpy() for column in dataframe.columns},
+            **{f"__{METADATA_KEY}__": np.array(metadata_json)}
+        )
+        return
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        METADATA_KEY.encode(): metadata_json.encode(),
+    })
+
+    if detail_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path, compression="uncompressed")
+
+
+class TraceWriter:
+    # append traces to one detailed output file a chunk at a time so only the
+    # chunk being written is ever held in memory. the time offset and running
+    # totals are carried from one chunk to the next: every chunk's time column
+    # is moved on to start after the previous chunk (last time plus
+    # time_gap), and each cumulative column in cumulative_columns, keyed on
+    # the incremental column it sums, carries on from where the last chunk
+    # finished. the sums run in the same order as a cumsum over the whole
+    # trace, so the output is the same as building it all and writing once.
+    # csv is appended, parquet is written as one row group per chunk, feather
+    # as one record batch per chunk, and npz columns are spilled to temporary
+    # files and copied into the archive on close. if nothing at all is written
+    # close() still leaves an empty trace behind, with columns if given
+
+    def __init__(
+        self, path, metadata=None, time_column="time_s", time_gap=1,
+        cumulative_columns=None, index=False, columns=None
+    ):
+        self.path = path
+        self.columns = [] if columns is None else list(columns)
+        self.format = trace_format(path)
+        self.metadata = metadata or {}
+        self.time_column = time_column
+        self.time_gap = time_gap
+        self.cumulative_columns = dict(cumulative_columns or {})
+        self.index = index
+
+        self.time_offset = 0
+        self.totals = {column: 0.0 for column in self.cumulative_columns}
+        self.rows = 0
+        self.sink = None
+        self.spill_dir = None
+        self.spill_files = {}
+        self.dtypes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, dataframe):
+        # the chunk is updated in place, then appended to the file
+        if len(dataframe) == 0:
+            return
+
+        if self.time_column is not None:
+            dataframe[self.time_column] += self.time_offset
+            self.time_offset = dataframe[self.time_column].iloc[-1] + self.time_gap
+
+        for cumulative, incremental in self.cumulative_columns.items():
+            # start from the previous total so the additions happen in the
+            # same order as one cumsum down the whole trace
+            running = np.cumsum(np.concatenate([
+                [self.totals[cumulative]], dataframe[incremental].to_numpy(dtype=float)
+            ]))
+            dataframe[cumulative] = running[1:]
+            self.totals[cumulative] = running[-1]
+
+        if self.format == "csv":
+            self.write_csv(dataframe)
+        elif self.format == "npz":
+            self.write_npz(dataframe)
+        else:
+            self.write_arrow(dataframe)
+        self.rows += len(dataframe)
+
+    def write_csv(self, dataframe):
+        if self.sink is None:
+            self.sink = open(self.path, 'w', newline='')
+            header = True
+        else:
+            header = False
+        # index numbers run on across chunks like they would in one dataframe
+        if self.index:
+            dataframe = dataframe.set_axis(
+                pd.RangeIndex(self.rows, self.rows + len(dataframe))
+            )
+        dataframe.to_csv(self.sink, index=self.index, header=header)
+
+    def write_arrow(self, dataframe):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(trace_dtypes(dataframe), preserve_index=False)
+        if self.sink is None:
+            schema = table.schema.with_metadata({
+                **(table.schema.metadata or {}),
+                METADATA_KEY.encode(): json.dumps(self.metadata).encode(),
+            })
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self.sink = pq.ParquetWriter(self.path, schema)
+            else:
+                self.sink = pa.ipc.new_file(self.path, schema)
+            self.schema = schema
+        table = table.cast(self.schema)
+
+        if self.format == "parquet":
+            self.sink.write_table(table)
+        else:
+            for batch in table.to_batches():
+                self.sink.write_batch(batch)
+
+    def write_npz(self, dataframe):
+        dataframe = trace_dtypes(dataframe)
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(self.path)))
+            for column in dataframe.columns:
+                self.dtypes[column] = dataframe[column].to_numpy().dtype
+                self.spill_files[column] = open(
+                    os.path.join(self.spill_dir, f"{len(self.spill_files)}.bin"), 'wb'
+                )
+        for column, spill_file in self.spill_files.items():
+            spill_file.write(
+                np.ascontiguousarray(dataframe[column].to_numpy(), dtype=self.dtypes[column]).tobytes()
+            )
+
+    def close(self):
+        if self.format == "npz":
+            self.close_npz()
+        elif self.sink is not None:
+            self.sink.close()
+        elif self.rows == 0:
+            # nothing was written, still leave a valid trace behind
+            write_trace(self.empty_trace(), self.path, self.metadata, index=self.index)
+        self.sink = None
+
+    def empty_trace(self):
+        return pd.DataFrame({column: np.array([], dtype=float) for column in self.columns})
+
+    def close_npz(self):
+        if self.spill_dir is None:
+            # nothing was written, still leave a valid archive behind
+            empty = self.empty_trace()
+            np.savez(
+                self.path, **{column: empty[column].to_numpy() for column in empty.columns},
+                **{f"__{METADATA_KEY}__": np.array(json.dumps(self.metadata))}
+            )
+            return
+
+        try:
+            # the same layout np.savez writes, one uncompressed .npy per column
+            with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+                for column, spill_file in self.spill_files.items():
+                    spill_file.close()
+                    header = {
+                        'descr': np.lib.format.dtype_to_descr(self.dtypes[column]),
+                        'fortran_order': False,
+                        'shape': (self.rows,),
+                    }
+                    with archive.open(f"{column}.npy", 'w', force_zip64=True) as member:
+                        np.lib.format.write_array_header_2_0(member, header)
+                        with open(spill_file.name, 'rb') as infile:
+                            shutil.copyfileobj(infile, member)
+                with archive.open(f"__{METADATA_KEY}__.npy", 'w') as member:
+                    np.lib.format.write_array(member, np.array(json.dumps(self.metadata)))
+        finally:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+def trace_dtypes(dataframe):
+    # the trace with the binary formats' explicit dtypes applied
+    return dataframe.astype({
+        column: dtype for column, dtype in TRACE_DTYPES.items()
+        if column in dataframe.columns
+    })
+
+
+def read_trace(path, columns=None):
+    # load a detailed trace, only reading the columns asked for. feather files
+    # are memory mapped, parquet and npz only decode the selected columns
+    detail_format = trace_format(path)
+
+    if detail_format == "csv":
+        dataframe = pd.read_csv(path, usecols=columns, float_precision='round_trip')
+        return dataframe if columns is None else dataframe[list(columns)]
+
+    if detail_format == "npz":
+        with np.load(path) as archive:
+            if columns is None:
+                columns = [
+                    name for name in archive.files if name != f"__{METADATA_KEY}__"
+                ]
+            return pd.DataFrame({column: archive[column] for column in columns})
+
+    if detail_format == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+
+    return table.to_pandas()
+
+
+def read_trace_metadata(path):
+    # the metadata written with a trace, without loading any of its columns.
+    # csv traces have none
+    detail_format = trace_format(path)
+
+    if detail_format == "csv":
+        return {}
+
+    if detail_format == "npz":
+        with np.load(path) as archive:
+            if f"__{METADATA_KEY}__" not in archive.files:
+                return {}
+            return json.loads(str(archive[f"__{METADATA_KEY}__"]))
+
+    import pyarrow as pa
+
+    if detail_format == "parquet":
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path)
+    else:
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+
+    metadata = (schema.metadata or {}).get(METADATA_KEY.encode())
+    return json.loads(metadata) if metadata else {}
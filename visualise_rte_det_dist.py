@@ -1,68 +1,10 @@
-import pandas as pd # type: ignore
-import matplotlib.pyplot as plt # type: ignore
+from plotting import find_routes, render_plot, route_plot
 
-def main():
-    ### BELOW IS FOR ROUTE LEVEL ###
-    
-    route_a = pd.read_csv("data/results/route_a_detailed.csv")
-    route_b = pd.read_csv("data/results/route_b_detailed.csv")
-    route_c = pd.read_csv("data/results/route_c_detailed.csv")
-    output_file = "plots/route/energy_distance_detailed.png"
-
-    plt.figure(figsize=(10,6))
-    plt.plot(route_a['cumulative_distance'] / 1000, route_a['cumulative_energy_J'] / 3600000, label='Route A')
-    plt.plot(route_b['cumulative_distance'] / 1000, route_b['cumulative_energy_J']  / 3600000, label='Route B')
-    plt.plot(route_c['cumulative_distance'] / 1000, route_c['cumulative_energy_J']  / 3600000, label='Route C')
-
-    plt.title('Comparison of three routes using energy used over distance travelled')
-    plt.xlabel('Distance (km)')
-    plt.ylabel('Energy (kWh)')
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=300)
-    plt.close()
-    
-
-    ### BELOW IS FOR LANE LEVEL ###
-
-    '''
-    # Load your stitched simulation data
-    stitched_df = pd.read_csv("data/results/stitched_data.csv")
-
-    # Load UDDS reference data
-    udds_df = pd.read_csv("data/processed/udds_processed.csv")
-
-    output_file = "plots/udds_vs_stitched_speed_time.png"
 
-    # Ensure both have the same column names for plotting
-    # (adjust these names to match your actual CSV headers)
-    # For example: 'cumulative_distance' in meters, 'cumulative_energy' in Joules
-    x_sim = stitched_df['time_s'] / 1000  # convert to km
-    y_sim = stitched_df['speed_ms']
-
-    x_udds = udds_df['time_s'] / 1000
-    y_udds = udds_df['speed_ms']
-
-    # Plot
-    plt.figure(figsize=(10, 6))
-    plt.plot(x_sim, y_sim, label='Simulated Route', linewidth=2)
-    plt.plot(x_udds, y_udds, label='UDDS Reference', linewidth=2, linestyle='--')
-
-    plt.xlabel("Time Elapsed (s)")
-    plt.ylabel("Velocity (m/s)")
-    plt.title("Speed vs Time")
-    plt.legend()
-    plt.grid(True)
-
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=300)
-    plt.close()
-
-    '''
-
-    print(f"Output plot to {output_file}.")
+def main():
+    # energy used over distance for every route, from the detailed traces
+    render_plot(route_plot("energy_distance_detailed", find_routes()))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()